@@ -4,7 +4,7 @@ import uuid
 
 from os.path import join as joinp
 
-import requests
+from bbp_client import transport
 
 from bbp_services.client import get_services
 from bbp_client.oidc.client import BBPOIDCClient
@@ -48,7 +48,7 @@ class Client(object):
     def set_collab_id_by_context(self, context):
         '''lookup collab by context'''
         url = joinp(self._host, 'collab/context/%s/' % context)
-        resp = requests.get(url, headers=self._get_headers())
+        resp = transport.get(url, headers=self._get_headers())
         if resp.status_code != 200:
             raise CollabException('Failed to get collab by context %s, "%s"' %
                                   (resp.status_code, resp.text))
@@ -82,7 +82,7 @@ class Client(object):
     def permissions(self):
         '''return collab permissions for current user'''
         url = joinp(self._host, 'collab/%s/permissions/' % self.collab_id)
-        resp = requests.get(url, headers=self._get_headers())
+        resp = transport.get(url, headers=self._get_headers())
         if resp.status_code != 200:
             raise CollabException('Failed to get collab permissions %s, "%s"' %
                                   (resp.status_code, resp.text))
@@ -99,7 +99,7 @@ class Client(object):
         page_url = '%s?%s=%s' % (url, page_size_arg, page_size)
 
         while True:
-            resp = requests.get(page_url, headers=headers)
+            resp = transport.get(page_url, headers=headers)
             if resp.status_code != 200:
                 raise CollabException('Failed to GET %s %s, "%s"' %
                                       (url, resp.status_code, resp.text))
@@ -156,7 +156,7 @@ class Client(object):
                 'context': prop.get('context', self._get_uuid4()),
                 'order_index': prop.get('order_index', '-1'),
             }
-        resp = requests.post(url, headers=self._get_headers(), data=data)
+        resp = transport.post(url, headers=self._get_headers(), data=data)
         if resp.status_code != 201:
             raise CollabException('Failed to get add_item to collab %s, "%s"' %
                                   (resp.status_code, resp.text))
@@ -165,7 +165,7 @@ class Client(object):
     def get_current_tree(self):
         '''return the current tree in the collab'''
         url = joinp(self._host, 'collab/%d/nav/all/' % self.collab_id)
-        resp = requests.get(url, headers=self._get_headers())
+        resp = transport.get(url, headers=self._get_headers())
         if resp.status_code != 200:
             raise CollabException('Failed to get collab current_tree %s, "%s"' %
                                   (resp.status_code, resp.text))
@@ -5,7 +5,7 @@ import uuid
 
 from os.path import join as joinp
 
-import requests
+from bbp_client import transport
 
 
 L = logging.getLogger(__name__)
@@ -30,7 +30,7 @@ def lookup_extension_by_name(server, oidc, name):
     '''
     headers = get_headers(oidc)
     url = joinp(server, 'extension/')
-    resp = requests.get(url, headers=headers, params={'search': name})
+    resp = transport.get(url, headers=headers, params={'search': name})
     if resp.status_code != 200:
         raise Exception('Failed to get retrieve data %s, "%s"' %
                         (resp.status_code, resp.text))
@@ -63,7 +63,7 @@ class Extension(object):
         url = joinp(self._host, self.BASE_ENDPOINT, context + '/')
         L.debug('Getting data from %s', url)
         headers = get_headers(self._oidc)
-        resp = requests.get(url, headers=headers)
+        resp = transport.get(url, headers=headers)
         if resp.status_code != 200:
             raise Exception('Failed to get extension info for %s, "%s"' %
                             (resp.status_code, resp.text))
@@ -89,7 +89,7 @@ class Extension(object):
 
         url = joinp(self._host, self.BASE_ENDPOINT, context + '/')
         headers = get_headers(self._oidc)
-        resp = requests.put(url, headers=headers, data=data)
+        resp = transport.put(url, headers=headers, data=data)
         if resp.status_code not in (200, 201, ):
             raise Exception('Failed to PUT data %s, "%s"' %
                             (resp.status_code, resp.text))
@@ -108,7 +108,7 @@ class Extension(object):
 
         url = joinp(self._host, self.BASE_ENDPOINT)
         headers = get_headers(self._oidc)
-        resp = requests.post(url, headers=headers, data=data)
+        resp = transport.post(url, headers=headers, data=data)
         if resp.status_code not in (200, 201, ):
             raise Exception('Failed to POST data %s, "%s"' %
                             (resp.status_code, resp.text))
@@ -132,7 +132,7 @@ class Extension(object):
         '''returns the extension details based on a lookup of id'''
         headers = get_headers(oidc)
         url = joinp(server, 'extension/%s/' % _id)
-        resp = requests.get(url, headers=headers)
+        resp = transport.get(url, headers=headers)
         if resp.status_code != 200:
             raise Exception('Failed to get retrieve data %s, "%s"' %
                             (resp.status_code, resp.text))
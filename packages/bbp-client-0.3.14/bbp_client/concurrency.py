@@ -0,0 +1,130 @@
+'''helpers to run blocking service calls on a bounded number of threads'''
+import Queue
+import sys
+import threading
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+
+@contextmanager
+def worker_pool(workers):
+    '''context manager returning a ThreadPool of workers threads
+
+    The pool is terminated on exit, also when the caller stops early
+    '''
+    pool = ThreadPool(workers)
+    try:
+        yield pool
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run_bounded(func, items, workers, max_pending=None):
+    '''apply func to the items on workers threads, yielding the results as they complete
+
+    The items are consumed lazily, in the calling thread, so that at most max_pending
+    of them are waiting to be processed at any time.
+
+    Args:
+        func: called as func(item)
+        items: iterable of the items to process
+        workers(int): number of threads
+        max_pending(int): maximum number of submitted items, defaults to 2 * workers
+
+    Returns:
+        generator of (item, result, exception) tuples, where exception is None if
+        func succeeded
+    '''
+    max_pending = max_pending or 2 * workers
+    done = Queue.Queue()
+
+    def run(item):
+        '''call func and report the outcome'''
+        try:
+            done.put((item, func(item), None))
+        except Exception as e:  # pylint: disable=W0703
+            done.put((item, None, e))
+
+    items = iter(items)
+    exhausted = False
+    pending = 0
+    with worker_pool(workers) as pool:
+        while True:
+            while not exhausted and pending < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pool.apply_async(run, (item, ))
+                pending += 1
+
+            if not pending:
+                break
+            yield done.get()
+            pending -= 1
+
+
+class _Call(object):
+    '''an in-flight call of SingleFlight'''
+    __slots__ = ('done', 'result', 'exc_info')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    '''coalesce concurrent identical calls into a single one
+
+    While a call for a key is in flight, the threads asking for the same key wait
+    for it and get its result (the same object), or its exception, instead of
+    making their own call. Nothing is kept once the call is done: this is not a cache.
+
+    Example:
+        >>> inflight = SingleFlight()
+        >>> inflight.do(('task', task_id), api.GetTaskArg, task_id)
+        >>> inflight.stats()
+        {'calls': 1, 'coalesced': 0}
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        '''return func(*args, **kwargs), shared with the concurrent calls for key'''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        '''return the number of calls made, and of calls which shared another one'''
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced}
@@ -1,18 +1,30 @@
 '''the access module of the document service client'''
 import copy
+import itertools
 import json
 import os
+import Queue
 
 from os.path import join as joinp
 from urllib2 import HTTPError
 
-import requests
+from requests.exceptions import RequestException
 
 from bbp_client import swagger_helpers as sh
+from bbp_client import transport
+from bbp_client.concurrency import worker_pool, run_bounded, SingleFlight
+from bbp_client.oidc.client import TokenRefresher
 from bbp_client.document_service.swagger import swagger, ProjectApi, FolderApi, FileApi, EntityApi
 from bbp_client.document_service.swagger.models import ProjectPostJson, FolderPostJson, \
     FilePostJson, EntityReturn
 from bbp_client.document_service.exceptions import DocException
+from bbp_client.document_service.cache import EntityCache, MissingPaths
+from bbp_client.document_service.records import EntityRecord, compact
+from bbp_client.document_service.streams import (DownloadStream, UploadStream,
+                                                  CompressedUploadStream, RangeFile,
+                                                  file_digest, is_compressible,
+                                                  DEFAULT_CHUNK_SIZE, DEFAULT_BLOCK_SIZE,
+                                                  DEFAULT_CACHE_BLOCKS, DEFAULT_READ_AHEAD)
 from bbp_services.client import get_services
 
 #W0212: the document service standard attributes start with _
@@ -21,6 +33,40 @@ from bbp_services.client import get_services
 import logging
 L = logging.getLogger(__name__)
 
+# the uuid -> entity type and uuid -> location memos are emptied when they grow past this size
+MAX_MEMO_ENTRIES = 1000000
+
+# metadata keys where the deduplicating uploads store the size and digest of the content
+CONTENT_SIZE_KEY = 'contentSize'
+CONTENT_DIGEST_KEY = 'contentDigest'
+
+# uploads smaller than this are not worth compressing
+MIN_COMPRESSED_SIZE = 1024
+
+# seconds a path which does not exist is remembered as missing, by the clients
+# which enable it (see the negative_ttl of DocAccess)
+DEFAULT_NEGATIVE_TTL = 10
+
+# standard attributes given to the copies made by copytree
+COPIED_ATTRIBUTES = ('_contentType', '_description', '_contentUri')
+
+
+def _range_total(content_range):
+    '''the size of the whole content in a Content-Range header, None if it is unknown'''
+    if not content_range or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+class EntityRef(object):
+    '''the uuid and type of an entity, enough to pick the api of a call by id'''
+    __slots__ = ('_uuid', '_entityType')
+
+    def __init__(self, _uuid, _entityType):
+        self._uuid = _uuid
+        self._entityType = _entityType
+
 
 class DocAccess(object):
     '''Access to the doc. server'''
@@ -35,7 +81,9 @@ class DocAccess(object):
                         '_uuid': 'str',
                         }
 
-    def __init__(self, host, oauth_client=None, headers=None):
+    def __init__(self, host, oauth_client=None, headers=None, cache_enabled=False,
+                 cache_options=None, compact_entities=False, compress_uploads=False,
+                 negative_ttl=0):
         service = get_services()['document_service']
         if host in service:
             self.host = service[host]['url']
@@ -45,14 +93,15 @@ class DocAccess(object):
 
         self._api = swagger.ApiClient('api_key', self.host)
 
-        #save the oauth_client in case we need to refresh the token (not implemented yet)
+        #the token of the oauth_client is refreshed before it expires
         self.oauth_client = oauth_client
+        self._token = TokenRefresher(oauth_client) if oauth_client else None
         self.headers = headers or {}
 
-        sh.patch_swagger_callapi(self._api, self._get_headers)
+        sh.patch_swagger_callapi(self._api, self._get_headers, self._token)
 
-        if self.oauth_client:
-            self.headers['Authorization'] = self.oauth_client.get_auth_header()
+        if self._token:
+            self.headers['Authorization'] = self._token.header()
         self.headers['User-Agent'] = 'py_document_service_client'
 
         #api accessors
@@ -64,10 +113,31 @@ class DocAccess(object):
         self._file.update = FileApi.FileApi.update_file
         self._entity = EntityApi.EntityApi(self._api)
 
+        if cache_enabled:
+            self.cache = EntityCache(**(cache_options or {}))
+        else:
+            self.cache = None
+
+        # keep the listed and looked up entities as EntityRecord
+        self.compact_entities = compact_entities
+        # send the text-like uploads gzip compressed
+        self.compress_uploads = compress_uploads
+
+        # uuid -> entity type, which never changes for a given uuid
+        self._entity_types = {}
+        # uuid -> (parent uuid, name), the parent uuid is None for projects
+        self._locations = {}
+
+        # concurrent lookups of the same path share one request
+        self.inflight = SingleFlight()
+
+        # paths which were just looked up and do not exist
+        self.missing = MissingPaths(negative_ttl) if negative_ttl else None
+
     def _get_headers(self):
-        '''return the headers required for the http call'''
-        #TODO, when to do oauth_client refresh?
-        #self.oauth_client.refresh()
+        '''return the headers required for the http call, with a fresh token'''
+        if self._token:
+            self.headers['Authorization'] = self._token.header()
         return self.headers
 
     @staticmethod
@@ -86,35 +156,148 @@ class DocAccess(object):
                 lst.extend(ret.result[1:])
         return lst
 
+    @staticmethod
+    def _iter_pages(operation, args, prefetch=True):
+        '''generator of the pages of entities returned by operation
+
+        Like _get_full_list, but the pages are yielded as they arrive. With prefetch,
+        the next page is requested on a background thread while the caller processes
+        the current one; it is dropped if the caller stops early.
+
+            Args:
+                operation: API operation which returns EntityReturnList
+                args: dict with arguments for operation call
+                prefetch(bool): request the next page in the background
+        '''
+        def fetch(args):
+            '''get a page, without the entity it starts from'''
+            ret = operation(**args)
+            if 'from' in args and ret.result:
+                ret.result = ret.result[1:]
+            return ret
+
+        ret = fetch(dict(args))
+        if not prefetch:
+            while True:
+                yield ret.result
+                if not ret.hasMore or not ret.result:
+                    return  # an empty page has no entity to continue from
+                ret = fetch(dict(args, **{'from': ret.result[-1]._uuid}))
+
+        with worker_pool(1) as pool:
+            while True:
+                pending = None
+                if ret.hasMore and ret.result:
+                    pending = pool.apply_async(
+                        fetch, (dict(args, **{'from': ret.result[-1]._uuid}), ))
+                yield ret.result
+                if pending is None:
+                    return
+                ret = pending.get()
+
     def reset_cache(self):
-        '''hook method to reset the cache'''
-        pass
+        '''reset the cache'''
+        if self.cache:
+            self.cache.reset()
+        if self.missing:
+            self.missing.reset()
+        self._locations.clear()
+
+    def _remember(self, entities):
+        '''record the type and location of the entities, so calls by id do not have to
+        look them up'''
+        if len(self._entity_types) > MAX_MEMO_ENTRIES:
+            self._entity_types.clear()
+        if len(self._locations) > MAX_MEMO_ENTRIES:
+            self._locations.clear()
+        for entity in entities:
+            self._entity_types[entity._uuid] = entity._entityType
+            parent = getattr(entity, '_parent', None)
+            if self.isproject(entity):
+                self._locations[entity._uuid] = (None, entity._name.lstrip('/'))
+            elif parent not in (None, 'None'):
+                self._locations[entity._uuid] = (parent, entity._name)
+
+    def _entity_ref(self, _id):
+        '''return an entity for _id with at least _uuid and _entityType
+
+        The type comes from the memo if the entity has been seen before, otherwise the
+        entity is fetched from the server
+        '''
+        entity_type = self._entity_types.get(_id)
+        if entity_type is None:
+            return self.get_standard_attr_by_id(_id)
+        return EntityRef(_id, entity_type)
 
-    def _add_to_cache(self, base, entities):
-        '''hook method for cache'''
-        pass
+    def _cached_path(self, entity):
+        '''return the path of entity if it is known by the cache, None otherwise'''
+        if self.isroot(entity):
+            return '/'
+        return self.cache.path_of(entity._uuid)
 
-    def _remove_from_cache(self, base):
-        '''hook method for cache'''
-        pass
+    def _add_to_cache(self, base, entities, listing=False):
+        '''cache entities that live in the container base
 
-    def _get_children(self, entity):
-        '''get the contents of a folder/project from the server'''
+        Args:
+            base: the parent entity
+            entities: iterable of the children of base
+            listing(bool): True if entities is the complete content of base
+        '''
+        if not self.cache:
+            return
+
+        if listing:
+            self.cache.put_children(base._uuid, entities)
+        else:
+            self.cache.invalidate_children(base._uuid)
+
+        base_path = self._cached_path(base)
+        if base_path is not None:
+            for entity in entities:
+                self.cache.put(joinp(base_path, entity._name), entity)
+
+    def _remove_from_cache(self, base):
+        '''forget base, everything below it, and the listing of its parent'''
+        self._locations.pop(base._uuid, None)
+        if not self.cache:
+            return
+
+        path = self._cached_path(base)
+        if path is not None:
+            self.cache.invalidate(path)
+        self.cache.invalidate_children(base._uuid)
+        parent = getattr(base, '_parent', None)
+        self.cache.invalidate_children(parent if parent not in (None, 'None') else
+                                       DocAccess.RootEntity.ROOT_SENTINEL)
+
+    def _children_operation(self, entity):
+        '''return the API operation listing the children of entity, and its arguments'''
         if self.isroot(entity):
-            children = DocAccess._get_full_list(self._project.get_all_projects, {})
+            return self._project.get_all_projects, {}
         elif self.isproject(entity):
-            children = DocAccess._get_full_list(self._project.get_entity_children,
-                                                {'uuid': entity._uuid})
+            return self._project.get_entity_children, {'uuid': entity._uuid}
         elif self.isfolder(entity):
-            children = DocAccess._get_full_list(self._folder.get_entity_children,
-                                                {'uuid': entity._uuid})
+            return self._folder.get_entity_children, {'uuid': entity._uuid}
         elif self.isfile(entity):
             raise DocException('file has no children')
         else:
             raise DocException('Received unknown type from server: %s' %
                                entity._entityType)
 
-        self._add_to_cache(entity, children)
+    def _get_children(self, entity):
+        '''get the contents of a folder/project from the server'''
+        if self.cache:
+            children = self.cache.get_children(entity._uuid)
+            if children is not None:
+                return list(children)
+
+        operation, args = self._children_operation(entity)
+        children = DocAccess._get_full_list(operation, args)
+        if self.compact_entities:
+            children = compact(children)
+
+        self._add_to_cache(entity, children, listing=True)
+        self._remember(children)
 
         return children
 
@@ -137,20 +320,54 @@ class DocAccess(object):
         '''
         assert path.startswith('/')
 
-        if path is '/':
+        if path == '/':
             return DocAccess.RootEntity()
 
+        if self.cache:
+            entity = self.cache.get(path)
+            if entity is not None:
+                return entity
+
+        if self.missing:
+            if self.missing.contains(path):
+                return None
+            generation = self.missing.generation
+
+        entity, missing = self.inflight.do(path, self._lookup_entity, path)
+        if missing and self.missing:
+            self.missing.add(path, generation)
+        return entity
+
+    def _created(self, path, subtree=False):
+        '''forget that path (and with subtree, the paths below it) was missing'''
+        if self.missing:
+            self.missing.discard(path, subtree)
+
+    def _lookup_entity(self, path):
+        '''get the entity at path from the server
+
+        Returns:
+            (entity, missing): the entity is None if it could not be found, missing is
+            True only if the server answered that path does not exist
+        '''
         LOOKUP_URI = 'entity/'
         headers = copy.copy(self._get_headers())
 
-        resp = requests.get(joinp(self.host, LOOKUP_URI), headers=headers,
+        resp = transport.get(joinp(self.host, LOOKUP_URI), headers=headers,
                             params={'path': path})
         if 200 != resp.status_code:
-            return None
+            if 404 != resp.status_code:
+                L.warning('Could not look up %s (%s)', path, resp.status_code)
+            return None, 404 == resp.status_code
 
-        response_obj = json.loads(resp.text)
+        response_obj = resp.json()
         entity = self._api.deserialize(response_obj, EntityReturn.EntityReturn)
-        return entity
+        if self.compact_entities:
+            entity = EntityRecord.from_entity(entity)
+        self._remember((entity, ))
+        if self.cache:
+            self.cache.put(path, entity)
+        return entity, False
 
     def _get_parent(self, path):
         '''gets the parent entity of path
@@ -186,6 +403,42 @@ class DocAccess(object):
 
         return [c._name for c in children]
 
+    def iterdir(self, path, page_size=None, prefetch=True):
+        '''generator of the entities in path, fetched page by page
+
+        Only the current page, and the next one if prefetch is True, are held in
+        memory, and the listing stops being fetched when the caller stops iterating
+
+            Args:
+                path: the project/folder to list
+                page_size(int): number of entities per request, the server default if None
+                prefetch(bool): request the next page while the current one is consumed
+        '''
+        entity = self._get_entity_by_path(path)
+        if entity is None:
+            raise OSError('Path does not exist: %s' % path)
+
+        if self.isfile(entity):
+            raise OSError('Not a directory: %s' % path)
+
+        if self.cache:
+            children = self.cache.get_children(entity._uuid)
+            if children is not None:
+                for child in children:
+                    yield child
+                return
+
+        operation, args = self._children_operation(entity)
+        if page_size:
+            args['limit'] = page_size
+        for page in DocAccess._iter_pages(operation, args, prefetch):
+            if self.compact_entities:
+                page = compact(page)
+            self._add_to_cache(entity, page)
+            self._remember(page)
+            for child in page:
+                yield child
+
     def rmdir(self, path, force=False):
         '''rmdir, analagous to os.rmdir'''
         entity = self._get_entity_by_path(path)
@@ -202,6 +455,7 @@ class DocAccess(object):
             self._project.delete_project(entity._uuid)
         elif self.isfolder(entity):
             self._folder.delete_folder(entity._uuid)
+        self._remove_from_cache(entity)
 
     def mkdir(self, path, ignore_error=False):
         '''mkdir, analagous to os.mkdir'''
@@ -225,6 +479,8 @@ class DocAccess(object):
                 return None
             else:
                 raise OSError('directory already exists')
+        finally:
+            self._created(path)
 
         self._add_to_cache(parent, (entity, ))
 
@@ -264,9 +520,9 @@ class DocAccess(object):
 
         name = dst.rsplit('/', 1)[1]
         body._name = name
-        parent = body._parent
 
         del body._createdOn
+        del body._modifiedOn
         del body._uuid
         del body._entityType
         del body._createdBy
@@ -285,9 +541,11 @@ class DocAccess(object):
         else:
             raise DocException('Cannot rename %s' % entity._entityType)
 
-        entity._name = name
         self._remove_from_cache(entity)
-        self._add_to_cache(parent, (entity, ))
+        self._created(dst, subtree=True)
+        entity._name = name
+        if self.cache:
+            self.cache.put(dst, entity)
 
     def remove(self, path):
         '''remove file, analagous to os.remove'''
@@ -301,33 +559,319 @@ class DocAccess(object):
         self._file.delete_file(entity._uuid)
         self._remove_from_cache(entity)
 
-    def walk(self, path='/'):
-        '''walk the filesystem, analagous to os.walk'''
+    def _delete(self, entity):
+        '''delete a file, or an empty folder or project'''
+        if self.isproject(entity):
+            self._project.delete_project(entity._uuid)
+        elif self.isfolder(entity):
+            self._folder.delete_folder(entity._uuid)
+        else:
+            self._file.delete_file(entity._uuid)
+        self._remove_from_cache(entity)
+
+    def rmtree(self, path, workers=1, dry_run=False):
+        '''remove path and everything below it, analagous to shutil.rmtree
+
+        The tree is listed with workers concurrent listings, then the files are deleted
+        with workers concurrent requests, and finally the folders, level by level from
+        the deepest one. A folder whose content could not be entirely deleted is kept.
+
+        Args:
+            path: the file, folder or project to remove
+            workers(int): number of concurrent requests
+            dry_run(bool): only list what would be deleted
+
+        Returns:
+            Tuple of the list of the deleted paths (the ones that would be deleted with
+            dry_run), files first and folders bottom-up, and a dictionary
+            path -> exception of the ones which could not be deleted
+        '''
+        entity = self._get_entity_by_path(path)
+        if entity is None:
+            raise OSError('Path does not exist: %s' % path)
+        if self.isroot(entity):
+            raise OSError('Cannot remove the root')
+
+        files, containers = [], [(path, entity)]
+        if self.iscontainer(entity):
+            for dirpath, dirs, nondirs in self._walk_from(path, entity, workers, False):
+                files.extend((joinp(dirpath, f._name), f) for f in nondirs)
+                containers.extend(DocAccess._subdirs(dirpath, dirs))
+        else:
+            files, containers = [(path, entity)], []
+
+        # deepest first, the children of a folder are always deleted before it
+        containers.sort(key=lambda item: item[0].count('/'), reverse=True)
+        if dry_run:
+            return [p for p, _ in files + containers], {}
+
+        deleted, errors = [], {}
+        entities = dict(files + containers)
+
+        def delete_all(paths):
+            '''delete the entities at paths concurrently'''
+            for item_path, _, error in run_bounded(lambda p: self._delete(entities[p]),
+                                                   paths, workers):
+                if error is None:
+                    deleted.append(item_path)
+                else:
+                    L.debug('Could not delete %s: %s', item_path, error)
+                    errors[item_path] = error
+
+        delete_all([p for p, _ in files])
+
+        for _, level in itertools.groupby(containers, key=lambda item: item[0].count('/')):
+            paths = []
+            for item_path, _ in level:
+                prefix = item_path.rstrip('/') + '/'
+                failed = [p for p in errors if p.startswith(prefix)]
+                if failed:
+                    errors[item_path] = OSError('%d entities below %s could not be deleted' %
+                                                (len(failed), item_path))
+                else:
+                    paths.append(item_path)
+            delete_all(paths)
+
+        return deleted, errors
+
+    @staticmethod
+    def _copied_attributes(entity):
+        '''the standard attributes of entity which are copied by copytree'''
+        attrs = {}
+        for attr in COPIED_ATTRIBUTES:
+            value = getattr(entity, attr, None)
+            if value not in (None, 'None', ''):
+                attrs[attr] = value
+        return attrs
+
+    def _copy_container(self, entity, parent, name):
+        '''create a copy of the folder or project entity called name in parent
+
+        Returns: the entity of the copy
+        '''
+        props = DocAccess._copied_attributes(entity)
+        props.pop('_contentUri', None)
+        props['_name'] = name
+        if self.isroot(parent):
+            body = sh.swagger_create_type(ProjectPostJson.ProjectPostJson, props)
+            return self._project.create_project(body)
+        props['_parent'] = parent._uuid
+        body = sh.swagger_create_type(FolderPostJson.FolderPostJson, props)
+        return self._folder.create_folder(body)
+
+    def _copy_file(self, entity, parent):
+        '''create a copy of the file entity in parent
+
+        External links point at the same _contentUri, the content of the other files
+        is streamed from the server back to it.
+
+        Returns: the entity of the copy
+        '''
+        props = DocAccess._copied_attributes(entity)
+        props.update({'_name': entity._name, '_parent': parent._uuid})
+        body = sh.swagger_create_type(FilePostJson.FilePostJson, props)
+        copy_ = self._file.create_file(body)
+        if '_contentUri' not in props:
+            with UploadStream.from_download(self.open_download(entity._uuid),
+                                            hash_algorithm=None) as stream:
+                self._upload_content(stream, None, None, None, copy_, parent)
+        return copy_
+
+    def copytree(self, src, dst, workers=1, metadata=True):
+        '''copy the folder or project src and everything below it to dst, analagous
+        to shutil.copytree
+
+        The tree is listed with workers concurrent listings, the folders are created
+        level by level, then the files are copied with workers concurrent requests.
+        Nothing goes through the local disk.
+
+        Args:
+            src: the folder or project to copy
+            dst: the path of the copy, which must not exist
+            workers(int): number of concurrent requests
+            metadata(bool): copy the metadata too
+
+        Returns:
+            Tuple of a dictionary src path -> uuid of the copy, and a dictionary
+            src path -> exception of the entities which could not be copied
+        '''
+        entity = self._get_entity_by_path(src)
+        if entity is None:
+            raise OSError('Path does not exist: %s' % src)
+        if not self.iscontainer(entity) or self.isroot(entity):
+            raise OSError('Not a folder or a project: %s' % src)
+        if (dst.rstrip('/') + '/').startswith(src.rstrip('/') + '/'):
+            raise OSError('Cannot copy %s into itself' % src)
+        if self._get_entity_by_path(dst) is not None:
+            raise OSError('Destination already exists: %s' % dst)
+        parent = self._get_parent(dst)
+        if not self.iscontainer(parent) and not self.isroot(parent):
+            raise OSError('Destination parent is a file: %s' % dst)
+
+        folders, files = [], []
+        for dirpath, dirs, nondirs in self._walk_from(src, entity, workers, False):
+            folders.extend(DocAccess._subdirs(dirpath, dirs))
+            files.extend((joinp(dirpath, f._name), f) for f in nondirs)
+        folders.sort(key=lambda item: item[0].count('/'))
+
+        copies, errors = {}, {}
+        copied = {}  # src path -> entity of the copy
+
+        def copy_one(src_entity, func, *args):
+            '''make a copy with func, and copy the metadata'''
+            new = func(*args)
+            if metadata:
+                meta = self._get_metadata(src_entity)
+                if meta:
+                    self._set_metadata(new, meta)
+            return new
+
+        def copy_all(items, func):
+            '''copy the (src path, entity) items concurrently, with func(entity, parent)'''
+            todo = {}
+            for src_path, src_entity in items:
+                parent_copy = copied.get(os.path.dirname(src_path))
+                if parent_copy is None:
+                    errors[src_path] = OSError('The parent of %s could not be copied' %
+                                               src_path)
+                else:
+                    todo[src_path] = (src_entity, parent_copy)
+            for src_path, new, error in run_bounded(
+                    lambda p: copy_one(todo[p][0], func, *todo[p]), todo, workers):
+                if error is None:
+                    copied[src_path] = new
+                    copies[src_path] = new._uuid
+                else:
+                    L.debug('Could not copy %s: %s', src_path, error)
+                    errors[src_path] = error
+
+        root = copy_one(entity, self._copy_container, entity, parent, os.path.basename(dst))
+        self._created(dst, subtree=True)
+        self._add_to_cache(parent, (root, ))
+        copied[src.rstrip('/')] = root
+        copies[src] = root._uuid
+
+        for _, level in itertools.groupby(folders, key=lambda item: item[0].count('/')):
+            copy_all(level, lambda e, p: self._copy_container(e, p, e._name))
+        copy_all(files, self._copy_file)
+
+        return copies, errors
+
+    def walk(self, path='/', workers=1, ordered=False):
+        '''walk the filesystem, analagous to os.walk
+
+        Args:
+            path: the top of the tree to walk
+            workers(int): number of folders listed concurrently, with more than one
+                worker the tree is walked breadth first
+            ordered(bool): when walking concurrently, yield the folders level by level,
+                in the order of the listings, instead of as soon as they are listed
+
+        As with os.walk, removing names from the yielded dirnames prunes the walk
+        '''
         entity = self._get_entity_by_path(path)
         if entity is None:
             raise OSError('Path does not exist: %s' % path)
         if not entity or self.isfile(entity):
             yield []
-        elif self.iscontainer(entity) or self.isroot(entity):
-            dirs, nondirs = [], []
-            children = self._get_children(entity)
-            for entity in children:
-                if self.iscontainer(entity):
-                    dirs.append(entity._name)
-                else:
-                    nondirs.append(entity._name)
-            yield (path, dirs, nondirs)
-            for name in dirs:
-                new_path = joinp(path, name)
-                for x in self.walk(new_path):
-                    yield x
-
-    def download_file(self, src_path, dst_path=None):
+            return
+
+        for dirpath, dirs, files in self._walk_from(path, entity, workers, ordered):
+            dirnames = [d._name for d in dirs]
+            yield (dirpath, dirnames, [f._name for f in files])
+            kept = set(dirnames)
+            dirs[:] = [d for d in dirs if d._name in kept]
+
+    def walk_entities(self, path='/', workers=1, ordered=False):
+        '''same as walk, but yields (dirpath, dir_entities, file_entities)
+
+        Removing entities from the yielded dir_entities prunes the walk
+        '''
+        entity = self._get_entity_by_path(path)
+        if entity is None:
+            raise OSError('Path does not exist: %s' % path)
+        if self.isfile(entity):
+            raise OSError('Not a directory: %s' % path)
+        return self._walk_from(path, entity, workers, ordered)
+
+    def _walk_from(self, path, entity, workers, ordered):
+        '''pick the walk strategy, starting at the container entity living at path'''
+        if workers > 1 and ordered:
+            return self._walk_levels(path, entity, workers)
+        elif workers > 1:
+            return self._walk_concurrent(path, entity, workers)
+        return self._walk_entity(path, entity)
+
+    def _list_entity(self, path, entity):
+        '''list a container and split the children in folders and files
+
+        Returns:
+            (path, dirs, files), where dirs and files are lists of entities
+        '''
+        dirs, nondirs = [], []
+        for child in self._get_children(entity):
+            if self.iscontainer(child):
+                dirs.append(child)
+            else:
+                nondirs.append(child)
+        return path, dirs, nondirs
+
+    @staticmethod
+    def _subdirs(path, dirs):
+        '''(path, entity) of the sub-folders to walk, once the caller had a chance to
+        prune dirs'''
+        return [(joinp(path, d._name), d) for d in dirs]
+
+    def _walk_entity(self, path, entity):
+        '''walk depth first, reusing the already fetched child entities'''
+        step = self._list_entity(path, entity)
+        yield step
+        for sub_path, sub_entity in DocAccess._subdirs(path, step[1]):
+            for x in self._walk_entity(sub_path, sub_entity):
+                yield x
+
+    def _walk_levels(self, path, entity, workers):
+        '''walk breadth first, listing the folders of a level concurrently'''
+        level = [(path, entity)]
+        with worker_pool(workers) as pool:
+            while level:
+                next_level = []
+                for step in pool.imap(lambda item: self._list_entity(*item), level):
+                    yield step
+                    next_level.extend(DocAccess._subdirs(step[0], step[1]))
+                level = next_level
+
+    def _walk_concurrent(self, path, entity, workers):
+        '''walk breadth first, yielding the folders as soon as they are listed'''
+        done = Queue.Queue()
+
+        def list_entity(sub_path, sub_entity):
+            '''list a folder, and report the result or the failure to the walker'''
+            try:
+                done.put((self._list_entity(sub_path, sub_entity), None))
+            except Exception as e:  # pylint: disable=W0703
+                done.put((None, e))
+
+        with worker_pool(workers) as pool:
+            pool.apply_async(list_entity, (path, entity))
+            pending = 1
+            while pending:
+                step, error = done.get()
+                pending -= 1
+                if error is not None:
+                    raise error
+                yield step
+                for item in DocAccess._subdirs(step[0], step[1]):
+                    pool.apply_async(list_entity, item)
+                    pending += 1
+
+    def download_file(self, src_path, dst_path=None, **kwargs):
         '''download a file from the server
 
             Args:
                 path: the path to the file entity
                 dst_path: the path to store the downloaded contents
+                kwargs: the download options of download_file_by_id
 
             Returns:
                 path to the file if dst_path was provided
@@ -336,41 +880,250 @@ class DocAccess(object):
         entity = self._get_entity_by_path(src_path)
         if entity is None:
             raise OSError('Path does not exist: %s' % src_path)
-        return self.download_file_by_id(entity._uuid, dst_path)
+        return self.download_file_by_id(entity._uuid, dst_path, **kwargs)
+
+    def _request_download(self, _id, offset=0, end=None, stream=True):
+        '''start streaming the content of the file _id, from byte offset
+
+            Args:
+                end(int): stop at this byte (excluded), at the end of the content if None
+                stream(bool): stream the content, instead of reading it in the response
+
+            Returns: the response, which must be closed by the caller when streamed
+        '''
+        content_url = joinp(self.host, 'file', _id, 'content/download')
+        headers = copy.copy(self._get_headers())
+        # the byte offsets are those of the stored content, not of a compressed one
+        headers['Accept-Encoding'] = 'identity'
+        if offset or end is not None:
+            headers['Range'] = 'bytes=%d-%s' % (offset, '' if end is None else end - 1)
+
+        resp = transport.get(content_url, headers=headers, stream=stream)
+        if resp.status_code in (200, 206) or ('Range' in headers and 416 == resp.status_code):
+            return resp
+
+        msg = 'Could not download file (%s): %s' % (resp.status_code, resp.text)
+        resp.close()
+        raise DocException(msg)
+
+    def open_download(self, _id, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''open the content of a file for streaming
+
+            Args:
+                id(string): the id of the file entity
+                chunk_size(int): size of the chunks read from the server
+
+            Returns:
+                a binary, read-only file-like object, which also iterates over the chunks
+        '''
+        return DownloadStream(self._request_download(_id), chunk_size)
+
+    def _fetch_range(self, _id, start, end, whole):
+        '''get the bytes start to end (excluded) of the content of the file _id
+
+            Args:
+                whole(list): the whole content is appended to it if the server ignores
+                    the range request, and the next ranges are taken from it
 
-    def download_file_by_id(self, _id, dst_path=None):
+            Returns: (the bytes, the size of the whole content or None if unknown)
+        '''
+        if whole:
+            return whole[0][start:end], len(whole[0])
+        resp = self._request_download(_id, start, end, stream=False)
+        total = _range_total(resp.headers.get('Content-Range'))
+        if 416 == resp.status_code:
+            return b'', total
+        if 206 != resp.status_code:
+            L.debug('server ignored the range request for %s, keeping its content', _id)
+            whole.append(resp.content)
+            return resp.content[start:end], len(resp.content)
+        return resp.content, total
+
+    def open_range(self, _id, block_size=DEFAULT_BLOCK_SIZE, cache_blocks=DEFAULT_CACHE_BLOCKS,
+                   read_ahead=DEFAULT_READ_AHEAD):
+        '''open the content of a file for random access, see RangeFile
+
+            Only the blocks which are read are fetched, with HTTP range requests. If the
+            server ignores them, the whole content, downloaded by the first request, is
+            kept in memory instead
+
+            Args:
+                id(string): the id of the file entity
+                block_size(int): number of bytes fetched at a time
+                cache_blocks(int): number of blocks kept in memory
+                read_ahead(int): number of blocks fetched ahead of sequential reads
+
+            Returns:
+                a binary, read-only and seekable file-like object
+        '''
+        whole = []  # the content, once a range request returned all of it
+        return RangeFile(lambda start, end: self._fetch_range(_id, start, end, whole),
+                         block_size=block_size, cache_blocks=cache_blocks,
+                         read_ahead=read_ahead)
+
+    def open_file(self, path, **range_options):
+        '''open the content of the file at path for random access, see open_range'''
+        entity = self._get_entity_by_path(path)
+        if entity is None:
+            raise OSError('Path does not exist: %s' % path)
+        if not self.isfile(entity):
+            raise OSError('Not a file: %s' % path)
+        return self.open_range(entity._uuid, **range_options)
+
+    def _download_to(self, _id, part_path, offset, chunk_size):
+        '''download the content of _id to part_path, resuming at offset if possible'''
+        resp = self._request_download(_id, offset)
+        try:
+            if 416 == resp.status_code:
+                # nothing left after offset: complete, unless the part is stale
+                if offset == _range_total(resp.headers.get('Content-Range')):
+                    L.debug('%s is already complete', part_path)
+                    return
+                L.debug('%s does not match the content of %s, restarting its download',
+                        part_path, _id)
+                resp.close()
+                resp = self._request_download(_id)
+                offset = 0
+            if offset and 206 != resp.status_code:
+                L.debug('server ignored the range request, restarting download of %s', _id)
+                offset = 0
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in resp.iter_content(chunk_size):
+                    f.write(chunk)
+        finally:
+            resp.close()
+
+    def download_file_by_id(self, _id, dst_path=None, resume=False, retries=0,
+                            checksum=None, checksum_algorithm='md5',
+                            chunk_size=DEFAULT_CHUNK_SIZE):
         '''download a file from the server
 
+            The content is streamed to dst_path.part, which is renamed to dst_path
+            once the download is complete (and verified, if a checksum is given)
+
             Args:
                 id(string): the id of the file entity
                 dst_path: the path to store the downloaded contents
+                resume(bool): continue from an existing dst_path.part file
+                retries(int): how many times to resume if the connection breaks
+                checksum(str): the expected hex digest of the content
+                checksum_algorithm(str): the hashlib algorithm of the checksum
+                chunk_size(int): size of the chunks read from the server
 
             Returns:
                 path to the file if dst_path was provided
                 contents of the file as a string otherwise
         '''
-        content_url = joinp(self.host, 'file', _id, 'content/download')
-        resp = requests.get(content_url, headers=self._get_headers())
-        if 200 != resp.status_code:
-            raise DocException('Could not download file (%s): %s' % (resp.status_code, resp.text))
-
-        if dst_path:
-            CHUNK_SIZE = 10 * 1024
-            with open(dst_path, 'wb') as f:
-                for chunk in resp.iter_content(CHUNK_SIZE):
-                    f.write(chunk)
-            return dst_path
-        else:
+        if not dst_path:
+            content_url = joinp(self.host, 'file', _id, 'content/download')
+            resp = transport.get(content_url, headers=self._get_headers())
+            if 200 != resp.status_code:
+                raise DocException('Could not download file (%s): %s' %
+                                   (resp.status_code, resp.text))
             return resp.text
 
-    def upload_file(self, src, dst, mimetype, st_attr):
-        '''upload a file to the server'''
-        with open(src) as fd:
-            return self._upload_content(fd, dst, mimetype, st_attr)
+        part_path = dst_path + '.part'
+        offset = 0
+        if resume and os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+
+        attempt = 0
+        while True:
+            try:
+                self._download_to(_id, part_path, offset, chunk_size)
+                break
+            except RequestException as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                L.warning('Download of %s interrupted (%s), resuming at byte %d',
+                          _id, e, offset)
+
+        if checksum:
+            digest = file_digest(part_path, checksum_algorithm, chunk_size).hexdigest()
+            if digest != checksum.lower():
+                os.remove(part_path)
+                raise DocException('Checksum mismatch for file %s: expected %s, got %s' %
+                                   (_id, checksum, digest))
+
+        os.rename(part_path, dst_path)
+        return dst_path
+
+    def upload_file(self, src, dst, mimetype, st_attr, use_mmap=False, **stream_options):
+        '''upload a file to the server, streaming it from disk
+
+            Args:
+                use_mmap(bool): read the file through a memory map
+                stream_options: chunk_size, hash_algorithm, progress, throughput and
+                    callback_interval, see UploadStream
+        '''
+        with UploadStream.from_file(src, use_mmap, **stream_options) as stream:
+            return self._upload_content(stream, dst, mimetype, st_attr)
+
+    def upload_file_dedup(self, src, dst, mimetype, st_attr, use_mmap=False,
+                          **stream_options):
+        '''upload a file, unless dst already has the same content
 
-    def upload_string(self, _str, dst, mimetype, st_attr):
+            The size and digest of the content are stored in the metadata of dst. If
+            dst exists with the size of src, src is hashed and the upload is skipped
+            when the digests match. Otherwise the content is hashed while it is sent,
+            and replaces the content of an existing dst, whose standard attributes are kept
+
+            Args:
+                see upload_file, the digest uses the hash_algorithm of stream_options
+
+            Returns:
+                (uuid, skipped), skipped is True if the content was not sent
+        '''
+        algorithm = stream_options.get('hash_algorithm', 'md5')
+        if not algorithm:
+            raise ValueError('deduplicating uploads need a hash_algorithm')
+
+        entity = self._get_entity_by_path(dst)
+        if entity is not None:
+            if not self.isfile(entity):
+                raise OSError('Cannot overwrite a %s: %s' % (entity._entityType, dst))
+            stored = self._get_metadata(entity)
+            if stored.get(CONTENT_SIZE_KEY) == str(os.path.getsize(src)):
+                chunk_size = stream_options.get('chunk_size', DEFAULT_CHUNK_SIZE)
+                digest = file_digest(src, algorithm, chunk_size).hexdigest()
+                if stored.get(CONTENT_DIGEST_KEY) == '%s:%s' % (algorithm, digest):
+                    L.debug('%s already has the content of %s, skipping upload', dst, src)
+                    return entity._uuid, True
+
+        return self.upload_file_tracked(src, dst, mimetype, st_attr, entity, use_mmap,
+                                        **stream_options), False
+
+    def upload_file_tracked(self, src, dst, mimetype, st_attr, entity=None, use_mmap=False,
+                            **stream_options):
+        '''upload a file, and store the size and digest of its content in the metadata of dst
+
+            Args:
+                entity: the existing file entity of dst whose content is replaced,
+                    dst is created if None
+                see upload_file, no digest is stored if the hash_algorithm of
+                stream_options is None
+
+            Returns: uuid of the uploaded entity
+        '''
+        algorithm = stream_options.get('hash_algorithm', 'md5')
+        with UploadStream.from_file(src, use_mmap, **stream_options) as stream:
+            _uuid = self._upload_content(stream, dst, mimetype, st_attr, entity)
+        metadata = {CONTENT_SIZE_KEY: stream.size}
+        if algorithm:
+            metadata[CONTENT_DIGEST_KEY] = '%s:%s' % (algorithm, stream.hexdigest())
+        self._set_metadata(EntityRef(_uuid, 'file'), metadata)
+        return _uuid
+
+    def upload_string(self, _str, dst, mimetype, st_attr, **stream_options):
         '''upload a string to the server'''
-        return self._upload_content(_str, dst, mimetype, st_attr)
+        with UploadStream.from_string(_str, **stream_options) as stream:
+            return self._upload_content(stream, dst, mimetype, st_attr)
+
+    def upload_stream(self, stream, dst, mimetype, st_attr):
+        '''upload the content of an UploadStream to the server'''
+        return self._upload_content(stream, dst, mimetype, st_attr)
 
     def _create_placeholder(self, dst, mimetype, st_attr, extra_attr=None):
         '''creates a placeholder'''
@@ -393,28 +1146,51 @@ class DocAccess(object):
             props['_contentType'] = str(mimetype)
 
         body = sh.swagger_create_type(FilePostJson.FilePostJson, props)
-        entity = self._file.create_file(body)
+        try:
+            entity = self._file.create_file(body)
+        finally:
+            self._created(dst)
         return parent, entity
 
-    def _upload_content(self, content, dst, mimetype, st_attr):
+    def _upload_content(self, content, dst, mimetype, st_attr, entity=None, parent=None):
         '''upload the content
 
             Args:
-                content(string or open file): follows the same conventions
+                content(UploadStream or string): follows the same conventions
                     as HTTPConnection.request
                 dst(string path): on the server, including the
                     /project/folder/...folders/file
                 mimetype(str): set the _contentType property to this mimetype
                 st_attr(dict): standard attributes
+                entity: the existing file entity of dst whose content is replaced,
+                    a placeholder is created if None
+                parent: the parent entity of entity, looked up if None
 
             Returns: uuid of created entity
         '''
-        parent, entity = self._create_placeholder(dst, mimetype, st_attr)
+        if entity is None:
+            parent, entity = self._create_placeholder(dst, mimetype, st_attr)
+        elif parent is None:
+            parent = self._get_parent(dst)
 
         content_url = joinp(self.host, 'file', entity._uuid, 'content/upload')
         headers = copy.copy(self._get_headers())
 
-        resp = requests.post(content_url, headers=headers, data=content)
+        if not len(content):
+            # an empty stream would be sent with chunked transfer encoding
+            content = ''
+        elif (self.compress_uploads and isinstance(content, UploadStream) and
+              len(content) >= MIN_COMPRESSED_SIZE and
+              is_compressible(mimetype or getattr(entity, '_contentType', None))):
+            content = CompressedUploadStream(content)
+            headers['Content-Encoding'] = 'gzip'
+            L.debug('uploading %s gzip compressed: %d -> %d bytes', dst,
+                    content.content_size, len(content))
+        try:
+            resp = transport.post(content_url, headers=headers, data=content)
+        finally:
+            if isinstance(content, CompressedUploadStream):
+                content.close()
         if 201 != resp.status_code:
             raise DocException('Could not upload file (%s): %s' % (resp.status_code, resp.text))
 
@@ -437,7 +1213,66 @@ class DocAccess(object):
     def get_standard_attr_by_id(self, _id):
         '''get the standard attributes for a id
         '''
-        return self._entity.get_entity(_id)
+        entity = self._entity.get_entity(_id)
+        if entity is not None:
+            self._remember((entity, ))
+        return entity
+
+    def _location(self, _id):
+        '''return (parent uuid, name) of _id, the parent uuid is None for projects'''
+        location = self._locations.get(_id)
+        if location is None:
+            entity = self.get_standard_attr_by_id(_id)
+            if entity is None:
+                raise DocException('Entity does not exist: %s' % _id)
+            parent = entity._parent
+            location = (None if parent in (None, 'None') else parent, entity._name.lstrip('/'))
+            self._locations[_id] = location
+        return location
+
+    def get_path_by_id(self, _id):
+        '''returns a path on the DS from the uuid of an existing object
+
+        The location of the entity and of its ancestors is remembered, so resolving
+        the path of a sibling, or of the same entity, does not call the server again
+        '''
+        names = []
+        while _id is not None:
+            _id, name = self._location(_id)
+            names.append(name)
+        return '/' + '/'.join(reversed(names))
+
+    def get_paths_by_ids(self, ids, workers=1):
+        '''return the paths of many uuids
+
+        The unknown entities are fetched level by level, workers at a time, so an
+        ancestor shared by several entities is only fetched once
+
+        Returns:
+            Tuple of two dictionaries: uuid -> path of the resolved entities, and
+            uuid -> exception of the ones which could not be resolved
+        '''
+        ids = list(ids)
+        errors = {}
+        unknown = set(_id for _id in ids if _id not in self._locations)
+        while unknown:
+            parents = set()
+            for _id, location, error in run_bounded(self._location, unknown, workers):
+                if error is not None:
+                    errors[_id] = error
+                elif location[0] is not None and location[0] not in self._locations:
+                    parents.add(location[0])
+            unknown = parents - set(errors)
+
+        paths = {}
+        for _id in ids:
+            if _id in errors:
+                continue
+            try:
+                paths[_id] = self.get_path_by_id(_id)
+            except (DocException, HTTPError) as e:
+                errors[_id] = e
+        return paths, errors
 
     def set_standard_attr(self, path, attr_dict):
         '''set the standard attributes on path'''
@@ -463,7 +1298,9 @@ class DocAccess(object):
         # ensure all values are strings
         attr = dict([(k, str(v)) for k, v in attr_dict.items()])
         obj = self._get_entity_accessor(ent)
-        return obj.update(obj, ent._uuid, attr)
+        ret = obj.update(obj, ent._uuid, attr)
+        self._remove_from_cache(ent)
+        return ret
 
     def get_metadata(self, path):
         '''get the metadata for a path'''
@@ -474,8 +1311,7 @@ class DocAccess(object):
 
     def get_metadata_by_id(self, _id):
         '''get the metadata by id'''
-        ent = self.get_standard_attr_by_id(_id)
-        return self._get_metadata(ent)
+        return self._get_metadata(self._entity_ref(_id))
 
     def _get_metadata(self, ent):
         '''helper to actually get the metadata
@@ -501,8 +1337,7 @@ class DocAccess(object):
         Args:
             ent(EntityReturn): the entity where the lookup happens
         '''
-        ent = self.get_standard_attr_by_id(_id)
-        return self._set_metadata(ent, metadata_dict)
+        return self._set_metadata(self._entity_ref(_id), metadata_dict)
 
     def _set_metadata(self, ent, metadata_dict):
         '''helper to actually set the metadata'''
@@ -545,6 +1380,7 @@ class DocAccess(object):
             Args:
                 files(dict): a dictionary of dst_name -> properties
                     where properties must be a dictionary containing content_type and external_path
+                    and optionally a description
                     example:
                     {'txt1': {'content_type': 'text/plain', 'external_path': '/gpfs/txt1'},
                      'txt2': ...
@@ -559,7 +1395,7 @@ class DocAccess(object):
         post_data = [dict(
             _parent=parent,
             _contentType=f['content_type'],
-            _description='',
+            _description=f.get('description', ''),
             _entityType='file',
             _contentUri=f['external_path'],
             _name=name) for name, f in files.items()]
@@ -569,6 +1405,10 @@ class DocAccess(object):
             post_data,
             self._get_headers())
 
+        if self.cache:
+            self.cache.invalidate_children(parent)
+        self._created(dst_folder, subtree=True)
+
         return ret
 
     def filter_projects(self, filter_expr):
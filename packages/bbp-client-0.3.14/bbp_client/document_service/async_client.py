@@ -0,0 +1,135 @@
+'''non-blocking interface to the document service
+
+AsyncDocClient mirrors the main methods of document_service.client.Client, but
+every call returns immediately with a multiprocessing.pool.AsyncResult (a future:
+get(timeout), ready(), successful()). The calls run on a fixed pool of threads,
+and the number of concurrent requests to a host is bounded by a semaphore shared
+by all the AsyncDocClients talking to it, so thousands of operations can be in
+flight without a thread per operation.
+
+Example:
+    >>> from bbp_client.document_service.client import Client
+    >>> from bbp_client.document_service.async_client import AsyncDocClient, gather
+    >>> with AsyncDocClient(Client.new(token=token), workers=32) as adc:
+    ...     futures = [adc.set_metadata_by_id(uuid, {'tag': 'x'}) for uuid in uuids]
+    ...     results = gather(futures)
+'''
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from bbp_client import transport
+
+import logging
+L = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 16
+
+
+class HostLimits(object):
+    '''bounded semaphores limiting the concurrent requests per host, across clients'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def semaphore(self, host, limit):
+        '''return the semaphore of host, created with limit slots on first use'''
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(limit)
+            return semaphore
+
+
+HOST_LIMITS = HostLimits()
+
+
+def gather(futures, timeout=None):
+    '''wait for all the futures, and return their results in the same order
+
+    The exception of the first failed future is raised
+    '''
+    return [f.get(timeout) for f in futures]
+
+
+class AsyncDocClient(object):
+    '''document service client whose calls return futures'''
+    def __init__(self, client, workers=DEFAULT_WORKERS, host_limit=None):
+        '''
+        Args:
+            client: document_service.client.Client doing the actual calls
+            workers(int): number of threads running the calls
+            host_limit(int): maximum number of concurrent calls to the host of client,
+                shared with the other AsyncDocClients of the same host. Defaults to workers
+        '''
+        self._client = client
+        self.host = client._access.host  # pylint: disable=W0212
+        self.workers = workers
+        self._semaphore = HOST_LIMITS.semaphore(self.host, host_limit or workers)
+        self._pool = ThreadPool(workers)
+        # keep as many connections alive as there can be concurrent calls, if the
+        # installed transport pools its connections (see transport.set_transport)
+        shared = transport.get_transport()
+        if hasattr(shared, 'set_host_pool_size'):
+            shared.set_host_pool_size(self.host, host_limit or workers)
+
+    def _submit(self, func, *args, **kwargs):
+        '''run func on the pool, within the host limit, and return its future'''
+        def call():
+            '''the call, holding a slot of the host'''
+            with self._semaphore:
+                return func(*args, **kwargs)
+        return self._pool.apply_async(call)
+
+    def exists(self, path):
+        '''future of Client.exists'''
+        return self._submit(self._client.exists, path)
+
+    def listdir(self, path=None):
+        '''future of Client.listdir'''
+        return self._submit(self._client.listdir, path)
+
+    def walk(self, path=None, workers=1, ordered=False):
+        '''future of the list of (dirpath, dirnames, filenames) of Client.walk'''
+        return self._submit(lambda: list(self._client.walk(path, workers, ordered)))
+
+    def download_file_by_id(self, _id, dst_path=None, **kwargs):
+        '''future of Client.download_file_by_id'''
+        return self._submit(self._client.download_file_by_id, _id, dst_path, **kwargs)
+
+    def upload_file(self, src_path, dst_path, mimetype=None, st_attr=None, **kwargs):
+        '''future of Client.upload_file'''
+        return self._submit(self._client.upload_file, src_path, dst_path, mimetype, st_attr,
+                            **kwargs)
+
+    def get_metadata(self, path):
+        '''future of Client.get_metadata'''
+        return self._submit(self._client.get_metadata, path)
+
+    def set_metadata(self, path, metadata_dict):
+        '''future of Client.set_metadata'''
+        return self._submit(self._client.set_metadata, path, metadata_dict)
+
+    def get_metadata_by_id(self, _id):
+        '''future of Client.get_metadata_by_id'''
+        return self._submit(self._client.get_metadata_by_id, _id)
+
+    def set_metadata_by_id(self, _id, metadata_dict):
+        '''future of Client.set_metadata_by_id'''
+        return self._submit(self._client.set_metadata_by_id, _id, metadata_dict)
+
+    def create_external_link(self, external_path, dst_path, st_attr=None):
+        '''future of Client.create_external_link'''
+        return self._submit(self._client.create_external_link, external_path, dst_path,
+                            st_attr)
+
+    def close(self):
+        '''wait for the submitted calls, and stop the threads'''
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
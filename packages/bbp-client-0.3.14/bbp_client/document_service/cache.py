@@ -0,0 +1,272 @@
+'''path based entity cache for the document service client'''
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class PathIndex(object):
+    '''index of the paths holding entries below each parent path, so that the
+    entries of a subtree are found without scanning all of them
+
+    The parents without an entry of their own are indexed too, as long as a path
+    below them holds one. The index does not lock, its owner does.
+    '''
+    def __init__(self, has_entry):
+        '''
+        Args:
+            has_entry: function telling if a path holds an entry of the owner
+        '''
+        self.has_entry = has_entry
+        self._children = {}  # parent path -> paths directly below it
+
+    def add(self, path):
+        '''index path below its parent, and the parent below its own one'''
+        while path != '/':
+            parent = os.path.dirname(path)
+            children = self._children.get(parent)
+            if children is not None:
+                children.add(path)
+                return  # the parent is already indexed
+            self._children[parent] = set([path])
+            path = parent
+
+    def remove(self, path):
+        '''drop path from the index, with its ancestors left without entries'''
+        while path != '/' and not self.has_entry(path) and not self._children.get(path):
+            self._children.pop(path, None)
+            parent = os.path.dirname(path)
+            if parent in self._children:
+                self._children[parent].discard(path)
+            path = parent
+        if not self._children.get('/'):
+            self._children.pop('/', None)
+
+    def pop_subtree(self, path):
+        '''drop the paths below path from the index, and return them with path
+
+        The entries of the returned paths are to be removed, then remove(path) drops
+        path and its ancestors left without entries
+        '''
+        found, pending = [], [path]
+        while pending:
+            p = pending.pop()
+            found.append(p)
+            pending.extend(self._children.pop(p, ()))
+        return found
+
+    def clear(self):
+        '''empty the index'''
+        self._children.clear()
+
+    def __len__(self):
+        '''number of indexed parents'''
+        return len(self._children)
+
+
+class EntityCache(object):
+    '''bounded LRU cache of path -> entity, and parent uuid -> children listings
+
+    Every entry expires after max_age seconds. When a limit is reached, the least
+    recently used entries are evicted first.
+    '''
+    def __init__(self, max_age=60, max_entities=100000, max_listings=10000):
+        '''
+        Args:
+            max_age(float): seconds an entry stays valid
+            max_entities(int): maximum number of path -> entity entries
+            max_listings(int): maximum number of folder listings
+        '''
+        self.max_age = max_age
+        self.max_entities = max_entities
+        self.max_listings = max_listings
+
+        self._lock = threading.RLock()
+        self._entities = OrderedDict()  # path -> (entity, expire)
+        self._listings = OrderedDict()  # parent uuid -> (children, expire)
+        self._paths = {}  # uuid -> path
+        # invalidating a subtree does not scan the whole cache
+        self._index = PathIndex(self._entities.__contains__)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expire(self):
+        '''get the expiration timestamp of a new entry'''
+        return time.time() + self.max_age
+
+    def _lookup(self, store, key):
+        '''return the value of key in store if it has not expired'''
+        item = store.get(key)
+        if item is None:
+            return None
+        value, expire = item
+        if expire < time.time():
+            del store[key]
+            if store is self._entities:
+                self._paths.pop(value._uuid, None)
+                self._index.remove(key)
+            return None
+        # move to the most recently used end
+        del store[key]
+        store[key] = item
+        return value
+
+    def _evict(self, store, limit):
+        '''drop the least recently used entries of store until it fits in limit'''
+        while len(store) > limit:
+            key, (value, _) = store.popitem(last=False)
+            if store is self._entities:
+                self._paths.pop(value._uuid, None)
+                self._index.remove(key)
+            self.evictions += 1
+
+    def _count(self, value):
+        '''update the hit/miss counters depending on value'''
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get(self, path):
+        '''return the entity cached for path, None if it is not cached'''
+        with self._lock:
+            return self._count(self._lookup(self._entities, path))
+
+    def put(self, path, entity):
+        '''cache the entity that lives at path'''
+        with self._lock:
+            if self._entities.pop(path, None) is None:
+                self._index.add(path)
+            self._entities[path] = (entity, self._expire())
+            self._paths[entity._uuid] = path
+            self._evict(self._entities, self.max_entities)
+
+    def path_of(self, uuid):
+        '''return the last known path of the entity with uuid, None if unknown'''
+        with self._lock:
+            return self._paths.get(uuid)
+
+    def get_children(self, uuid):
+        '''return the cached children of container with uuid, None if not cached'''
+        with self._lock:
+            return self._count(self._lookup(self._listings, uuid))
+
+    def put_children(self, uuid, children):
+        '''cache the complete listing of the container with uuid'''
+        with self._lock:
+            self._listings.pop(uuid, None)
+            self._listings[uuid] = (list(children), self._expire())
+            self._evict(self._listings, self.max_listings)
+
+    def invalidate_children(self, uuid):
+        '''forget the listing of the container with uuid'''
+        with self._lock:
+            self._listings.pop(uuid, None)
+
+    def invalidate(self, path):
+        '''forget path and everything below it'''
+        path = path.rstrip('/') or '/'
+        with self._lock:
+            # only the containers have paths indexed below them
+            for p in self._index.pop_subtree(path):
+                item = self._entities.pop(p, None)
+                if item is not None:
+                    entity, _ = item
+                    self._listings.pop(entity._uuid, None)
+                    self._paths.pop(entity._uuid, None)
+            self._index.remove(path)
+
+    def reset(self):
+        '''empty the cache, the statistics are kept'''
+        with self._lock:
+            self._entities.clear()
+            self._listings.clear()
+            self._paths.clear()
+            self._index.clear()
+
+    def stats(self):
+        '''return a dictionary with the cache statistics'''
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entities': len(self._entities),
+                    'listings': len(self._listings),
+                    }
+
+
+class MissingPaths(object):
+    '''short lived memory of the paths which do not exist on the server
+
+    A path is remembered as missing for ttl seconds, unless the client creates it
+    (or something below it) in the meantime. Paths created by other clients are
+    seen once the entry expires.
+    '''
+    def __init__(self, ttl=10, max_paths=100000):
+        '''
+        Args:
+            ttl(float): seconds a path is remembered as missing
+            max_paths(int): maximum number of remembered paths, the oldest are dropped first
+        '''
+        self.ttl = ttl
+        self.max_paths = max_paths
+
+        self._lock = threading.Lock()
+        self._paths = OrderedDict()  # path -> expire
+        # discarding a subtree does not scan all the paths
+        self._index = PathIndex(self._paths.__contains__)
+        # incremented when paths are discarded, so a lookup which started before
+        # a path was created does not remember it as missing
+        self.generation = 0
+
+        self.hits = 0
+
+    def contains(self, path):
+        '''is path known to be missing'''
+        with self._lock:
+            expire = self._paths.get(path)
+            if expire is None:
+                return False
+            if expire < time.time():
+                del self._paths[path]
+                self._index.remove(path)
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, path, generation):
+        '''remember that path is missing, as seen by a lookup started at generation'''
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._paths.pop(path, None) is None:
+                self._index.add(path)
+            self._paths[path] = time.time() + self.ttl
+            while len(self._paths) > self.max_paths:
+                oldest, _ = self._paths.popitem(last=False)
+                self._index.remove(oldest)
+
+    def discard(self, path, subtree=False):
+        '''forget path, and with subtree, all the paths below it'''
+        with self._lock:
+            self.generation += 1
+            path = path.rstrip('/') or '/'
+            for p in self._index.pop_subtree(path) if subtree else (path, ):
+                self._paths.pop(p, None)
+            self._index.remove(path)
+
+    def reset(self):
+        '''forget all the paths'''
+        with self._lock:
+            self.generation += 1
+            self._paths.clear()
+            self._index.clear()
+
+    def stats(self):
+        '''return a dictionary with the number of avoided lookups and of remembered paths'''
+        with self._lock:
+            return {'hits': self.hits, 'paths': len(self._paths)}
@@ -4,16 +4,24 @@ of the os.* functions
 import logging
 import os
 from os.path import join as joinp
+from urllib2 import HTTPError
 from bbp_client import swagger_helpers as sh
+from bbp_client.concurrency import run_bounded
 from bbp_services.client import get_services
 
 from bbp_client.oidc.client import BBPOIDCClient
 from bbp_client.document_service.access import DocAccess
+from bbp_client.document_service.mirror import mirror
+from bbp_client.document_service import sync as doc_sync
 from bbp_client.document_service.exceptions import DocException
+from bbp_client.document_service.streams import (DEFAULT_CHUNK_SIZE, DEFAULT_BLOCK_SIZE,
+                                                  DEFAULT_CACHE_BLOCKS, DEFAULT_READ_AHEAD)
 
 
 L = logging.getLogger(__name__)
 
+DEFAULT_WORKERS = 8
+
 # pylint: disable=W0212
 
 
@@ -31,18 +39,32 @@ class Client(object):
             >>> handler.walk()
     '''
 
-    def __init__(self, host, oauth_client=None, headers=None):
+    def __init__(self, host, oauth_client=None, headers=None, cache_enabled=False,
+                 cache_options=None, compact_entities=False, compress_uploads=False,
+                 negative_ttl=0):
         '''
         Args:
            host: host to connnect to, ie: http://localhost:8888
            oauth_client: instance of the bbp_client.oidc.client
            headers: HTTP headers passed to server
+           cache_enabled(bool): cache the path lookups and folder listings
+           cache_options(dict): max_age, max_entities and max_listings of the cache
+           compact_entities(bool): keep the listed entities as slotted EntityRecord,
+               which use much less memory for large listings and walks
+           compress_uploads(bool): send the content of text-like uploads (text/*, JSON,
+               XML...) gzip compressed, the server has to accept gzip encoded uploads
+           negative_ttl(float): seconds a path found missing is remembered as such, unless
+               this client creates it. The paths created meanwhile by other clients are
+               reported missing until then. 0, the default, looks up the missing paths
+               every time
         '''
         self._cwd = '/'  # means that we're at the top level
-        self._access = DocAccess(host, oauth_client, headers)
+        self._access = DocAccess(host, oauth_client, headers, cache_enabled, cache_options,
+                                 compact_entities, compress_uploads, negative_ttl)
 
     @classmethod
-    def new(cls, environment='prod', user=None, password=None, token=None):
+    def new(cls, environment='prod', user=None, password=None, token=None,
+            cache_enabled=False, compact_entities=False, compress_uploads=False):
         '''create new documentservice client'''
         services = get_services()
         oauth_url = services['oidc_service'][environment]['url']
@@ -51,7 +73,8 @@ class Client(object):
             oauth_client = BBPOIDCClient.bearer_auth(oauth_url, token)
         else:
             oauth_client = BBPOIDCClient.implicit_auth(user, password, oauth_url)
-        return cls(ds_url, oauth_client)
+        return cls(ds_url, oauth_client, cache_enabled=cache_enabled,
+                   compact_entities=compact_entities, compress_uploads=compress_uploads)
 
     @sh.swagger_error
     def exists(self, path):
@@ -116,6 +139,24 @@ class Client(object):
         norm_path = self._norm_path(path)
         return self._access.listdir(norm_path)
 
+    def iterdir(self, path=None, page_size=None, prefetch=True):
+        '''Generator of the names of the entries in the directory given by path
+
+           The entries are fetched page by page, with the next page requested in the
+           background when prefetch is True, so the first names are available before
+           a large directory is completely listed, and stopping early saves the
+           remaining requests.
+
+           if no path is given, starts at root (ie: all projects)
+        '''
+        path = path or '/'
+        norm_path = self._norm_path(path)
+        try:
+            for entity in self._access.iterdir(norm_path, page_size, prefetch):
+                yield entity._name
+        except HTTPError as e:
+            raise sh.to_swagger_exception(e)
+
     @sh.swagger_error
     def mkdir(self, path=None, ignore_error=False):
         '''Create a directory named path'''
@@ -155,61 +196,337 @@ class Client(object):
         self._access.rmdir(norm_path, force)
 
     @sh.swagger_error
-    def walk(self, path=None):
+    def rmtree(self, path, workers=DEFAULT_WORKERS, dry_run=False):
+        '''Remove path and everything below it
+
+            The tree is listed concurrently, the files are deleted in parallel, then the
+            folders bottom-up. A folder whose content could not be deleted is kept.
+
+            Example:
+                >>> deleted, errors = client.rmtree('/scratch/run_42', workers=16)
+
+            Args:
+                path: the file, folder or project to remove
+                workers(int): number of concurrent requests
+                dry_run(bool): only return what would be deleted
+
+            Returns:
+                Tuple of the list of the deleted paths (or the ones that would be
+                deleted, with dry_run), and a dictionary path -> exception of the ones
+                which could not be deleted
+        '''
+        norm_path = self._norm_path(path)
+        deleted, errors = self._access.rmtree(norm_path, workers, dry_run)
+        return deleted, dict((p, sh.to_swagger_exception(e)) for p, e in errors.items())
+
+    @sh.swagger_error
+    def copytree(self, src, dst, workers=DEFAULT_WORKERS, metadata=True):
+        '''Copy the folder or project src and everything below it to dst, on the server
+
+            External links are re-created pointing at the same content, the content
+            of the uploaded files is streamed from the server back to it, without
+            going through the local disk. The description, content type and metadata
+            are copied.
+
+            Example:
+                >>> copies, errors = client.copytree('/proj/run_42', '/proj/run_43')
+
+            Args:
+                src: the folder or project to copy
+                dst: the path of the copy, which must not exist
+                workers(int): number of concurrent requests
+                metadata(bool): copy the metadata too
+
+            Returns:
+                Tuple of a dictionary src path -> uuid of the copy, and a dictionary
+                src path -> exception of the entities which could not be copied
+        '''
+        norm_src, norm_dst = self._norm_path(src), self._norm_path(dst)
+        copies, errors = self._access.copytree(norm_src, norm_dst, workers, metadata)
+        return copies, dict((p, sh.to_swagger_exception(e)) for p, e in errors.items())
+
+    @sh.swagger_error
+    def walk(self, path=None, workers=1, ordered=False):
         '''For each directory in the tree rooted at cwd (including top itself),
            it yields a 3-tuple (dirpath, dirnames, filenames).
+
+           With workers > 1, up to workers folders are listed concurrently and the
+           tree is walked breadth first. If ordered is True, the folders are yielded
+           level by level in a deterministic order, otherwise as soon as they are listed.
         '''
         norm_path = self._norm_path(path or self._cwd)
-        return self._access.walk(norm_path)
+        return self._access.walk(norm_path, workers, ordered)
 
     ######### specialized functions ##########
     @sh.swagger_error
-    def upload_file(self, src_path, dst_path, mimetype=None, st_attr=None):
+    def upload_file(self, src_path, dst_path, mimetype=None, st_attr=None, use_mmap=False,
+                    **stream_options):
         '''upload a file from the local file system to a directory
 
+            The file is streamed in binary mode, and never loaded in memory as a whole.
+
+            Args:
+                use_mmap(bool): read the file through a memory map, useful for large files
+                stream_options: chunk_size, hash_algorithm, progress(bytes_sent, total_bytes),
+                    throughput(bytes_per_second) and callback_interval,
+                    see bbp_client.document_service.streams.UploadStream
+
             Returns: uuid of created entity
         '''
         if not os.path.isfile(src_path):
             raise OSError('Source path does not exist: %s' % src_path)
         dst_path = self._norm_path(dst_path)
-        return self._access.upload_file(src_path, dst_path, mimetype, st_attr)
+        return self._access.upload_file(src_path, dst_path, mimetype, st_attr, use_mmap,
+                                        **stream_options)
 
     @sh.swagger_error
-    def upload_string(self, _str, dst, mimetype=None, st_attr=None):
+    def upload_file_dedup(self, src_path, dst_path, mimetype=None, st_attr=None,
+                          use_mmap=False, **stream_options):
+        '''upload a file like upload_file, unless dst_path already has the same content
+
+            The digest of the content is stored in the metadata of the file, and
+            compared with the one of the local file. An existing dst_path with a
+            different content is overwritten
+
+            Args:
+                see upload_file
+
+            Returns: a tuple of the uuid of the entity and whether the upload was skipped
+        '''
+        if not os.path.isfile(src_path):
+            raise OSError('Source path does not exist: %s' % src_path)
+        dst_path = self._norm_path(dst_path)
+        return self._access.upload_file_dedup(src_path, dst_path, mimetype, st_attr,
+                                              use_mmap, **stream_options)
+
+    def upload_files(self, files, mimetype=None, dedup=True, workers=1, **stream_options):
+        '''upload many files, the ones whose content is already on the server are skipped
+
+            Example:
+                >>> uploaded, skipped, errors = client.upload_files(
+                ...     [('/tmp/out/a.h5', '/proj/out/a.h5'), ('/tmp/out/b.h5', '/proj/out/b.h5')],
+                ...     workers=4)
+
+            Args:
+                files: iterable of (src_path, dst_path)
+                mimetype(str): content type of all the files
+                dedup(bool): skip the files already on the server, see upload_file_dedup
+                workers(int): number of concurrent uploads
+                stream_options: see upload_file
+
+            Returns:
+                Tuple of a dictionary dst_path -> uuid of the uploaded files, a dictionary
+                dst_path -> uuid of the skipped ones, and a dictionary dst_path -> exception
+                of the ones which failed
+        '''
+        files = dict((dst, src) for src, dst in files)
+
+        def upload(dst):
+            '''upload one file, returns (uuid, skipped)'''
+            if dedup:
+                return self.upload_file_dedup(files[dst], dst, mimetype, **stream_options)
+            return self.upload_file(files[dst], dst, mimetype, **stream_options), False
+
+        results, errors = self._run_many(upload, files, workers)
+        uploaded = dict((dst, ret[0]) for dst, ret in results.items() if not ret[1])
+        skipped = dict((dst, ret[0]) for dst, ret in results.items() if ret[1])
+        return uploaded, skipped, errors
+
+    @sh.swagger_error
+    def upload_string(self, _str, dst, mimetype=None, st_attr=None, **stream_options):
         '''upload a string supplied string to document service
 
             Returns: uuid of created entity
         '''
-        return self._access.upload_string(_str, str(dst), mimetype, st_attr)
+        return self._access.upload_string(_str, str(dst), mimetype, st_attr, **stream_options)
+
+    @sh.swagger_error
+    def upload_stream(self, stream, dst_path, mimetype=None, st_attr=None):
+        '''upload the content of an UploadStream
+
+            The stream hashes the content while it is sent, so the digest is available
+            afterwards without reading the source again.
+
+            Example:
+                >>> from bbp_client.document_service.streams import UploadStream
+                >>> with UploadStream.from_file('/tmp/out.h5', use_mmap=True) as stream:
+                ...     uuid = client.upload_stream(stream, '/proj/out.h5', 'application/x-hdf5')
+                >>> stream.hexdigest()
+
+            Returns: uuid of created entity
+        '''
+        dst_path = self._norm_path(dst_path)
+        return self._access.upload_stream(stream, dst_path, mimetype, st_attr)
 
     @sh.swagger_error
-    def download_file(self, path, dst_path=None):
+    def download_file(self, path, dst_path=None, **kwargs):
         '''download file
 
             Args:
                 path: the path to the file entity
                 dst_path: the path to store the downloaded contents
+                kwargs: resume, retries, checksum, checksum_algorithm and chunk_size,
+                    see download_file_by_id
 
             Returns:
                 path to the file if dst_path was provided
                 contents of the file as a string otherwise
         '''
         norm_path = self._norm_path(path)
-        return self._access.download_file(norm_path, dst_path)
+        return self._access.download_file(norm_path, dst_path, **kwargs)
 
     @sh.swagger_error
-    def download_file_by_id(self, _id, dst_path=None):
+    def download_file_by_id(self, _id, dst_path=None, resume=False, retries=0,
+                            checksum=None, checksum_algorithm='md5',
+                            chunk_size=DEFAULT_CHUNK_SIZE):
         '''download file
 
+            The content is written to dst_path.part first, and renamed to dst_path
+            once complete.
+
             Args:
                 id(string): the id of the file entity
                 dst_path: the path to store the downloaded contents
+                resume(bool): continue an interrupted download from dst_path.part,
+                    using an HTTP Range request
+                retries(int): how many times to resume if the connection breaks
+                checksum(str): expected hex digest of the content, checked before the rename
+                checksum_algorithm(str): hashlib algorithm of the checksum
+                chunk_size(int): size of the chunks read from the server
 
             Returns:
                 path to the file if dst_path was provided
                 contents of the file as a string otherwise
         '''
-        return self._access.download_file_by_id(_id, dst_path)
+        return self._access.download_file_by_id(_id, dst_path, resume, retries, checksum,
+                                                checksum_algorithm, chunk_size)
+
+    @sh.swagger_error
+    def open_download(self, _id, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''open the content of a file for streaming, without loading it in memory
+
+            Example:
+                >>> with client.open_download(uuid, chunk_size=64 * 1024) as stream:
+                ...     header = stream.read(16)
+                ...     for chunk in stream:
+                ...         out.write(chunk)
+
+            Args:
+                id(string): the id of the file entity
+                chunk_size(int): size of the chunks read from the server
+
+            Returns:
+                a binary, read-only file-like object
+        '''
+        return self._access.open_download(_id, chunk_size)
+
+    @sh.swagger_error
+    def open_file(self, path, block_size=DEFAULT_BLOCK_SIZE, cache_blocks=DEFAULT_CACHE_BLOCKS,
+                  read_ahead=DEFAULT_READ_AHEAD):
+        '''open the content of a file for random access, fetching only what is read
+
+            The content is fetched in blocks with HTTP range requests, and the recently
+            used blocks are cached, so readers which seek around a large file (HDF5,
+            numpy) only transfer the bytes they need.
+
+            Example:
+                >>> with client.open_file('/proj/run/report.bin') as fd:
+                ...     fd.seek(-1024, os.SEEK_END)
+                ...     footer = fd.read()
+
+            Args:
+                path: the path to the file entity
+                block_size(int): number of bytes fetched at a time
+                cache_blocks(int): number of blocks kept in memory
+                read_ahead(int): number of blocks fetched ahead of sequential reads
+
+            Returns:
+                a binary, read-only and seekable file-like object
+        '''
+        norm_path = self._norm_path(path)
+        return self._access.open_file(norm_path, block_size=block_size,
+                                      cache_blocks=cache_blocks, read_ahead=read_ahead)
+
+    @sh.swagger_error
+    def open_file_by_id(self, _id, block_size=DEFAULT_BLOCK_SIZE,
+                        cache_blocks=DEFAULT_CACHE_BLOCKS, read_ahead=DEFAULT_READ_AHEAD):
+        '''open the content of a file for random access, see open_file
+
+            Args:
+                id(string): the id of the file entity
+        '''
+        return self._access.open_range(_id, block_size, cache_blocks, read_ahead)
+
+    @sh.swagger_error
+    def mirror(self, ds_path, local_dir, workers=4):
+        '''download a document service folder to the local file system
+
+            The folders are listed and the files downloaded concurrently. Each file
+            is written to a temporary file first, and gets the _modifiedOn of its
+            entity as modification time, so that files that did not change since
+            the last mirror are skipped.
+
+            Args:
+                ds_path: the folder in the document service
+                local_dir: the local destination folder
+                workers(int): number of concurrent listings and downloads
+
+            Returns:
+                MirrorSummary with the downloaded, skipped and failed files,
+                the number of bytes, and files_per_second/bytes_per_second
+        '''
+        norm_path = self._norm_path(ds_path)
+        return mirror(self._access, norm_path, local_dir, workers)
+
+    @sh.swagger_error
+    def plan_sync(self, local_dir, ds_path, direction=doc_sync.BOTH, upload=False,
+                  delete=False, hash_algorithm=None, workers=4):
+        '''compare a local directory and a document service folder, and return what
+            has to be done to make them match, without doing it
+
+            Args:
+                local_dir: the local directory
+                ds_path: the folder in the document service
+                direction: 'both', 'push' (local_dir to ds_path) or 'pull'
+                    (ds_path to local_dir); in both directions, the newer file wins
+                upload(bool): upload the content of the local files, instead of
+                    registering them as external links
+                delete(bool): with 'push' or 'pull', delete what does not exist on
+                    the source side
+                hash_algorithm: when the modification times differ, compare the
+                    digest of the local file with the one stored in the metadata of
+                    the entity, to avoid transferring the same content
+                workers(int): number of concurrent listings and metadata lookups
+
+            Returns:
+                SyncPlan with the list of actions and the conflicts
+        '''
+        norm_path = self._norm_path(ds_path)
+        return doc_sync.plan_sync(self._access, local_dir, norm_path, direction, upload,
+                                  delete, hash_algorithm, workers)
+
+    @sh.swagger_error
+    def sync(self, local_dir, ds_path, direction=doc_sync.BOTH, upload=False, delete=False,
+             hash_algorithm=None, workers=4, plan=None):
+        '''incrementally sync a local directory and a document service folder
+
+            Only the files which changed since the last sync are transferred, see
+            plan_sync for the arguments. The actions are done concurrently.
+
+            Example:
+                >>> summary = client.sync('/gpfs/results/run_42', '/proj/run_42',
+                ...                       direction='push', delete=True, workers=16)
+
+            Args:
+                plan(SyncPlan): the plan to execute, if it was computed with
+                    plan_sync already
+
+            Returns:
+                SyncSummary with the done and failed actions, and the conflicts
+        '''
+        norm_path = self._norm_path(ds_path)
+        return doc_sync.sync(self._access, local_dir, norm_path, direction, upload, delete,
+                             hash_algorithm, workers, plan)
 
     @sh.swagger_error
     def create_external_link(self, external_path, dst_path, st_attr=None):
@@ -232,6 +549,7 @@ class Client(object):
             Args:
                 files(dict): a dictionary of dst_name -> properties
                     where properties must be a dictionary containing content_type and external_path
+                    and optionally a description
                     example:
                     {'txt1': {'content_type': 'text/plain', 'external_path': '/gpfs/txt1'},
                      'txt2': ...
@@ -332,22 +650,95 @@ class Client(object):
         '''
         return self._access.set_metadata_by_id(_id, metadata_dict)
 
+    def get_metadata_many(self, ids, workers=DEFAULT_WORKERS):
+        '''get the metadata of many entities, with at most workers concurrent requests
+
+            Args:
+                ids: iterable of the uuids of the entities
+                workers(int): number of concurrent requests
+
+            Returns:
+                Tuple of two dictionaries: uuid -> metadata of the entities which
+                succeeded, and uuid -> exception of the ones which failed
+        '''
+        return self._run_many(self.get_metadata_by_id, ids, workers)
+
+    def set_metadata_many(self, metadata, workers=DEFAULT_WORKERS):
+        '''set the metadata of many entities, with at most workers concurrent requests
+
+            Args:
+                metadata: dictionary of uuid -> metadata_dict
+                workers(int): number of concurrent requests
+
+            Returns:
+                Tuple of two dictionaries: uuid -> return value of set_metadata_by_id
+                of the entities which succeeded, and uuid -> exception of the ones
+                which failed
+        '''
+        return self._run_many(lambda _id: self.set_metadata_by_id(_id, metadata[_id]),
+                              metadata, workers)
+
+    @staticmethod
+    def _run_many(func, ids, workers):
+        '''call func on each id concurrently, collecting results and errors by id'''
+        results, errors = {}, {}
+        for _id, ret, error in run_bounded(func, ids, workers):
+            if error is None:
+                results[_id] = ret
+            else:
+                L.debug('%s failed for %s: %s', func.__name__, _id, error)
+                errors[_id] = error
+        return results, errors
+
     @sh.swagger_error
     def reset_cache(self):
         '''reset the directory cache'''
         self._access.reset_cache()
 
+    def cache_stats(self):
+        '''return the hit/miss statistics of the directory cache, None if it is disabled'''
+        if self._access.cache:
+            return self._access.cache.stats()
+        return None
+
+    def missing_paths_stats(self):
+        '''return the number of lookups avoided by remembering the missing paths,
+        None if it is disabled'''
+        if self._access.missing:
+            return self._access.missing.stats()
+        return None
+
+    def coalescing_stats(self):
+        '''return the number of path lookups made, and of the ones which shared a
+        concurrent identical lookup'''
+        return self._access.inflight.stats()
+
     @sh.swagger_error
     def __repr__(self):
         return repr(self._access)
 
+    @sh.swagger_error
     def get_path_by_id(self, _id):
         '''returns a path on the DS from the uuid of an existing object'''
-        attr = self.get_standard_attr_by_id(_id)
-        if attr._parent == 'None':
-            return '/' + attr._name
-        else:
-            return joinp(self.get_path_by_id(attr._parent), attr._name)
+        return self._access.get_path_by_id(_id)
+
+    @sh.swagger_error
+    def get_paths_by_ids(self, ids, workers=DEFAULT_WORKERS):
+        '''returns the paths on the DS of many uuids
+
+            The ancestors shared by several uuids are only looked up once, and the
+            lookups are done with at most workers concurrent requests
+
+            Args:
+                ids: iterable of the uuids of existing objects
+                workers(int): number of concurrent requests
+
+            Returns:
+                Tuple of two dictionaries: uuid -> path of the resolved objects, and
+                uuid -> exception of the ones which could not be resolved
+        '''
+        paths, errors = self._access.get_paths_by_ids(ids, workers)
+        return paths, dict((_id, sh.to_swagger_exception(e)) for _id, e in errors.items())
 
     @sh.swagger_error
     def get_project_by_collab_id(self, collab_id):
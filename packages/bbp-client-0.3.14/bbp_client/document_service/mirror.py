@@ -0,0 +1,107 @@
+'''mirror a document service folder to the local file system'''
+import calendar
+import logging
+import os
+import time
+
+from collections import namedtuple
+
+import dateutil.parser
+
+from bbp_client.concurrency import run_bounded
+
+# pylint: disable=W0212
+
+L = logging.getLogger(__name__)
+
+
+class MirrorSummary(namedtuple('MirrorSummary', 'downloaded skipped failed bytes elapsed')):
+    '''result of a mirror
+
+    downloaded: local paths of the downloaded files
+    skipped: local paths of the files that were already up to date
+    failed: list of (document service path, exception)
+    bytes: number of bytes downloaded
+    elapsed: duration of the mirror, in seconds
+    '''
+    @property
+    def files_per_second(self):
+        '''number of downloaded files per second'''
+        return len(self.downloaded) / self.elapsed if self.elapsed else 0.
+
+    @property
+    def bytes_per_second(self):
+        '''number of downloaded bytes per second'''
+        return self.bytes / self.elapsed if self.elapsed else 0.
+
+
+def modified_timestamp(entity):
+    '''the _modifiedOn of entity as a unix timestamp, None if the server did not send it'''
+    modified_on = getattr(entity, '_modifiedOn', None)
+    if not modified_on or modified_on == 'None':
+        return None
+    date = dateutil.parser.parse(modified_on)
+    return calendar.timegm(date.utctimetuple())
+
+
+def is_up_to_date(local_path, entity):
+    '''True if local_path was mirrored from entity, and the entity was not modified since'''
+    timestamp = modified_timestamp(entity)
+    if timestamp is None or not os.path.isfile(local_path):
+        return False
+    return int(os.path.getmtime(local_path)) == timestamp
+
+
+def mirror(access, ds_path, local_dir, workers=4):
+    '''download the files below ds_path to local_dir, keeping the folder structure
+
+    Files are downloaded to a temporary file, which is renamed once complete, and get
+    the _modifiedOn of the entity as modification time. Local files with the same
+    modification time as the entity are skipped.
+
+    Args:
+        access(DocAccess): the document service access
+        ds_path: the folder to mirror
+        local_dir: the local destination folder, created if needed
+        workers(int): number of folders listed and files downloaded concurrently
+
+    Returns:
+        MirrorSummary
+    '''
+    start = time.time()
+    downloaded, skipped, failed = [], [], []
+    total_bytes = 0
+
+    def to_download():
+        '''walk ds_path, creating the local folders and yielding the outdated files'''
+        for dirpath, _, files in access.walk_entities(ds_path, workers):
+            relative = os.path.relpath(dirpath, ds_path)
+            local_path = os.path.normpath(os.path.join(local_dir, *relative.split('/')))
+            if not os.path.isdir(local_path):
+                os.makedirs(local_path)
+            for entity in files:
+                dst = os.path.join(local_path, entity._name)
+                if is_up_to_date(dst, entity):
+                    skipped.append(dst)
+                else:
+                    yield os.path.join(dirpath, entity._name), entity, dst
+
+    def download(item):
+        '''download a single file, and set its modification time'''
+        _, entity, dst = item
+        access.download_file_by_id(entity._uuid, dst)
+        timestamp = modified_timestamp(entity)
+        if timestamp is not None:
+            os.utime(dst, (timestamp, timestamp))
+        return os.path.getsize(dst)
+
+    for (src, _, dst), size, error in run_bounded(download, to_download(), workers):
+        if error is not None:
+            L.error('Failed to download %s: %s', src, error)
+            failed.append((src, error))
+        else:
+            L.debug('Downloaded %s -> %s', src, dst)
+            downloaded.append(dst)
+            total_bytes += size
+
+    return MirrorSummary(downloaded, skipped, failed, total_bytes, time.time() - start)
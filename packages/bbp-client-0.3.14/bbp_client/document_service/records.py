@@ -0,0 +1,58 @@
+'''compact records of the document service entities
+
+An EntityReturn, like every swagger model, carries its own __dict__ and its own
+copy of the swaggerTypes dictionary. EntityRecord has the same attributes, stored
+in __slots__, and shares the strings that repeat between entities (types,
+parents, creators), so large listings take a fraction of the memory.
+'''
+from bbp_client.document_service.swagger.models.EntityReturn import EntityReturn
+
+#W0212: the document service standard attributes start with _
+# pylint: disable=W0212
+
+ENTITY_TYPES = EntityReturn().swaggerTypes
+
+# attributes whose values are shared by many entities
+INTERNED_FIELDS = frozenset(('_entityType', '_contentType', '_parent', '_createdBy'))
+
+
+def _share(value):
+    '''return the shared copy of value if it is a byte string'''
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+class EntityRecord(object):
+    '''slotted entity, with the same attributes as EntityReturn'''
+    __slots__ = tuple(sorted(ENTITY_TYPES))
+    swaggerTypes = ENTITY_TYPES
+
+    def __init__(self, **values):
+        for field in EntityRecord.__slots__:
+            value = values.get(field)
+            setattr(self, field, _share(value) if field in INTERNED_FIELDS else value)
+
+    @classmethod
+    def from_entity(cls, entity):
+        '''create the record of entity, an EntityReturn or anything with its attributes'''
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            value = getattr(entity, field, None)
+            setattr(record, field, _share(value) if field in INTERNED_FIELDS else value)
+        return record
+
+    def __getstate__(self):
+        return dict((f, getattr(self, f)) for f in self.__slots__ if hasattr(self, f))
+
+    def __setstate__(self, state):
+        for field, value in state.items():
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return 'EntityRecord(%s:%s %s)' % (self._entityType, self._uuid, self._name)
+
+
+def compact(entities):
+    '''return the list of the records of entities'''
+    return [EntityRecord.from_entity(e) for e in entities]
@@ -0,0 +1,507 @@
+'''streaming helpers for the content of document service files'''
+import gzip
+import hashlib
+import itertools
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# random access reads fetch blocks of this size, keep this many of them, and fetch this
+# many more when the reads are sequential
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DEFAULT_CACHE_BLOCKS = 32
+DEFAULT_READ_AHEAD = 2
+
+# compressed uploads are kept in memory up to this size, and spooled to disk above
+DEFAULT_SPOOL_SIZE = 16 * 1024 * 1024
+
+# content types which are worth compressing: text/*, and these types and suffixes
+COMPRESSIBLE_TYPES = frozenset(('application/json', 'application/xml', 'application/javascript',
+                                'application/x-yaml', 'application/x-python',
+                                'application/x-sh', 'image/svg+xml'))
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+
+def is_compressible(content_type):
+    '''is the content of content_type text-like, and worth compressing'''
+    if not content_type:
+        return False
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    return (content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES or
+            content_type.endswith(COMPRESSIBLE_SUFFIXES))
+
+
+class DownloadStream(object):
+    '''read-only, binary file-like object over a streamed download
+
+    Iterating over it yields the content in chunks of chunk_size bytes, read()
+    behaves like file.read(). Nothing is kept in memory besides the current chunk.
+
+    Example:
+        >>> with access.open_download(uuid) as stream:
+        ...     for chunk in stream:
+        ...         process(chunk)
+    '''
+    def __init__(self, resp, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        Args:
+            resp: a requests response, obtained with stream=True
+            chunk_size(int): the size of the chunks read from the connection
+        '''
+        self._resp = resp
+        self.chunk_size = chunk_size
+        self._chunks = resp.iter_content(chunk_size)
+        self._buffer = b''
+        self.closed = False
+        length = resp.headers.get('Content-Length')
+        self.size = int(length) if length is not None else None
+        self.content_type = resp.headers.get('Content-Type')
+        self.bytes_read = 0
+
+    def _next_chunk(self):
+        '''the next chunk from the connection, empty once the content is exhausted'''
+        for chunk in self._chunks:
+            if chunk:
+                self.bytes_read += len(chunk)
+                return chunk
+        return b''
+
+    def read(self, size=-1):
+        '''read at most size bytes, everything that is left if size is negative'''
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if size is None or size < 0:
+            parts = [self._buffer]
+            chunk = self._next_chunk()
+            while chunk:
+                parts.append(chunk)
+                chunk = self._next_chunk()
+            self._buffer = b''
+            return b''.join(parts)
+
+        while len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        ret, self._buffer = self._buffer[:size], self._buffer[size:]
+        return ret
+
+    def __iter__(self):
+        if self._buffer:
+            buf, self._buffer = self._buffer, b''
+            yield buf
+        chunk = self._next_chunk()
+        while chunk:
+            yield chunk
+            chunk = self._next_chunk()
+
+    def close(self):
+        '''release the connection'''
+        if not self.closed:
+            self.closed = True
+            self._resp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def file_digest(path, algorithm='md5', chunk_size=DEFAULT_CHUNK_SIZE):
+    '''return a hashlib object of algorithm, fed with the content of path'''
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fd:
+        chunk = fd.read(chunk_size)
+        while chunk:
+            digest.update(chunk)
+            chunk = fd.read(chunk_size)
+    return digest
+
+
+class UploadStream(object):
+    '''binary, sized, read-only stream over the content of a file or string to upload
+
+    The content is read chunk by chunk as the HTTP library sends it, and hashed
+    on the way, so a file is read exactly once and never buffered as a whole.
+
+    Example:
+        >>> stream = UploadStream.from_file('/tmp/big.h5', use_mmap=True,
+        ...                                 progress=lambda sent, total: log(sent, total))
+        >>> uuid = client.upload_stream(stream, '/proj/big.h5', 'application/x-hdf5')
+        >>> stream.hexdigest()
+    '''
+    def __init__(self, source, size, chunk_size=DEFAULT_CHUNK_SIZE, hash_algorithm='md5',
+                 progress=None, throughput=None, callback_interval=0.5, on_close=None):
+        '''
+        Args:
+            source: object with a read(size) method, a string or an mmap
+            size(int): total number of bytes of source
+            chunk_size(int): size of the chunks yielded when iterating
+            hash_algorithm(str): hashlib algorithm of the inline hash, None for no hash
+            progress: called as progress(bytes_sent, total_bytes)
+            throughput: called as throughput(bytes_per_second)
+            callback_interval(float): minimum number of seconds between two callbacks
+            on_close: called when the stream is closed, to release the source
+        '''
+        self._source = source
+        self._offset = 0
+        self.size = size
+        self.chunk_size = chunk_size
+        self.hash_algorithm = hash_algorithm
+        self._digest = hashlib.new(hash_algorithm) if hash_algorithm else None
+        self._progress = progress
+        self._throughput = throughput
+        self._callback_interval = callback_interval
+        self._on_close = on_close
+        self._start = None
+        self._last_report = 0
+        self._last_reported_bytes = None
+        self.bytes_sent = 0
+
+    @classmethod
+    def from_file(cls, path, use_mmap=False, **kwargs):
+        '''create a stream over the content of the file at path
+
+        Args:
+            path: the local file
+            use_mmap(bool): map the file in memory instead of reading it, which avoids
+                copying the content through the file buffers
+            kwargs: see UploadStream
+        '''
+        size = os.path.getsize(path)
+        fd = open(path, 'rb')
+        if use_mmap and size:
+            source = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+            def on_close():
+                '''unmap the file and close it'''
+                source.close()
+                fd.close()
+        else:
+            source, on_close = fd, fd.close
+        return cls(source, size, on_close=on_close, **kwargs)
+
+    @classmethod
+    def from_download(cls, download, spool_size=DEFAULT_SPOOL_SIZE, **kwargs):
+        '''create a stream over the content of a DownloadStream, to copy a file
+        from the server to the server
+
+        The content is passed through as it is read, unless the server did not send
+        its length; it is then spooled first, in memory up to spool_size bytes.
+        '''
+        if download.size is not None:
+            return cls(download, download.size, on_close=download.close, **kwargs)
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        for chunk in download:
+            spool.write(chunk)
+        download.close()
+        size = spool.tell()
+        spool.seek(0)
+        return cls(spool, size, on_close=spool.close, **kwargs)
+
+    @classmethod
+    def from_string(cls, content, **kwargs):
+        '''create a stream over the content of a string'''
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        return cls(content, len(content), **kwargs)
+
+    def __len__(self):
+        return self.size
+
+    def _report(self, force=False):
+        '''call the progress and throughput callbacks, at most every callback_interval'''
+        if not (self._progress or self._throughput):
+            return
+        now = time.time()
+        if not force and now - self._last_report < self._callback_interval:
+            return
+        if self.bytes_sent == self._last_reported_bytes:
+            return
+        self._last_report, self._last_reported_bytes = now, self.bytes_sent
+        if self._progress:
+            self._progress(self.bytes_sent, self.size)
+        if self._throughput:
+            elapsed = now - self._start
+            self._throughput(self.bytes_sent / elapsed if elapsed > 0 else 0.)
+
+    def read(self, size=-1):
+        '''read at most size bytes from the source, hashing them and reporting progress'''
+        if self._start is None:
+            self._start = time.time()
+        if size is None or size < 0:
+            size = self.size - self._offset
+
+        if hasattr(self._source, 'read') and not isinstance(self._source, mmap.mmap):
+            chunk = self._source.read(size)
+        else:
+            chunk = self._source[self._offset:self._offset + size]
+        self._offset += len(chunk)
+
+        if chunk:
+            if self._digest:
+                self._digest.update(chunk)
+            self.bytes_sent += len(chunk)
+        self._report(force=not chunk or self._offset >= self.size)
+        return chunk
+
+    def __iter__(self):
+        chunk = self.read(self.chunk_size)
+        while chunk:
+            yield chunk
+            chunk = self.read(self.chunk_size)
+
+    def hexdigest(self):
+        '''the hex digest of the content read so far, None without hash_algorithm'''
+        if self._digest:
+            return self._digest.hexdigest()
+        return None
+
+    def close(self):
+        '''release the source'''
+        if self._on_close:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CompressedUploadStream(UploadStream):
+    '''gzip compressed copy of the content of an UploadStream
+
+    The source stream is read (and so hashed) once, while its content is compressed
+    into memory, or into a temporary file when it grows past spool_size. The
+    compressed body has a known length, so it is sent like any other UploadStream.
+
+    Example:
+        >>> with UploadStream.from_file('/tmp/out.json') as stream:
+        ...     with CompressedUploadStream(stream) as body:
+        ...         print body.content_size, len(body)
+    '''
+    def __init__(self, stream, level=6, spool_size=DEFAULT_SPOOL_SIZE):
+        '''
+        Args:
+            stream(UploadStream): the content to compress
+            level(int): gzip compression level
+            spool_size(int): number of compressed bytes kept in memory
+        '''
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        compressor = gzip.GzipFile(fileobj=spool, mode='wb', compresslevel=level)
+        try:
+            for chunk in stream:
+                compressor.write(chunk)
+        finally:
+            compressor.close()
+        size = spool.tell()
+        spool.seek(0)
+        super(CompressedUploadStream, self).__init__(spool, size, stream.chunk_size,
+                                                     hash_algorithm=None,
+                                                     on_close=spool.close)
+        self.content_size = stream.size
+
+
+class RangeFile(object):
+    '''seekable, read-only, binary file-like object over content fetched by byte ranges
+
+    The content is fetched in blocks of block_size bytes, with one request per run of
+    consecutive blocks missing from the cache, which keeps the cache_blocks most
+    recently used blocks. When a read continues the previous one, read_ahead more
+    blocks are fetched with the same request; random reads fetch only what they need.
+
+    Example:
+        >>> with access.open_range(uuid, block_size=256 * 1024) as fd:
+        ...     fd.seek(-1024, os.SEEK_END)
+        ...     footer = fd.read()
+    '''
+    def __init__(self, fetch, size=None, block_size=DEFAULT_BLOCK_SIZE,
+                 cache_blocks=DEFAULT_CACHE_BLOCKS, read_ahead=DEFAULT_READ_AHEAD):
+        '''
+        Args:
+            fetch: called with (start, end), returns the content from byte start to byte
+                end (excluded), and the size of the whole content, None if unknown
+            size(int): the size of the content, learned from the first fetch if None
+            block_size(int): number of bytes fetched at a time
+            cache_blocks(int): number of blocks kept in memory
+            read_ahead(int): number of blocks fetched ahead of sequential reads
+        '''
+        self._fetch = fetch
+        self.size = size
+        self.block_size = block_size
+        self.cache_blocks = max(cache_blocks, 1)
+        self.read_ahead = read_ahead
+        self.closed = False
+        self._pos = 0
+        self._cache = OrderedDict()  # block index -> content
+        self._last_block = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def _last_index(self):
+        '''index of the last block, None if the size is not known'''
+        if self.size is None:
+            return None
+        return max(self.size - 1, 0) // self.block_size
+
+    def _load(self, first, last):
+        '''fetch the blocks first to last (included) with a single request
+
+        Returns: dictionary index -> content of the fetched blocks
+        '''
+        start, end = first * self.block_size, (last + 1) * self.block_size
+        data, total = self._fetch(start, end)
+        self.requests += 1
+        if total is not None:
+            self.size = total
+        elif len(data) < end - start:
+            self.size = start + len(data)
+
+        blocks = {}
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            blocks[index] = self._cache[index] = data[offset:offset + self.block_size]
+        while len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return blocks
+
+    def _read_ahead_end(self, last):
+        '''the last block to fetch when reading ahead of block last'''
+        end = last + self.read_ahead
+        if self.size is not None:
+            end = min(end, self._last_index())
+        for index in range(last + 1, end + 1):
+            if index in self._cache:
+                return index - 1
+        return max(end, last)
+
+    def _blocks(self, first, last):
+        '''dictionary index -> content of the blocks first to last (included)'''
+        blocks, missing = {}, []
+        for index in range(first, last + 1):
+            block = self._cache.pop(index, None)
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = self._cache[index] = block
+        self.hits += len(blocks)
+        self.misses += len(missing)
+
+        sequential = self._last_block is not None and first - self._last_block in (0, 1)
+        runs = itertools.groupby(enumerate(missing), key=lambda item: item[1] - item[0])
+        for _, run in runs:
+            run = [index for _, index in run]
+            run_last = run[-1]
+            if sequential and run_last == last:
+                run_last = self._read_ahead_end(last)
+            blocks.update(self._load(run[0], run_last))
+        self._last_block = last
+        return blocks
+
+    def _check(self):
+        '''raise if the file is closed'''
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+    def read(self, size=-1):
+        '''read at most size bytes, everything that is left if size is negative'''
+        with self._lock:
+            self._check()
+            pos = self._pos
+            end = sys.maxsize if size is None or size < 0 else pos + size
+            parts = []
+            while True:
+                if self.size is not None:
+                    end = min(end, self.size)
+                if pos >= end:
+                    break
+                first = pos // self.block_size
+                # when the end is not known, read block by block until a short one
+                last = first if end == sys.maxsize else (end - 1) // self.block_size
+                blocks = self._blocks(first, last)
+                for index in range(first, last + 1):
+                    offset = pos - index * self.block_size
+                    chunk = blocks[index][offset:offset + end - pos]
+                    if not chunk:
+                        end = pos
+                        break
+                    parts.append(chunk)
+                    pos += len(chunk)
+            self._pos = pos
+            return b''.join(parts)
+
+    def readinto(self, buf):
+        '''read into the writable buffer buf, return the number of bytes read'''
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        '''move to offset, relative to whence, and return the new position'''
+        with self._lock:
+            self._check()
+            if whence == os.SEEK_SET:
+                pos = offset
+            elif whence == os.SEEK_CUR:
+                pos = self._pos + offset
+            elif whence == os.SEEK_END:
+                if self.size is None:
+                    self._blocks(0, 0)
+                if self.size is None:
+                    raise IOError('the size of the content is not known')
+                pos = self.size + offset
+            else:
+                raise ValueError('invalid whence (%s)' % whence)
+            if pos < 0:
+                raise IOError('negative seek position %d' % pos)
+            self._pos = pos
+            return pos
+
+    def tell(self):
+        '''the current position'''
+        self._check()
+        return self._pos
+
+    @staticmethod
+    def readable():
+        '''the file can be read'''
+        return True
+
+    @staticmethod
+    def seekable():
+        '''the file can be seeked'''
+        return True
+
+    @staticmethod
+    def writable():
+        '''the file can not be written'''
+        return False
+
+    def stats(self):
+        '''dictionary of the block cache hits and misses, and the number of requests'''
+        return {'hits': self.hits, 'misses': self.misses, 'requests': self.requests}
+
+    def close(self):
+        '''drop the cached blocks'''
+        self.closed = True
+        self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
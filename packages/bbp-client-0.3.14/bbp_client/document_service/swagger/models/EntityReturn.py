@@ -23,6 +23,7 @@ class EntityReturn:
         self.swaggerTypes = {
             '_createdBy': 'str',
             '_createdOn': 'str',
+            '_modifiedOn': 'str',
             '_contentType': 'str',
             '_description': 'str',
             '_parent': 'str',
@@ -38,6 +39,8 @@ class EntityReturn:
         self._createdBy = None # str
         #Entity creation time
         self._createdOn = None # str
+        #Entity last modification time
+        self._modifiedOn = None # str
         #Content type of the entity
         self._contentType = None # str
         #Short description of the entity
@@ -0,0 +1,384 @@
+'''incremental synchronization between a local directory and a document service folder
+
+The two trees are compared file by file, and only the differences are transferred:
+
+- a file which exists on one side only is copied to the other one
+- a file which exists on both sides is in sync when the modification time of the
+  local file is the _modifiedOn of the entity. Otherwise the newer side wins, unless
+  the sizes (and digests, with a hash_algorithm) stored in the metadata of the entity
+  by the uploads show that the content is the same: only the local modification
+  time is updated then
+- with external links, a file is in sync when its entity points at it. A newer local
+  file is registered by pointing the link at it, while the entities holding uploaded
+  content are updated by uploading the local file, whatever the upload option
+
+Every transfer sets the modification time of the local file to the _modifiedOn of the
+entity, so the next sync finds the file in sync.
+
+A two-way sync cannot tell a deletion from a creation, so deletions are only done by
+one-way syncs: a push with delete removes the entities which do not exist locally, a
+pull with delete removes the local files which do not exist in the document service.
+'''
+import itertools
+import logging
+import mimetypes
+import os
+import shutil
+import time
+
+from collections import namedtuple
+
+from bbp_client.concurrency import run_bounded
+from bbp_client.document_service.access import CONTENT_SIZE_KEY, CONTENT_DIGEST_KEY
+from bbp_client.document_service.mirror import modified_timestamp
+from bbp_client.document_service.streams import file_digest
+
+# pylint: disable=W0212
+
+L = logging.getLogger(__name__)
+
+# directions of a sync
+BOTH = 'both'
+PUSH = 'push'
+PULL = 'pull'
+DIRECTIONS = (BOTH, PUSH, PULL)
+
+# kinds of SyncAction
+MKDIR_REMOTE = 'mkdir_remote'
+MKDIR_LOCAL = 'mkdir_local'
+UPLOAD = 'upload'
+LINK = 'link'
+RELINK = 'relink'
+DOWNLOAD = 'download'
+TOUCH = 'touch'
+DELETE_REMOTE = 'delete_remote'
+DELETE_LOCAL = 'delete_local'
+
+
+class SyncAction(namedtuple('SyncAction', 'kind local remote entity')):
+    '''an operation of a SyncPlan
+
+    kind: what is done, one of the kinds of this module
+    local: the local path
+    remote: the document service path
+    entity: the entity at remote, None if there is none
+    '''
+
+
+class SyncPlan(object):
+    '''the operations making a local directory and a document service folder match
+
+    actions: list of SyncAction, the parent folders before their content
+    conflicts: list of (local path, remote path, reason) which are left alone
+    '''
+    def __init__(self):
+        self.actions = []
+        self.conflicts = []
+
+    def add(self, kind, local, remote, entity=None):
+        '''add an action to the plan'''
+        self.actions.append(SyncAction(kind, local, remote, entity))
+
+    def counts(self):
+        '''dictionary kind -> number of actions of that kind'''
+        counts = {}
+        for action in self.actions:
+            counts[action.kind] = counts.get(action.kind, 0) + 1
+        return counts
+
+    def __len__(self):
+        return len(self.actions)
+
+
+class SyncSummary(namedtuple('SyncSummary', 'done failed conflicts elapsed')):
+    '''result of a sync
+
+    done: the SyncActions which were done
+    failed: list of (SyncAction, exception)
+    conflicts: the conflicts of the plan, see SyncPlan
+    elapsed: duration of the sync, in seconds
+    '''
+
+
+def _join(relative, name):
+    '''the relative path of name in the relative folder, with / separators'''
+    return name if relative == '.' else relative.replace(os.sep, '/') + '/' + name
+
+
+def _local_tree(local_dir):
+    '''dictionary relative path -> os.stat of the files, None for the folders below
+    local_dir; None if local_dir does not exist'''
+    if not os.path.isdir(local_dir):
+        return None
+    tree = {}
+    for dirpath, dirs, files in os.walk(local_dir):
+        relative = os.path.relpath(dirpath, local_dir)
+        for name in dirs:
+            tree[_join(relative, name)] = None
+        for name in files:
+            tree[_join(relative, name)] = os.stat(os.path.join(dirpath, name))
+    return tree
+
+
+def _remote_tree(access, ds_path, workers):
+    '''dictionary relative path -> entity of everything below ds_path; None if ds_path
+    does not exist'''
+    try:
+        walk = access.walk_entities(ds_path, workers)
+    except OSError:
+        return None
+    tree = {}
+    for dirpath, dirs, files in walk:
+        relative = os.path.relpath(dirpath, ds_path)
+        for entity in itertools.chain(dirs, files):
+            tree[_join(relative, entity._name)] = entity
+    return tree
+
+
+def _guess_type(path):
+    '''the mimetype of path, None if it is not known'''
+    mimetype, _ = mimetypes.guess_type(path)
+    return mimetype
+
+
+def _set_mtime(local_path, entity):
+    '''set the modification time of local_path to the _modifiedOn of entity'''
+    timestamp = modified_timestamp(entity)
+    if timestamp is not None:
+        os.utime(local_path, (timestamp, timestamp))
+
+
+def plan_sync(access, local_dir, ds_path, direction=BOTH, upload=False, delete=False,
+              hash_algorithm=None, workers=4):
+    '''compare local_dir and ds_path, and return the SyncPlan making them match
+
+    Args:
+        access(DocAccess): the document service access
+        local_dir: the local directory
+        ds_path: the folder in the document service
+        direction: BOTH, PUSH (local_dir to ds_path) or PULL (ds_path to local_dir)
+        upload(bool): upload the content of the local files, instead of registering
+            them as external links (or pointing the existing links at them)
+        delete(bool): with PUSH or PULL, delete what does not exist on the source side
+        hash_algorithm: when the modification times differ, compare the digest of
+            the local file with the one stored in the metadata of the entity
+        workers(int): number of concurrent listings and metadata lookups
+
+    Returns:
+        SyncPlan
+    '''
+    if direction not in DIRECTIONS:
+        raise ValueError('direction must be one of %s' % ', '.join(DIRECTIONS))
+    if delete and direction == BOTH:
+        raise ValueError('only one-way syncs can delete')
+    push, pull = direction != PULL, direction != PUSH
+
+    plan = SyncPlan()
+    local = _local_tree(local_dir)
+    remote = _remote_tree(access, ds_path, workers)
+    if local is None and remote is None:
+        raise OSError('Neither %s nor %s exist' % (local_dir, ds_path))
+    if local is None:
+        local = {}
+        if pull:
+            plan.add(MKDIR_LOCAL, local_dir, ds_path)
+    if remote is None:
+        remote = {}
+        if push:
+            plan.add(MKDIR_REMOTE, local_dir, ds_path)
+
+    skipped = set()  # the folders whose content is left alone
+    checks = []  # the transfers which may be avoided by comparing the digests
+    for relative in sorted(set(local) | set(remote)):
+        if relative.rpartition('/')[0] in skipped:
+            skipped.add(relative)
+            continue
+        local_path = os.path.join(local_dir, *relative.split('/'))
+        remote_path = ds_path.rstrip('/') + '/' + relative
+        stat, entity = local.get(relative), remote.get(relative)
+
+        if entity is None:
+            is_dir = stat is None
+            if push:
+                plan.add(MKDIR_REMOTE if is_dir else (UPLOAD if upload else LINK),
+                         local_path, remote_path)
+            elif delete:
+                plan.add(DELETE_LOCAL, local_path, remote_path)
+                skipped.add(relative)
+            continue
+
+        if relative not in local:
+            is_dir = not access.isfile(entity)
+            if pull:
+                plan.add(MKDIR_LOCAL if is_dir else DOWNLOAD, local_path, remote_path, entity)
+            elif delete:
+                plan.add(DELETE_REMOTE, local_path, remote_path, entity)
+                skipped.add(relative)
+            continue
+
+        if (stat is None) != (not access.isfile(entity)):
+            plan.conflicts.append((local_path, remote_path,
+                                   'a folder on one side and a file on the other'))
+            skipped.add(relative)
+            continue
+        if stat is None:
+            continue
+
+        if entity._contentUri == os.path.abspath(local_path):
+            continue  # an external link to the local file
+        local_time, remote_time = int(stat.st_mtime), modified_timestamp(entity)
+        if local_time == remote_time:
+            continue
+        local_newer = remote_time is None or local_time > remote_time
+
+        if direction == BOTH:
+            kind = UPLOAD if local_newer else DOWNLOAD
+        else:
+            kind = UPLOAD if push else DOWNLOAD
+        if kind == UPLOAD and not upload and entity._contentUri:
+            # an external link to another file
+            if local_newer:
+                plan.add(RELINK, local_path, remote_path, entity)
+            else:
+                L.debug('%s links to %s, newer than %s, left alone', remote_path,
+                        entity._contentUri, local_path)
+            continue
+        if hash_algorithm:
+            checks.append((SyncAction(kind, local_path, remote_path, entity), stat))
+        else:
+            plan.add(kind, local_path, remote_path, entity)
+
+    def same_content(check):
+        '''does the metadata of the entity record the content of the local file'''
+        action, stat = check
+        stored = access.get_metadata_by_id(action.entity._uuid)
+        if stored.get(CONTENT_SIZE_KEY) != str(stat.st_size):
+            return False
+        digest = file_digest(action.local, hash_algorithm).hexdigest()
+        return stored.get(CONTENT_DIGEST_KEY) == '%s:%s' % (hash_algorithm, digest)
+
+    for (action, _), same, error in run_bounded(same_content, checks, workers):
+        if error is not None:
+            L.debug('Could not compare %s and %s: %s', action.local, action.remote, error)
+        plan.add(TOUCH if same else action.kind, action.local, action.remote, action.entity)
+
+    return plan
+
+
+def _run_action(access, action, hash_algorithm):
+    '''do a single action of a plan, other than the creation of folders'''
+    kind = action.kind
+    if kind == UPLOAD:
+        _uuid = access.upload_file_tracked(action.local, action.remote,
+                                           _guess_type(action.local), None, action.entity,
+                                           hash_algorithm=hash_algorithm)
+        _set_mtime(action.local, access.get_standard_attr_by_id(_uuid))
+    elif kind == LINK:
+        access.create_external_link(os.path.abspath(action.local), action.remote, None,
+                                    _guess_type(action.local))
+    elif kind == RELINK:
+        access.set_standard_attr(action.remote, {'_contentUri': os.path.abspath(action.local)})
+    elif kind == DOWNLOAD:
+        access.download_file_by_id(action.entity._uuid, action.local)
+        _set_mtime(action.local, action.entity)
+    elif kind == TOUCH:
+        _set_mtime(action.local, action.entity)
+    elif kind == DELETE_REMOTE:
+        _, errors = access.rmtree(action.remote)
+        if errors:
+            raise errors.values()[0]
+    elif kind == DELETE_LOCAL:
+        if os.path.isdir(action.local):
+            shutil.rmtree(action.local)
+        else:
+            os.remove(action.local)
+    else:
+        raise ValueError('Unknown action %s' % kind)
+
+
+def execute(access, plan, hash_algorithm=None, workers=4):
+    '''do the actions of plan
+
+    The remote folders are created level by level, then the other actions are done
+    concurrently. The actions below a folder which could not be created fail.
+
+    Args:
+        access(DocAccess): the document service access
+        plan(SyncPlan): the plan to execute
+        hash_algorithm: digest stored in the metadata of the uploaded files
+        workers(int): number of concurrent actions
+
+    Returns:
+        SyncSummary
+    '''
+    start = time.time()
+    done, failed = [], []
+    missing = set()  # the folders which could not be created
+
+    def blocked(action):
+        '''fail action if its parent folder could not be created'''
+        if os.path.dirname(action.remote) in missing:
+            failed.append((action, OSError('The parent of %s could not be created' %
+                                           action.remote)))
+            if action.kind in (MKDIR_REMOTE, MKDIR_LOCAL):
+                missing.add(action.remote)  # so its content is blocked too
+            return True
+        return False
+
+    def account(action, error):
+        '''record the outcome of action'''
+        if error is None:
+            L.debug('%s %s <-> %s', action.kind, action.local, action.remote)
+            done.append(action)
+        else:
+            L.error('Failed to %s %s <-> %s: %s', action.kind, action.local, action.remote,
+                    error)
+            failed.append((action, error))
+            if action.kind in (MKDIR_REMOTE, MKDIR_LOCAL):
+                missing.add(action.remote)
+
+    def mkdir_remote(action):
+        '''create a remote folder'''
+        access.mkdir(action.remote)
+
+    mkdirs = sorted((a for a in plan.actions if a.kind == MKDIR_REMOTE),
+                    key=lambda a: a.remote.count('/'))
+    for _, level in itertools.groupby(mkdirs, key=lambda a: a.remote.count('/')):
+        level = [a for a in level if not blocked(a)]
+        for action, _, error in run_bounded(mkdir_remote, level, workers):
+            account(action, error)
+
+    for action in plan.actions:
+        if action.kind == MKDIR_LOCAL and not blocked(action):
+            try:
+                if not os.path.isdir(action.local):
+                    os.makedirs(action.local)
+                account(action, None)
+            except OSError as e:
+                account(action, e)
+
+    others = [a for a in plan.actions if a.kind not in (MKDIR_REMOTE, MKDIR_LOCAL)]
+    others = [a for a in others if not blocked(a)]
+    for action, _, error in run_bounded(lambda a: _run_action(access, a, hash_algorithm),
+                                        others, workers):
+        account(action, error)
+
+    return SyncSummary(done, failed, plan.conflicts, time.time() - start)
+
+
+def sync(access, local_dir, ds_path, direction=BOTH, upload=False, delete=False,
+         hash_algorithm=None, workers=4, plan=None):
+    '''make local_dir and ds_path match, transferring only what changed
+
+    Args:
+        see plan_sync
+        plan(SyncPlan): the plan to execute, computed with plan_sync if None
+
+    Returns:
+        SyncSummary
+    '''
+    if plan is None:
+        plan = plan_sync(access, local_dir, ds_path, direction, upload, delete,
+                         hash_algorithm, workers)
+    L.debug('Sync plan: %s', plan.counts())
+    return execute(access, plan, hash_algorithm, workers)
@@ -0,0 +1,59 @@
+from bbp_client.document_service.swagger.models.EntityReturn import EntityReturn
+
+HOST = 'http://localhost:8888/'
+
+
+def make_entity(name, uuid, entity_type='folder', parent='None', content_type=None,
+                content_uri=None):
+    e = EntityReturn()
+    e._name = name
+    e._uuid = uuid
+    e._entityType = entity_type
+    e._parent = parent
+    e._contentType = content_type
+    e._contentUri = content_uri
+    return e
+
+
+def entity_dict(name, uuid, entity_type='folder', parent='None', **kwargs):
+    d = {'_name': name, '_uuid': uuid, '_entityType': entity_type, '_parent': parent}
+    d.update(kwargs)
+    return d
+
+
+class FakeTree(object):
+    '''in memory tree of entities, to replace the server side lookups of DocAccess'''
+    def __init__(self, paths):
+        '''paths: iterable of paths, the ones ending with / are folders'''
+        self.entities = {}
+        self.children = {}
+        for i, path in enumerate(sorted(paths)):
+            is_dir = path.endswith('/')
+            path = path.rstrip('/')
+            parent_path, name = path.rsplit('/', 1)
+            parent = self.entities.get(parent_path or '/')
+            if parent is None:
+                entity_type = 'project'
+            else:
+                entity_type = 'folder' if is_dir else 'file'
+            entity = make_entity(name, 'uuid%d' % i, entity_type,
+                                 parent._uuid if parent else 'None')
+            self.entities[path] = entity
+            self.children.setdefault(entity._uuid, [])
+            self.children.setdefault(parent._uuid if parent else Ellipsis, []).append(entity)
+        self.lookups = []
+
+    def get_entity_by_path(self, path):
+        self.lookups.append(path)
+        if path == '/':
+            from bbp_client.document_service.access import DocAccess
+            return DocAccess.RootEntity()
+        return self.entities.get(path)
+
+    def get_children(self, entity):
+        return list(self.children[entity._uuid])
+
+    def install(self, access):
+        access._get_entity_by_path = self.get_entity_by_path
+        access._get_children = self.get_children
+        return access
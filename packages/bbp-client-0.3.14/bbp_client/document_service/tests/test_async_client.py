@@ -0,0 +1,67 @@
+import threading
+import time
+
+from nose.tools import ok_, eq_, assert_raises
+from mock import Mock, patch
+
+from bbp_client.document_service import async_client
+from bbp_client.document_service.async_client import AsyncDocClient, gather
+
+
+class SlowClient(object):
+    '''records the maximum number of concurrent calls'''
+    def __init__(self, host):
+        self._access = Mock(host=host)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def get_metadata_by_id(self, _id):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        if _id == 'bad':
+            raise ValueError('bad id')
+        return {'id': _id}
+
+
+@patch.object(async_client, 'HOST_LIMITS', async_client.HostLimits())
+@patch.object(async_client, 'transport', Mock())
+class TestAsyncDocClient(object):
+    def test_gather(self):
+        with AsyncDocClient(SlowClient('http://host0'), workers=4) as adc:
+            futures = [adc.get_metadata_by_id('u%d' % i) for i in range(20)]
+            eq_(gather(futures), [{'id': 'u%d' % i} for i in range(20)])
+
+    def test_host_limit(self):
+        client = SlowClient('http://host1')
+        with AsyncDocClient(client, workers=8, host_limit=2) as adc0:
+            with AsyncDocClient(client, workers=8) as adc1:
+                futures = [adc.get_metadata_by_id('u%d' % i)
+                           for i in range(10) for adc in (adc0, adc1)]
+                gather(futures)
+        eq_(client.max_running, 2)
+
+    def test_errors(self):
+        with AsyncDocClient(SlowClient('http://host2'), workers=2) as adc:
+            good, bad = adc.get_metadata_by_id('u0'), adc.get_metadata_by_id('bad')
+            assert_raises(ValueError, bad.get)
+            ok_(not bad.successful())
+            eq_(good.get(), {'id': 'u0'})
+
+    def test_walk(self):
+        client = SlowClient('http://host3')
+        client.walk = Mock(return_value=iter([('/p', [], ['f'])]))
+        with AsyncDocClient(client, workers=2) as adc:
+            eq_(adc.walk('/p').get(), [('/p', [], ['f'])])
+
+
+@patch.object(async_client, 'HOST_LIMITS', async_client.HostLimits())
+def test_custom_transport():
+    with patch.object(async_client.transport, 'get_transport',
+                      Mock(return_value=Mock(spec=['request']))):
+        with AsyncDocClient(SlowClient('http://host4'), workers=2) as adc:
+            eq_(adc.get_metadata_by_id('u0').get(), {'id': 'u0'})
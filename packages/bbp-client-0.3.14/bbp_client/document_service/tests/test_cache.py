@@ -0,0 +1,236 @@
+from nose.tools import ok_, eq_
+from mock import Mock, patch
+
+from bbp_client.document_service import access
+from bbp_client.document_service.cache import EntityCache, MissingPaths
+from bbp_client.document_service.tests.data import HOST, make_entity, entity_dict
+
+
+def test_put_get():
+    cache = EntityCache()
+    proj = make_entity('proj', 'p1', 'project')
+    cache.put('/proj', proj)
+    eq_(cache.get('/proj'), proj)
+    eq_(cache.get('/other'), None)
+    eq_(cache.path_of('p1'), '/proj')
+    stats = cache.stats()
+    eq_(stats['hits'], 1)
+    eq_(stats['misses'], 1)
+
+
+def test_expire():
+    cache = EntityCache(max_age=10)
+    cache.put('/proj', make_entity('proj', 'p1', 'project'))
+    with patch('bbp_client.document_service.cache.time') as mock_time:
+        mock_time.time.return_value = 1e12
+        eq_(cache.get('/proj'), None)
+
+
+def test_lru_eviction():
+    cache = EntityCache(max_entities=2)
+    cache.put('/a', make_entity('a', 'a'))
+    cache.put('/b', make_entity('b', 'b'))
+    cache.get('/a')
+    cache.put('/c', make_entity('c', 'c'))
+    ok_(cache.get('/a') is not None)
+    eq_(cache.get('/b'), None)
+    eq_(cache.path_of('b'), None)
+    eq_(cache.stats()['evictions'], 1)
+
+
+def test_invalidate_subtree():
+    cache = EntityCache()
+    cache.put('/a', make_entity('a', 'a'))
+    cache.put('/a/b', make_entity('b', 'b', parent='a'))
+    cache.put('/ab', make_entity('ab', 'ab'))
+    cache.put_children('a', [make_entity('b', 'b', parent='a')])
+    cache.invalidate('/a')
+    eq_(cache.get('/a'), None)
+    eq_(cache.get('/a/b'), None)
+    eq_(cache.get_children('a'), None)
+    ok_(cache.get('/ab') is not None)
+
+
+def test_invalidate_uncached_parents():
+    cache = EntityCache()
+    cache.put('/p/a/b/c', make_entity('c', 'c'))
+    cache.put('/p/a/d', make_entity('d', 'd'))
+    cache.put('/p/e', make_entity('e', 'e'))
+    cache.invalidate('/p/a/')
+    eq_(cache.get('/p/a/b/c'), None)
+    eq_(cache.get('/p/a/d'), None)
+    ok_(cache.get('/p/e') is not None)
+    cache.invalidate('/p/e')
+    # the index does not keep the paths without entries
+    eq_(len(cache._index), 0)
+
+
+def test_index_follows_evictions():
+    cache = EntityCache(max_entities=2)
+    for name in ('a', 'b', 'c'):
+        cache.put('/p/%s/f' % name, make_entity('f', name))
+    eq_(sorted(cache._index._children['/p']), ['/p/b', '/p/c'])
+    cache.invalidate('/p')
+    eq_(cache.stats()['entities'], 0)
+
+
+mock_requests = Mock()
+@patch('bbp_client.document_service.access.transport', mock_requests)
+class TestDocAccessCache(object):
+    def setUp(self):
+        mock_requests.reset_mock()
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.get.return_value.json.return_value = entity_dict('proj', 'p1', 'project')
+        self.access = access.DocAccess(HOST, cache_enabled=True)
+
+    def test_exists_cached(self):
+        ok_(self.access.exists('/proj'))
+        ok_(self.access.exists('/proj'))
+        eq_(mock_requests.get.call_count, 1)
+
+    def test_listing_cached(self):
+        ret = Mock(hasMore=False, result=[make_entity('f', 'f1', 'folder', parent='p1')])
+        self.access._project.get_entity_children = Mock(return_value=ret)
+        eq_(self.access.listdir('/proj'), ['f'])
+        eq_(self.access.listdir('/proj'), ['f'])
+        eq_(self.access._project.get_entity_children.call_count, 1)
+        # the children are cached by path too
+        ok_(self.access.exists('/proj/f'))
+        eq_(mock_requests.get.call_count, 1)
+
+    def test_mkdir_invalidates_listing(self):
+        ret = Mock(hasMore=False, result=[])
+        self.access._project.get_entity_children = Mock(return_value=ret)
+        eq_(self.access.listdir('/proj'), [])
+        self.access._folder.create_folder = Mock(
+            return_value=make_entity('new', 'n1', 'folder', parent='p1'))
+        self.access.mkdir('/proj/new')
+        ret.result = [make_entity('new', 'n1', 'folder', parent='p1')]
+        eq_(self.access.listdir('/proj'), ['new'])
+        ok_(self.access.exists('/proj/new'))
+        eq_(mock_requests.get.call_count, 1)
+
+    def test_remove_invalidates(self):
+        mock_requests.get.return_value.json.return_value = entity_dict('f', 'f1', 'file', 'p1')
+        self.access._file.delete_file = Mock()
+        ok_(self.access.exists('/proj/f'))
+        self.access.remove('/proj/f')
+        mock_requests.get.return_value.status_code = 404
+        ok_(not self.access.exists('/proj/f'))
+
+    def test_cache_disabled(self):
+        no_cache = access.DocAccess(HOST)
+        ok_(no_cache.exists('/proj'))
+        ok_(no_cache.exists('/proj'))
+        eq_(mock_requests.get.call_count, 2)
+
+
+@patch('bbp_client.document_service.access.transport')
+def test_concurrent_lookups_coalesced(transport):
+    import threading
+    release = threading.Event()
+
+    def get(*args, **kwargs):
+        release.wait()
+        return Mock(status_code=200, json=Mock(return_value=entity_dict('proj', 'p1', 'project')))
+    transport.get.side_effect = get
+
+    doc = access.DocAccess(HOST)
+    found = []
+    threads = [threading.Thread(target=lambda: found.append(doc.exists('/proj')))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    while doc.inflight.stats()['coalesced'] < 3:
+        release.wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    eq_(found, [True] * 4)
+    eq_(transport.get.call_count, 1)
+
+
+def test_missing_paths():
+    missing = MissingPaths(ttl=10)
+    ok_(not missing.contains('/proj/a'))
+    missing.add('/proj/a', missing.generation)
+    missing.add('/proj/a/b', missing.generation)
+    missing.add('/proj/c', missing.generation)
+    ok_(missing.contains('/proj/a'))
+    missing.discard('/proj/a', subtree=True)
+    ok_(not missing.contains('/proj/a'))
+    ok_(not missing.contains('/proj/a/b'))
+    ok_(missing.contains('/proj/c'))
+    with patch('bbp_client.document_service.cache.time') as mock_time:
+        mock_time.time.return_value = 1e12
+        ok_(not missing.contains('/proj/c'))
+    eq_(missing.stats(), {'hits': 2, 'paths': 0})
+
+
+def test_missing_paths_subtree():
+    missing = MissingPaths()
+    for path in ('/proj/a', '/proj/a/b/c', '/proj/ab', '/proj/d'):
+        missing.add(path, missing.generation)
+    missing.discard('/proj/a/', subtree=True)
+    ok_(not missing.contains('/proj/a/b/c'))
+    ok_(missing.contains('/proj/ab'))
+    missing.discard('/proj/d')
+    ok_(missing.contains('/proj/ab'))
+    missing.discard('/proj/ab')
+    eq_(len(missing._index), 0)
+
+
+def test_missing_paths_stale_lookup():
+    missing = MissingPaths()
+    generation = missing.generation
+    # created while the lookup was in flight
+    missing.discard('/proj/a')
+    missing.add('/proj/a', generation)
+    ok_(not missing.contains('/proj/a'))
+
+
+@patch('bbp_client.document_service.access.transport')
+class TestMissingPaths(object):
+    def setUp(self):
+        self.access = access.DocAccess(HOST, negative_ttl=access.DEFAULT_NEGATIVE_TTL)
+
+    def test_exists_remembered(self, transport):
+        transport.get.return_value.status_code = 404
+        ok_(not self.access.exists('/proj/a'))
+        ok_(not self.access.exists('/proj/a'))
+        eq_(transport.get.call_count, 1)
+
+    def test_mkdir_forgets(self, transport):
+        transport.get.return_value.status_code = 404
+        ok_(not self.access.exists('/proj/a'))
+        self.access._get_parent = Mock(return_value=make_entity('proj', 'p1', 'project'))
+        self.access._folder.create_folder = Mock(
+            return_value=make_entity('a', 'a1', 'folder', parent='p1'))
+        self.access.mkdir('/proj/a')
+        transport.get.return_value.status_code = 200
+        transport.get.return_value.json.return_value = entity_dict('a', 'a1', 'folder', 'p1')
+        ok_(self.access.exists('/proj/a'))
+
+    def test_placeholder_forgets(self, transport):
+        transport.get.return_value.status_code = 404
+        ok_(not self.access.exists('/proj/f'))
+        self.access._get_parent = Mock(return_value=make_entity('proj', 'p1', 'project'))
+        self.access._file.create_file = Mock(
+            return_value=make_entity('f', 'f1', 'file', parent='p1'))
+        self.access.create_external_link('/gpfs/f', '/proj/f', None)
+        ok_(not self.access.missing.contains('/proj/f'))
+
+    def test_disabled(self, transport):
+        transport.get.return_value.status_code = 404
+        no_negative = access.DocAccess(HOST)
+        ok_(not no_negative.exists('/proj/a'))
+        ok_(not no_negative.exists('/proj/a'))
+        eq_(transport.get.call_count, 2)
+
+    def test_transient_error_not_remembered(self, transport):
+        transport.get.side_effect = [
+            Mock(status_code=503),
+            Mock(status_code=200, json=Mock(return_value=entity_dict('a', 'a1', 'folder')))]
+        ok_(not self.access.exists('/proj/a'))
+        ok_(self.access.exists('/proj/a'))
+        eq_(transport.get.call_count, 2)
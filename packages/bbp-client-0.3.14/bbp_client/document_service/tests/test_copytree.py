@@ -0,0 +1,127 @@
+import itertools
+import threading
+from urllib2 import HTTPError
+from StringIO import StringIO
+
+from nose.tools import ok_, eq_, raises
+from mock import Mock
+
+from bbp_client.swagger_helpers import SwaggerException
+from bbp_client.document_service.client import Client
+from bbp_client.document_service.streams import DownloadStream
+from bbp_client.document_service.tests.data import HOST, FakeTree, make_entity
+
+TREE = ['/proj/',
+        '/proj/run/',
+        '/proj/run/a.txt',
+        '/proj/run/link.h5',
+        '/proj/run/sub/',
+        '/proj/run/sub/b.txt',
+        '/proj/run/sub/deep/',
+        '/proj/run/empty/',
+        '/other/',
+        ]
+
+
+class TestCopytree(object):
+    def setUp(self):
+        self.tree = FakeTree(TREE)
+        self.client = Client(HOST)
+        self.access = self.tree.install(self.client._access)
+        self.tree.entities['/proj/run/link.h5']._contentUri = '/gpfs/link.h5'
+        self.tree.entities['/proj/run/link.h5']._contentType = 'application/x-hdf5'
+        self.tree.entities['/proj/run/sub']._description = 'the sub folder'
+        self.contents = {self.tree.entities['/proj/run/a.txt']._uuid: 'content of a',
+                         self.tree.entities['/proj/run/sub/b.txt']._uuid: 'content of b'}
+        self.metadata = {self.tree.entities['/proj/run/a.txt']._uuid: {'k': 'v'}}
+
+        self.lock = threading.Lock()
+        self.created = {}  # name -> post body
+        self.uploaded = {}  # uuid -> content
+        self.fail = set()
+        ids = itertools.count()
+
+        def create(body):
+            if body._name in self.fail:
+                raise HTTPError(body._name, 500, 'Internal Error', {}, StringIO('{}'))
+            with self.lock:
+                self.created[body._name] = body
+                return make_entity(body._name, 'new%d' % next(ids), 'folder',
+                                   getattr(body, '_parent', 'None'))
+        self.access._project.create_project = Mock(side_effect=create)
+        self.access._folder.create_folder = Mock(side_effect=create)
+        self.access._file.create_file = Mock(side_effect=create)
+
+        def open_download(_uuid):
+            content = self.contents[_uuid]
+            resp = Mock(headers={'Content-Length': str(len(content))})
+            resp.iter_content.return_value = iter([content])
+            return DownloadStream(resp)
+        self.access.open_download = Mock(side_effect=open_download)
+
+        def upload(content, dst, mimetype, st_attr, entity, parent):
+            eq_(dst, None)
+            with self.lock:
+                self.uploaded[entity._uuid] = content.read()
+            return entity._uuid
+        self.access._upload_content = Mock(side_effect=upload)
+        self.access._get_metadata = Mock(
+            side_effect=lambda e: dict(self.metadata.get(e._uuid, {})))
+        self.access._set_metadata = Mock(
+            side_effect=lambda e, m: self.metadata.setdefault(e._uuid, {}).update(m))
+
+    def test_copytree(self):
+        for workers in (1, 4):
+            self.setUp()
+            copies, errors = self.client.copytree('/proj/run', '/other/copy', workers=workers)
+            eq_(errors, {})
+            eq_(sorted(copies), sorted(p.rstrip('/') for p in TREE
+                                       if p.startswith('/proj/run')))
+            eq_(sorted(self.created), ['a.txt', 'b.txt', 'copy', 'deep', 'empty', 'link.h5',
+                                       'sub'])
+            eq_(self.created['copy']._parent, self.tree.entities['/other']._uuid)
+
+            # the link points at the same content, nothing is transferred
+            link = self.created['link.h5']
+            eq_((link._contentUri, link._contentType), ('/gpfs/link.h5', 'application/x-hdf5'))
+            eq_(sorted(self.uploaded.values()), ['content of a', 'content of b'])
+            eq_(self.uploaded[copies['/proj/run/a.txt']], 'content of a')
+
+            eq_(self.created['sub']._description, 'the sub folder')
+            eq_(self.created['b.txt']._parent, copies['/proj/run/sub'])
+            eq_(self.metadata[copies['/proj/run/a.txt']], {'k': 'v'})
+
+    def test_copy_project(self):
+        copies, errors = self.client.copytree('/proj', '/proj2')
+        eq_(errors, {})
+        eq_(len(copies), 8)
+        eq_(self.access._project.create_project.call_count, 1)
+
+    def test_no_metadata(self):
+        self.client.copytree('/proj/run', '/other/copy', metadata=False)
+        ok_(not self.access._get_metadata.called)
+
+    def test_failure_skips_below(self):
+        self.fail.add('sub')
+        copies, errors = self.client.copytree('/proj/run', '/other/copy', workers=3)
+        eq_(sorted(errors), ['/proj/run/sub', '/proj/run/sub/b.txt', '/proj/run/sub/deep'])
+        ok_(isinstance(errors['/proj/run/sub'], SwaggerException))
+        ok_(isinstance(errors['/proj/run/sub/deep'], OSError))
+        eq_(sorted(copies), ['/proj/run', '/proj/run/a.txt', '/proj/run/empty',
+                             '/proj/run/link.h5'])
+
+    @raises(OSError)
+    def test_missing(self):
+        self.client.copytree('/proj/missing', '/other/copy')
+
+    @raises(OSError)
+    def test_existing_destination(self):
+        self.client.copytree('/proj/run', '/other')
+
+    @raises(OSError)
+    def test_into_itself(self):
+        self.client.copytree('/proj/run', '/proj/run/sub/copy')
+
+    @raises(OSError)
+    def test_file(self):
+        self.client.copytree('/proj/run/a.txt', '/other/copy')
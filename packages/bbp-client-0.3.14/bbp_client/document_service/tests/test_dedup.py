@@ -0,0 +1,107 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from nose.tools import ok_, eq_, raises
+from mock import Mock, patch
+
+from bbp_client.document_service import access
+from bbp_client.document_service.client import Client
+from bbp_client.document_service.tests.data import HOST, make_entity
+
+CONTENT = 'some simulation results\n' * 100
+DIGEST = 'md5:' + hashlib.md5(CONTENT).hexdigest()
+
+mock_transport = Mock()
+
+
+@patch('bbp_client.document_service.access.transport', mock_transport)
+class TestDedupUpload(object):
+    def setUp(self):
+        mock_transport.reset_mock()
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'results.txt')
+        with open(self.src, 'wb') as fd:
+            fd.write(CONTENT)
+
+        self.client = Client(HOST)
+        self.access = self.client._access
+        self.existing = None
+        self.metadata = {}
+        self.access._get_entity_by_path = lambda path: self.existing
+        self.access._get_parent = Mock(return_value=make_entity('proj', 'p1', 'project'))
+        self.access._file.create_file = Mock(return_value=make_entity('results.txt', 'f1',
+                                                                      'file', 'p1'))
+        self.access._file.get_metadata = Mock(
+            side_effect=lambda _id: dict(self.metadata.get(_id, {})))
+        self.access._file.add_metadata = Mock(
+            side_effect=lambda _id, m: self.metadata.setdefault(_id, {}).update(m))
+
+        self.sent = []
+
+        def post(url, headers, data):
+            self.sent.append((url, data.read() if hasattr(data, 'read') else data))
+            return Mock(status_code=201, text='{"_uuid": "f1", "_name": "results.txt"}')
+        mock_transport.post.side_effect = post
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_new_file(self):
+        eq_(self.client.upload_file_dedup(self.src, '/proj/results.txt'), ('f1', False))
+        eq_([c for _, c in self.sent], [CONTENT])
+        eq_(self.metadata, {'f1': {access.CONTENT_SIZE_KEY: str(len(CONTENT)),
+                                   access.CONTENT_DIGEST_KEY: DIGEST}})
+
+    def test_same_content_skipped(self):
+        self.existing = make_entity('results.txt', 'f0', 'file', 'p1')
+        self.metadata = {'f0': {access.CONTENT_SIZE_KEY: str(len(CONTENT)),
+                                access.CONTENT_DIGEST_KEY: DIGEST}}
+        eq_(self.client.upload_file_dedup(self.src, '/proj/results.txt'), ('f0', True))
+        eq_(self.sent, [])
+        ok_(not self.access._file.create_file.called)
+
+    def test_changed_content_overwritten(self):
+        self.existing = make_entity('results.txt', 'f0', 'file', 'p1')
+        self.metadata = {'f0': {access.CONTENT_SIZE_KEY: str(len(CONTENT)),
+                                access.CONTENT_DIGEST_KEY: 'md5:' + '0' * 32}}
+        eq_(self.client.upload_file_dedup(self.src, '/proj/results.txt'), ('f1', False))
+        ok_(not self.access._file.create_file.called)
+        eq_(len(self.sent), 1)
+        ok_('/f0/' in self.sent[0][0])
+        eq_(self.metadata['f1'][access.CONTENT_DIGEST_KEY], DIGEST)
+
+    def test_other_size_not_hashed(self):
+        self.existing = make_entity('results.txt', 'f0', 'file', 'p1')
+        self.metadata = {'f0': {access.CONTENT_SIZE_KEY: '1', access.CONTENT_DIGEST_KEY: DIGEST}}
+        with patch('bbp_client.document_service.access.file_digest') as file_digest:
+            eq_(self.client.upload_file_dedup(self.src, '/proj/results.txt')[1], False)
+        ok_(not file_digest.called)
+
+    def test_sha1(self):
+        self.client.upload_file_dedup(self.src, '/proj/results.txt', hash_algorithm='sha1')
+        eq_(self.metadata['f1'][access.CONTENT_DIGEST_KEY],
+            'sha1:' + hashlib.sha1(CONTENT).hexdigest())
+
+    @raises(OSError)
+    def test_folder_not_overwritten(self):
+        self.existing = make_entity('results.txt', 'd0', 'folder', 'p1')
+        self.client.upload_file_dedup(self.src, '/proj/results.txt')
+
+    def test_upload_files(self):
+        other = os.path.join(self.tmp, 'other.txt')
+        with open(other, 'wb') as fd:
+            fd.write('other')
+        self.metadata = {'f0': {access.CONTENT_SIZE_KEY: str(len(CONTENT)),
+                                access.CONTENT_DIGEST_KEY: DIGEST}}
+        self.access._get_entity_by_path = lambda path: (
+            make_entity('results.txt', 'f0', 'file', 'p1') if path.endswith('results.txt')
+            else None)
+
+        uploaded, skipped, errors = self.client.upload_files(
+            [(self.src, '/proj/results.txt'), (other, '/proj/other.txt'),
+             (os.path.join(self.tmp, 'missing'), '/proj/missing')], workers=2)
+        eq_(uploaded, {'/proj/other.txt': 'f1'})
+        eq_(skipped, {'/proj/results.txt': 'f0'})
+        eq_(errors.keys(), ['/proj/missing'])
@@ -0,0 +1,199 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from nose.tools import ok_, eq_, assert_raises
+from mock import Mock
+
+from bbp_client.document_service.utils import doc_import
+from bbp_client.document_service.utils.import_journal import ImportJournal
+
+
+class FakeDSClient(object):
+    '''records the calls made by doc_import'''
+    def __init__(self, existing=()):
+        self.lock = threading.Lock()
+        self.folders = list(existing)
+        self.links = []
+        self.metadata = {}
+
+    def mkdir(self, path, ignore_error=False):
+        with self.lock:
+            assert os.path.dirname(path) in self.folders + ['/'], 'parent of %s missing' % path
+            if path in self.folders:
+                return None
+            self.folders.append(path)
+            return 'uuid:' + path
+
+    def create_external_link(self, src, dst, st_attr):
+        with self.lock:
+            self.links.append((src, dst))
+        return 'uuid:' + dst
+
+    def listdir(self, path):
+        with self.lock:
+            return [os.path.basename(p) for p in self.folders + [l[1] for l in self.links]
+                    if os.path.dirname(p) == path]
+
+    def set_metadata_by_id(self, uuid, metadata):
+        self.metadata[uuid] = metadata
+
+    def bulk_create_external_links(self, files, dst_folder):
+        with self.lock:
+            assert dst_folder in self.folders, 'folder %s missing' % dst_folder
+            self.links.extend((f['external_path'], os.path.join(dst_folder, name))
+                              for name, f in files.items())
+        return dict((name, 'uuid:' + os.path.join(dst_folder, name)) for name in files)
+
+
+def test_folder_creator_once():
+    client = FakeDSClient()
+    client.mkdir = Mock(side_effect=client.mkdir)
+    folders = doc_import.FolderCreator(client)
+    threads = [threading.Thread(target=folders.makedirs, args=('/proj/a/b/c', ))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    folders.makedirs('/proj/a/d')
+    eq_(client.folders, ['/proj', '/proj/a', '/proj/a/b', '/proj/a/b/c', '/proj/a/d'])
+    eq_(client.mkdir.call_count, 5)
+
+
+def test_folder_creator_mkdir_existing():
+    folders = doc_import.FolderCreator(FakeDSClient(existing=['/proj']))
+    eq_(folders.mkdir('/proj/new'), 'uuid:/proj/new')
+    assert_raises(OSError, folders.mkdir, '/proj')
+
+
+def test_folder_creator_failed_parent():
+    client = FakeDSClient(existing=['/proj'])
+    created = client.mkdir
+
+    def mkdir(path, ignore_error=False):
+        if path == '/proj/a':
+            time.sleep(0.05)  # the other threads wait for it
+            raise OSError('no permission')
+        return created(path, ignore_error)
+    client.mkdir = Mock(side_effect=mkdir)
+    folders = doc_import.FolderCreator(client)
+    errors = []
+
+    def makedirs(path):
+        try:
+            folders.makedirs(path)
+        except OSError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=makedirs, args=('/proj/a/%d' % i, )) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    eq_(len(errors), 4)
+    assert_raises(OSError, folders.mkdir, '/proj/a/b')
+    # nothing is created below the folder which failed
+    eq_([c[0][0] for c in client.mkdir.call_args_list], ['/proj', '/proj/a'])
+
+
+class TestDoImport(object):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for d in ('a', 'a/b', 'c'):
+            os.makedirs(os.path.join(self.tmp, d))
+        for f in ('f0.txt', 'a/f1.txt', 'a/b/f2.txt', 'c/f3.txt'):
+            open(os.path.join(self.tmp, f), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _import(self, workers):
+        client = FakeDSClient()
+        progress = Mock()
+        all_info = doc_import.collect_from_local_fs(self.tmp, '/proj/dst')
+        new, existing = doc_import.do_import(client, all_info, workers=workers,
+                                             progress=progress)
+        eq_(progress.call_count, len(new) + len(existing))
+        return client, new, existing
+
+    def test_serial_and_concurrent(self):
+        serial, new_serial, _ = self._import(1)
+        concurrent, new_concurrent, _ = self._import(4)
+        eq_(sorted(serial.folders), sorted(concurrent.folders))
+        eq_(sorted(serial.links), sorted(concurrent.links))
+        eq_(sorted(i.dst for i in new_serial), sorted(i.dst for i in new_concurrent))
+        eq_(len(concurrent.links), 4)
+        ok_('/proj/dst/a/b' in concurrent.folders)
+
+    def test_progress_report(self):
+        out = Mock()
+        progress = doc_import.ImportProgress(out=out, interval=0)
+        progress(Mock())
+        progress(None)
+        progress.report(final=True)
+        eq_(progress.count, 1)
+        eq_(progress.failed, 1)
+        ok_('imported 1 items, 1 failed' in out.write.call_args_list[-2][0][0])
+
+    def test_plan(self):
+        all_info = list(doc_import.collect_from_local_fs(self.tmp, '/proj/dst'))
+        all_info.append(doc_import.ImportInfo(
+            '/src/x.txt', '/proj/other/x.txt', doc_import.ImportInfo.FILE,
+            {'_contentType': 'text/plain', '_owner': 'me'}))
+        plan = doc_import.ImportPlan.compile(all_info)
+        eq_(sorted(plan.folders), ['/proj', '/proj/dst', '/proj/dst/a', '/proj/dst/a/b',
+                                   '/proj/dst/c'])
+        for i, folder in enumerate(plan.folders):
+            ok_(os.path.dirname(folder) in ['/'] + plan.folders[:i])
+        eq_(sum(len(infos) for infos in plan.links.values()), 4)
+        eq_([i.dst for i in plan.singles if i.entity_type == doc_import.ImportInfo.FILE],
+            ['/proj/other/x.txt'])
+        eq_(list(plan.batches(1))[0][0], '/proj/dst')
+
+    def test_bulk(self):
+        client = FakeDSClient()
+        client.bulk_create_external_links = Mock(side_effect=client.bulk_create_external_links)
+        client.create_external_link = Mock(side_effect=client.create_external_link)
+        all_info = doc_import.collect_from_local_fs(self.tmp, '/proj/dst')
+        new, _ = doc_import.do_import(client, all_info, workers=2, batch_size=10)
+        eq_(client.bulk_create_external_links.call_count, 4)
+        eq_(client.create_external_link.call_count, 0)
+        eq_(len(client.links), 4)
+        eq_(len([i for i in new if i.dst.endswith('.txt')]), 4)
+
+    def test_bulk_fallback(self):
+        client = FakeDSClient()
+        client.bulk_create_external_links = Mock(return_value={'f0.txt': 'uuid:f0'})
+        all_info = doc_import.collect_from_local_fs(self.tmp, '/proj/dst')
+        new, _ = doc_import.do_import(client, all_info, batch_size=10)
+        # all but f0.txt are imported one by one
+        eq_(len(client.links), 3)
+        ok_('uuid:f0' in [i.uuid for i in new])
+
+    def test_journal(self):
+        journal_dir = tempfile.mkdtemp()
+        journal = ImportJournal(os.path.join(journal_dir, 'journal.sqlite'))
+        client = FakeDSClient()
+        all_info = list(doc_import.collect_from_local_fs(self.tmp, '/proj/dst'))
+        new, existing = doc_import.do_import(client, all_info, journal=journal)
+        eq_((len(new), len(existing)), (8, 0))
+
+        # nothing is sent to the server the second time
+        client = Mock()
+        new, existing = doc_import.do_import(client, all_info, workers=2, journal=journal)
+        eq_((len(new), len(existing)), (0, 8))
+        eq_(client.mock_calls, [])
+
+        # verify: one listing per folder, the missing items are imported again
+        client = FakeDSClient(existing=['/proj', '/proj/dst', '/proj/dst/a', '/proj/dst/c'])
+        client.listdir = Mock(side_effect=client.listdir)
+        new, existing = doc_import.do_import(client, all_info, journal=journal, verify=True)
+        eq_(sorted(i.dst for i in new),
+            ['/proj/dst/a/b', '/proj/dst/a/b/f2.txt', '/proj/dst/a/f1.txt', '/proj/dst/c/f3.txt',
+             '/proj/dst/f0.txt'])
+        eq_(len(existing), 3)
+        eq_(client.listdir.call_count, 5)
+        journal.close()
+        shutil.rmtree(journal_dir)
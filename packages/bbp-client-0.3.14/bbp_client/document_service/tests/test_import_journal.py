@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from bbp_client.document_service.utils.import_journal import ImportJournal
+
+
+class TestImportJournal(object):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'f.txt')
+        with open(self.src, 'w') as fd:
+            fd.write('content')
+        self.path = os.path.join(self.tmp, 'journal', 'imports.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_record_lookup(self):
+        with ImportJournal(self.path) as journal:
+            eq_(journal.lookup(self.src, '/proj/f.txt', 'text/plain'), None)
+            journal.record(self.src, '/proj/f.txt', 'text/plain', 'uuid0')
+            eq_(journal.lookup(self.src, '/proj/f.txt', 'text/plain'), 'uuid0')
+            eq_(journal.lookup(self.src, '/proj/f.txt', None), None)
+
+        # persisted, even with a single pending record
+        with ImportJournal(self.path) as journal:
+            eq_(len(journal), 1)
+            eq_(journal.lookup(self.src, '/proj/./f.txt', 'text/plain'), 'uuid0')
+            journal.forget(self.src, '/proj/f.txt', 'text/plain')
+            eq_(len(journal), 0)
+
+    def test_source_changed(self):
+        with ImportJournal(self.path) as journal:
+            journal.record(self.src, '/proj/f.txt', 'text/plain', 'uuid0')
+            with open(self.src, 'a') as fd:
+                fd.write('more')
+            eq_(journal.lookup(self.src, '/proj/f.txt', 'text/plain'), None)
+
+    def test_missing_source(self):
+        with ImportJournal(self.path) as journal:
+            journal.record('/gpfs/elsewhere', '/proj/f.txt', 'text/plain', 'uuid0')
+            eq_(journal.lookup('/gpfs/elsewhere', '/proj/f.txt', 'text/plain'), 'uuid0')
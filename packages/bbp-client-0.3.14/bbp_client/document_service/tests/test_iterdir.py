@@ -0,0 +1,70 @@
+import threading
+
+from nose.tools import ok_, eq_, assert_raises
+from mock import Mock
+
+from bbp_client.document_service import access
+from bbp_client.document_service.tests.data import HOST, make_entity
+
+
+class PagedChildren(object):
+    '''get_entity_children replacement, serving pages of page_size children'''
+    def __init__(self, count, page_size):
+        self.children = [make_entity('f%d' % i, 'u%d' % i, 'file', 'p') for i in range(count)]
+        self.page_size = page_size
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, uuid, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs.get('from'))
+        start = 0
+        if 'from' in kwargs:
+            start = [c._uuid for c in self.children].index(kwargs['from'])
+        size = int(kwargs.get('limit', self.page_size))
+        result = self.children[start:start + size]
+        return Mock(result=result, hasMore=start + size < len(self.children))
+
+
+class TestIterdir(object):
+    def setUp(self):
+        self.access = access.DocAccess(HOST)
+        self.project = make_entity('proj', 'p', 'project')
+        self.access._get_entity_by_path = Mock(
+            side_effect=lambda path: {'/proj': self.project}.get(path))
+        self.pages = PagedChildren(25, 10)
+        self.access._project = Mock()
+        self.access._project.get_entity_children.side_effect = self.pages
+
+    def test_complete(self):
+        for prefetch in (True, False):
+            names = [e._name for e in self.access.iterdir('/proj', prefetch=prefetch)]
+            eq_(names, ['f%d' % i for i in range(25)])
+
+    def test_same_as_listdir(self):
+        eq_([e._name for e in self.access.iterdir('/proj', page_size=7)],
+            self.access.listdir('/proj'))
+
+    def test_stop_early(self):
+        it = self.access.iterdir('/proj', prefetch=False)
+        eq_([next(it)._name for _ in range(3)], ['f0', 'f1', 'f2'])
+        it.close()
+        eq_(self.pages.calls, [None])
+
+    def test_prefetch(self):
+        it = self.access.iterdir('/proj')
+        next(it)
+        it.close()
+        # at most the next page was requested
+        ok_(len(self.pages.calls) <= 2)
+
+    def test_empty_page_with_more(self):
+        self.access._project.get_entity_children.side_effect = None
+        self.access._project.get_entity_children.return_value = Mock(result=[], hasMore=True)
+        for prefetch in (True, False):
+            eq_(list(self.access.iterdir('/proj', prefetch=prefetch)), [])
+
+    def test_errors(self):
+        assert_raises(OSError, list, self.access.iterdir('/missing'))
+        self.access._get_entity_by_path = Mock(return_value=make_entity('f', 'f', 'file'))
+        assert_raises(OSError, list, self.access.iterdir('/proj/f'))
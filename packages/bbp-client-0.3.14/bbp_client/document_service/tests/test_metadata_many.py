@@ -0,0 +1,52 @@
+from nose.tools import ok_, eq_
+from mock import Mock, patch
+
+from bbp_client.document_service.client import Client
+from bbp_client.swagger_helpers import SwaggerException
+from bbp_client.document_service.tests.data import HOST, make_entity
+
+
+class TestMetadataMany(object):
+    def setUp(self):
+        self.client = Client(HOST)
+        self.access = self.client._access
+        self.access._entity = Mock()
+        self.access._entity.get_entity.side_effect = \
+            lambda _id: make_entity(_id, _id, 'file' if _id.startswith('f') else 'folder')
+        self.access._file = Mock()
+        self.access._file.get_metadata.side_effect = lambda _id: {'id': _id}
+        self.access._folder = Mock()
+        self.access._folder.get_metadata.side_effect = lambda _id: {'id': _id}
+
+    def test_type_memo(self):
+        eq_(self.client.get_metadata_by_id('f1'), {'id': 'f1'})
+        eq_(self.client.get_metadata_by_id('f1'), {'id': 'f1'})
+        self.client.set_metadata_by_id('f1', {'a': 1})
+        eq_(self.access._entity.get_entity.call_count, 1)
+        self.access._file.add_metadata.assert_called_once_with('f1', {'a': '1'})
+
+    def test_get_many(self):
+        ids = ['f%d' % i for i in range(20)] + ['d0']
+        results, errors = self.client.get_metadata_many(ids, workers=4)
+        eq_(errors, {})
+        eq_(results['f3'], {'id': 'f3'})
+        eq_(results['d0'], {'id': 'd0'})
+        eq_(len(results), 21)
+
+    def test_set_many_partial(self):
+        def add_metadata(_id, metadata):
+            if _id == 'f1':
+                raise SwaggerException('nope')
+            return metadata
+        self.access._file.add_metadata.side_effect = add_metadata
+        results, errors = self.client.set_metadata_many({'f0': {'a': 'b'}, 'f1': {'a': 'c'}})
+        eq_(results, {'f0': {'a': 'b'}})
+        ok_(isinstance(errors['f1'], SwaggerException))
+
+    def test_types_from_listing(self):
+        with patch('bbp_client.document_service.access.transport') as transport:
+            transport.get.return_value = Mock(status_code=200, json=Mock(
+                return_value={'_name': 'f9', '_uuid': 'f9', '_entityType': 'file'}))
+            self.access._get_entity_by_path('/proj/f9')
+        self.client.get_metadata_by_id('f9')
+        eq_(self.access._entity.get_entity.call_count, 0)
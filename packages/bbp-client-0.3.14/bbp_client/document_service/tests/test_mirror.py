@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import ok_, eq_
+from mock import Mock
+
+from bbp_client.document_service import access
+from bbp_client.document_service.mirror import mirror, modified_timestamp
+from bbp_client.document_service.tests.data import HOST, FakeTree, make_entity
+
+PATHS = ['/proj/', '/proj/a/', '/proj/a/f1', '/proj/a/f2', '/proj/f0', '/proj/broken']
+
+
+def test_modified_timestamp():
+    e = make_entity('f', 'f1', 'file')
+    eq_(modified_timestamp(e), None)
+    e._modifiedOn = '2015-03-10T13:58:10.465000+0000'
+    eq_(modified_timestamp(e), 1425995890)
+
+
+class TestMirror(object):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tree = FakeTree(PATHS)
+        for e in self.tree.entities.values():
+            e._modifiedOn = '2015-03-10T13:58:10.465Z'
+        self.access = self.tree.install(access.DocAccess(HOST))
+
+        def download(uuid, dst):
+            if uuid == self.tree.entities['/proj/broken']._uuid:
+                raise IOError('broken')
+            with open(dst, 'wb') as fd:
+                fd.write(uuid)
+        self.access.download_file_by_id = Mock(side_effect=download)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_mirror(self):
+        summary = mirror(self.access, '/proj', self.tmp, workers=3)
+        eq_(sorted(os.path.relpath(p, self.tmp) for p in summary.downloaded),
+            ['a/f1', 'a/f2', 'f0'])
+        eq_([p for p, _ in summary.failed], ['/proj/broken'])
+        eq_(open(os.path.join(self.tmp, 'a', 'f1')).read(),
+            self.tree.entities['/proj/a/f1']._uuid)
+        eq_(int(os.path.getmtime(os.path.join(self.tmp, 'f0'))), 1425995890)
+        eq_(summary.bytes, sum(os.path.getsize(p) for p in summary.downloaded))
+        ok_(summary.files_per_second > 0)
+
+        # nothing changed: everything but the failed file is skipped
+        self.access.download_file_by_id.reset_mock()
+        summary = mirror(self.access, '/proj', self.tmp, workers=3)
+        eq_(summary.downloaded, [])
+        eq_(len(summary.skipped), 3)
+        eq_(self.access.download_file_by_id.call_count, 1)
@@ -0,0 +1,62 @@
+import threading
+
+from nose.tools import ok_, eq_
+from mock import Mock
+
+from bbp_client.document_service.client import Client
+from bbp_client.document_service.tests.data import HOST, FakeTree
+
+
+class TestPathsByIds(object):
+    def setUp(self):
+        self.tree = FakeTree(['/proj/', '/proj/a/', '/proj/a/b/', '/proj/a/b/f1', '/proj/a/b/f2',
+                              '/proj/a/f3', '/other/'])
+        self.by_uuid = dict((e._uuid, e) for e in self.tree.entities.values())
+        self.client = Client(HOST)
+        self.lock = threading.Lock()
+        self.fetched = []
+
+        def get_entity(_id):
+            with self.lock:
+                self.fetched.append(_id)
+            return self.by_uuid[_id]
+        self.client._access._entity = Mock()
+        self.client._access._entity.get_entity.side_effect = get_entity
+
+    def uuid(self, path):
+        return self.tree.entities[path]._uuid
+
+    def test_single(self):
+        eq_(self.client.get_path_by_id(self.uuid('/proj/a/b/f1')), '/proj/a/b/f1')
+        eq_(len(self.fetched), 4)
+        eq_(self.client.get_path_by_id(self.uuid('/proj/a/b/f1')), '/proj/a/b/f1')
+        eq_(self.client.get_path_by_id(self.uuid('/proj/a')), '/proj/a')
+        eq_(len(self.fetched), 4)
+
+    def test_many(self):
+        paths = ['/proj/a/b/f1', '/proj/a/b/f2', '/proj/a/f3', '/other']
+        found, errors = self.client.get_paths_by_ids([self.uuid(p) for p in paths], workers=4)
+        eq_(errors, {})
+        eq_(sorted(found.values()), sorted(paths))
+        # every entity is fetched once
+        eq_(sorted(self.fetched), sorted(set(self.fetched)))
+        eq_(len(self.fetched), 7)
+
+    def test_from_listing(self):
+        access = self.tree.install(self.client._access)
+        access._remember(self.tree.get_children(self.tree.entities['/proj/a']))
+        access._remember([self.tree.entities['/proj/a'], self.tree.entities['/proj']])
+        eq_(self.client.get_path_by_id(self.uuid('/proj/a/f3')), '/proj/a/f3')
+        eq_(self.fetched, [])
+
+    def test_errors(self):
+        found, errors = self.client.get_paths_by_ids(['missing', self.uuid('/proj/a')])
+        eq_(found, {self.uuid('/proj/a'): '/proj/a'})
+        ok_('missing' in errors)
+
+    def test_remove_forgets(self):
+        access = self.client._access
+        f1 = self.tree.entities['/proj/a/b/f1']
+        self.client.get_path_by_id(f1._uuid)
+        access._remove_from_cache(f1)
+        ok_(f1._uuid not in access._locations)
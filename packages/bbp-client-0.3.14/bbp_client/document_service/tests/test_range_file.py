@@ -0,0 +1,166 @@
+import os
+import re
+
+from nose.tools import ok_, eq_, raises
+from mock import Mock, patch
+
+from bbp_client.document_service import access
+from bbp_client.document_service.streams import RangeFile
+from bbp_client.document_service.tests.data import HOST, FakeTree
+
+CONTENT = ''.join(chr(i % 256) for i in range(1000))
+
+
+class FakeContent(object):
+    '''fetch function of RangeFile over CONTENT, recording the requested ranges'''
+    def __init__(self, content=CONTENT, send_size=True):
+        self.content = content
+        self.send_size = send_size
+        self.ranges = []
+
+    def __call__(self, start, end):
+        self.ranges.append((start, end))
+        return self.content[start:end], len(self.content) if self.send_size else None
+
+
+def test_read_and_seek():
+    fetch = FakeContent()
+    with RangeFile(fetch, block_size=100, read_ahead=0) as fd:
+        eq_(fd.read(10), CONTENT[:10])
+        eq_(fd.size, 1000)
+        eq_(fd.seek(550), 550)
+        eq_(fd.read(100), CONTENT[550:650])
+        eq_(fd.tell(), 650)
+        eq_(fd.seek(-5, os.SEEK_END), 995)
+        eq_(fd.read(), CONTENT[995:])
+        eq_(fd.read(), '')
+        eq_(fd.seek(-10, os.SEEK_CUR), 990)
+        eq_(fd.read(3), CONTENT[990:993])
+        # a read spanning blocks fetches the missing ones with a single request
+        eq_(fetch.ranges, [(0, 100), (500, 700), (900, 1000)])
+    ok_(fd.closed)
+
+
+def test_cache_and_eviction():
+    fetch = FakeContent()
+    fd = RangeFile(fetch, block_size=100, cache_blocks=2, read_ahead=0)
+    for pos in (0, 500, 0, 500):
+        fd.seek(pos)
+        fd.read(10)
+    eq_(fd.stats(), {'hits': 2, 'misses': 2, 'requests': 2})
+    fd.seek(800)
+    fd.read(10)
+    fd.seek(0)
+    fd.read(10)
+    eq_(fd.stats()['requests'], 4)
+
+
+def test_read_ahead_when_sequential():
+    fetch = FakeContent()
+    fd = RangeFile(fetch, block_size=100, read_ahead=3)
+    eq_(fd.read(100), CONTENT[:100])
+    eq_(fd.read(100), CONTENT[100:200])
+    eq_(fd.read(300), CONTENT[200:500])
+    eq_(fd.read(), CONTENT[500:])
+    eq_(fetch.ranges, [(0, 100), (100, 500), (500, 1000)])
+
+    # random reads do not read ahead
+    fetch = FakeContent()
+    fd = RangeFile(fetch, block_size=100, read_ahead=3)
+    fd.seek(700)
+    fd.read(10)
+    fd.seek(200)
+    fd.read(10)
+    eq_(fetch.ranges, [(700, 800), (200, 300)])
+
+
+def test_unknown_size():
+    fetch = FakeContent(send_size=False)
+    fd = RangeFile(fetch, block_size=300, read_ahead=0)
+    eq_(fd.read(), CONTENT)
+    eq_(fd.size, 1000)
+    eq_(fd.seek(-1, os.SEEK_END), 999)
+
+
+def test_readinto():
+    fd = RangeFile(FakeContent(), block_size=64)
+    buf = bytearray(200)
+    fd.seek(900)
+    eq_(fd.readinto(buf), 100)
+    eq_(str(buf[:100]), CONTENT[900:])
+
+
+def test_empty():
+    fd = RangeFile(FakeContent(''), block_size=64)
+    eq_(fd.read(), '')
+    eq_(fd.seek(0, os.SEEK_END), 0)
+
+
+@raises(IOError)
+def test_negative_seek():
+    RangeFile(FakeContent()).seek(-1)
+
+
+@raises(ValueError)
+def test_closed():
+    fd = RangeFile(FakeContent())
+    fd.close()
+    fd.read()
+
+
+def _range_response(request_headers, content=CONTENT):
+    '''a response to the Range header of request_headers'''
+    start, end = re.match(r'bytes=(\d+)-(\d*)', request_headers['Range']).groups()
+    start, end = int(start), int(end) + 1
+    if start >= len(content):
+        return Mock(status_code=416, headers={'Content-Range': 'bytes */%d' % len(content)})
+    return Mock(status_code=206, content=content[start:end],
+                headers={'Content-Range': 'bytes %d-%d/%d' % (start, end - 1, len(content))})
+
+
+mock_transport = Mock()
+
+
+@patch('bbp_client.document_service.access.transport', mock_transport)
+class TestOpenRange(object):
+    def setUp(self):
+        mock_transport.reset_mock()
+        mock_transport.get.side_effect = lambda url, headers, stream: _range_response(headers)
+        self.access = FakeTree(['/proj/', '/proj/data.h5']).install(access.DocAccess(HOST))
+
+    def test_open_file(self):
+        with self.access.open_file('/proj/data.h5', block_size=128, read_ahead=0) as fd:
+            fd.seek(-100, os.SEEK_END)
+            eq_(fd.read(), CONTENT[900:])
+            fd.seek(200)
+            eq_(fd.read(10), CONTENT[200:210])
+        # the size is learned with the first block
+        eq_([c[1]['headers']['Range'] for c in mock_transport.get.call_args_list],
+            ['bytes=0-127', 'bytes=896-1023', 'bytes=128-255'])
+        args, kwargs = mock_transport.get.call_args
+        ok_(args[0].endswith('/content/download'))
+        eq_(kwargs['headers']['Accept-Encoding'], 'identity')
+        ok_(not kwargs['stream'])
+
+    def test_range_ignored_by_server(self):
+        mock_transport.get.side_effect = None
+        mock_transport.get.return_value = Mock(status_code=200, content=CONTENT, headers={})
+        fd = self.access.open_range('uuid', block_size=100, cache_blocks=2)
+        fd.seek(250)
+        eq_(fd.read(100), CONTENT[250:350])
+        eq_(fd.size, 1000)
+        fd.seek(0)
+        eq_(fd.read(), CONTENT)
+        # the content is downloaded once
+        eq_(mock_transport.get.call_count, 1)
+
+    @raises(OSError)
+    def test_folder(self):
+        self.access.open_file('/proj')
+
+
+def test_range_total():
+    eq_(access._range_total('bytes 0-99/1000'), 1000)
+    eq_(access._range_total('bytes */1000'), 1000)
+    eq_(access._range_total('bytes 0-99/*'), None)
+    eq_(access._range_total(None), None)
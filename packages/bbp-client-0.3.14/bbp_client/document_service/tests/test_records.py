@@ -0,0 +1,56 @@
+import copy
+import pickle
+
+from nose.tools import ok_, eq_, assert_raises
+from mock import Mock
+
+from bbp_client import swagger_codec
+from bbp_client.document_service import access
+from bbp_client.document_service.records import EntityRecord, compact
+from bbp_client.document_service.tests.data import HOST, make_entity, FakeTree
+
+
+def test_from_entity():
+    entity = make_entity('f', 'u1', 'file', parent='p', content_type='text/plain')
+    record = EntityRecord.from_entity(entity)
+    for field in entity.swaggerTypes:
+        eq_(getattr(record, field), getattr(entity, field))
+    assert_raises(AttributeError, setattr, record, 'other', 1)
+    ok_(not hasattr(record, '__dict__'))
+
+
+def test_shared_strings():
+    records = compact(make_entity('f%d' % i, 'u%d' % i, ''.join(['fi', 'le']),
+                                  parent=''.join(['pa', 'rent'])) for i in range(2))
+    ok_(records[0]._entityType is records[1]._entityType)
+    ok_(records[0]._parent is records[1]._parent)
+
+
+def test_copy_and_serialize():
+    record = EntityRecord(_name='f', _uuid='u1', _entityType='file', _parent='p')
+    body = copy.copy(record)
+    del body._uuid
+    eq_(record._uuid, 'u1')
+    eq_(swagger_codec.sanitize(body)['_name'], 'f')
+    ok_('_uuid' not in swagger_codec.sanitize(body))
+    eq_(pickle.loads(pickle.dumps(record, 2))._name, 'f')
+
+
+def test_standard_attr():
+    doc = access.DocAccess(HOST, compact_entities=True)
+    record = EntityRecord(_name='f', _uuid='u1', _entityType='file', _parent='p')
+    doc._get_entity_by_path = Mock(return_value=record)
+    eq_(doc.get_standard_attr('/proj/f')['_uuid'], 'u1')
+
+
+def test_compact_listing():
+    tree = FakeTree(['/proj/', '/proj/a/', '/proj/a/f1', '/proj/f2'])
+    doc = access.DocAccess(HOST, compact_entities=True)
+    doc._get_entity_by_path = tree.get_entity_by_path
+    doc._project = Mock()
+    doc._project.get_entity_children.return_value = Mock(
+        result=tree.get_children(tree.entities['/proj']), hasMore=False)
+    children = doc._get_children(tree.entities['/proj'])
+    ok_(all(isinstance(c, EntityRecord) for c in children))
+    eq_(sorted(doc.listdir('/proj')), ['a', 'f2'])
+    ok_(all(isinstance(c, EntityRecord) for c in doc.iterdir('/proj')))
@@ -0,0 +1,87 @@
+import threading
+from urllib2 import HTTPError
+from StringIO import StringIO
+
+from nose.tools import ok_, eq_, raises
+from mock import Mock
+
+from bbp_client.swagger_helpers import SwaggerException
+from bbp_client.document_service.client import Client
+from bbp_client.document_service.tests.data import HOST, FakeTree
+
+TREE = ['/proj/',
+        '/proj/scratch/',
+        '/proj/scratch/a.txt',
+        '/proj/scratch/run/',
+        '/proj/scratch/run/b.txt',
+        '/proj/scratch/run/c.txt',
+        '/proj/scratch/run/deep/',
+        '/proj/scratch/run/deep/d.txt',
+        '/proj/scratch/other/',
+        '/proj/keep.txt',
+        ]
+
+
+class TestRmtree(object):
+    def setUp(self):
+        self.tree = FakeTree(TREE)
+        self.client = Client(HOST)
+        self.access = self.tree.install(self.client._access)
+        self.deleted = []
+        self.lock = threading.Lock()
+        self.fail = set()
+        self.paths = dict((e._uuid, p) for p, e in self.tree.entities.items())
+
+        def delete(_uuid):
+            path = self.paths[_uuid]
+            if path in self.fail:
+                raise HTTPError(path, 500, 'Internal Error', {}, StringIO('{}'))
+            with self.lock:
+                self.deleted.append(path)
+        self.access._file.delete_file = Mock(side_effect=delete)
+        self.access._folder.delete_folder = Mock(side_effect=delete)
+        self.access._project.delete_project = Mock(side_effect=delete)
+
+    def _check_order(self, paths):
+        for i, path in enumerate(paths):
+            # nothing below path is deleted after it
+            ok_(not any(p.startswith(path + '/') for p in paths[i + 1:]), path)
+
+    def test_rmtree(self):
+        for workers in (1, 4):
+            self.setUp()
+            deleted, errors = self.client.rmtree('/proj/scratch', workers=workers)
+            eq_(errors, {})
+            eq_(sorted(deleted), sorted(self.deleted))
+            eq_(sorted(deleted), sorted(p.rstrip('/') for p in TREE
+                                        if p.startswith('/proj/scratch')))
+            self._check_order(self.deleted)
+
+    def test_dry_run(self):
+        deleted, errors = self.client.rmtree('/proj/scratch', workers=2, dry_run=True)
+        eq_(self.deleted, [])
+        eq_(errors, {})
+        eq_(len(deleted), 8)
+        self._check_order(deleted)
+        ok_(all(p.endswith('.txt') for p in deleted[:4]))
+
+    def test_failures_keep_ancestors(self):
+        self.fail.add('/proj/scratch/run/deep/d.txt')
+        deleted, errors = self.client.rmtree('/proj/scratch', workers=3)
+        eq_(sorted(errors), ['/proj/scratch', '/proj/scratch/run', '/proj/scratch/run/deep',
+                             '/proj/scratch/run/deep/d.txt'])
+        ok_(isinstance(errors['/proj/scratch/run/deep/d.txt'], SwaggerException))
+        ok_(isinstance(errors['/proj/scratch/run'], OSError))
+        eq_(sorted(deleted), ['/proj/scratch/a.txt', '/proj/scratch/other',
+                              '/proj/scratch/run/b.txt', '/proj/scratch/run/c.txt'])
+
+    def test_single_file(self):
+        eq_(self.client.rmtree('/proj/keep.txt'), (['/proj/keep.txt'], {}))
+
+    @raises(OSError)
+    def test_missing(self):
+        self.client.rmtree('/proj/missing')
+
+    @raises(OSError)
+    def test_root(self):
+        self.access.rmtree('/')
@@ -0,0 +1,261 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.tools import ok_, eq_, raises
+from mock import Mock, patch
+
+from bbp_client.document_service import access
+from bbp_client.document_service.exceptions import DocException
+from bbp_client.document_service.streams import (DownloadStream, UploadStream,
+                                                  CompressedUploadStream, is_compressible)
+from bbp_client.document_service.tests.data import HOST, make_entity
+
+CONTENT = ''.join(chr(i % 256) for i in range(1000))
+
+
+def make_response(content, status_code=200, chunk_size=None):
+    resp = Mock()
+    resp.status_code = status_code
+    resp.headers = {'Content-Length': str(len(content))}
+
+    def iter_content(size):
+        for i in range(0, len(content), chunk_size or size):
+            yield content[i:i + (chunk_size or size)]
+    resp.iter_content = iter_content
+    return resp
+
+
+def test_download_stream_read():
+    stream = DownloadStream(make_response(CONTENT), chunk_size=64)
+    eq_(stream.size, 1000)
+    eq_(stream.read(10), CONTENT[:10])
+    eq_(stream.read(100), CONTENT[10:110])
+    eq_(stream.read(), CONTENT[110:])
+    eq_(stream.read(10), '')
+    stream.close()
+    ok_(stream.closed)
+
+
+def test_download_stream_iter():
+    stream = DownloadStream(make_response(CONTENT), chunk_size=64)
+    eq_(stream.read(10), CONTENT[:10])
+    chunks = list(stream)
+    eq_(''.join(chunks), CONTENT[10:])
+    ok_(all(len(c) <= 64 for c in chunks))
+
+
+mock_transport = Mock()
+@patch('bbp_client.document_service.access.transport', mock_transport)
+class TestDownload(object):
+    def setUp(self):
+        mock_transport.reset_mock()
+        self.access = access.DocAccess(HOST)
+        self.tmp = tempfile.mkdtemp()
+        self.dst = os.path.join(self.tmp, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_open_download(self):
+        mock_transport.get.return_value = make_response(CONTENT)
+        with self.access.open_download('uuid', chunk_size=100) as stream:
+            eq_(stream.read(), CONTENT)
+        _, kwargs = mock_transport.get.call_args
+        ok_(kwargs['stream'])
+
+    def test_download_to_file(self):
+        mock_transport.get.return_value = make_response(CONTENT)
+        checksum = hashlib.md5(CONTENT).hexdigest()
+        eq_(self.access.download_file_by_id('uuid', self.dst, checksum=checksum), self.dst)
+        eq_(open(self.dst, 'rb').read(), CONTENT)
+        ok_(not os.path.exists(self.dst + '.part'))
+
+    @raises(DocException)
+    def test_download_bad_checksum(self):
+        mock_transport.get.return_value = make_response(CONTENT)
+        try:
+            self.access.download_file_by_id('uuid', self.dst, checksum='0' * 32)
+        finally:
+            ok_(not os.path.exists(self.dst))
+            ok_(not os.path.exists(self.dst + '.part'))
+
+    def test_resume(self):
+        with open(self.dst + '.part', 'wb') as fd:
+            fd.write(CONTENT[:300])
+        mock_transport.get.return_value = make_response(CONTENT[300:], 206)
+        self.access.download_file_by_id('uuid', self.dst, resume=True)
+        eq_(open(self.dst, 'rb').read(), CONTENT)
+        _, kwargs = mock_transport.get.call_args
+        eq_(kwargs['headers']['Range'], 'bytes=300-')
+
+    def test_resume_complete(self):
+        with open(self.dst + '.part', 'wb') as fd:
+            fd.write(CONTENT)
+        mock_transport.get.return_value = Mock(status_code=416,
+                                               headers={'Content-Range': 'bytes */1000'})
+        self.access.download_file_by_id('uuid', self.dst, resume=True)
+        eq_(open(self.dst, 'rb').read(), CONTENT)
+        eq_(mock_transport.get.call_count, 1)
+
+    def test_resume_stale_part(self):
+        with open(self.dst + '.part', 'wb') as fd:
+            fd.write('x' * 1500)
+        mock_transport.get.side_effect = [
+            Mock(status_code=416, headers={'Content-Range': 'bytes */1000'}),
+            make_response(CONTENT)]
+        try:
+            self.access.download_file_by_id('uuid', self.dst, resume=True)
+        finally:
+            mock_transport.get.side_effect = None
+        eq_(open(self.dst, 'rb').read(), CONTENT)
+        _, kwargs = mock_transport.get.call_args
+        ok_('Range' not in kwargs['headers'])
+
+    def test_resume_ignored_by_server(self):
+        with open(self.dst + '.part', 'wb') as fd:
+            fd.write('garbage')
+        mock_transport.get.return_value = make_response(CONTENT, 200)
+        self.access.download_file_by_id('uuid', self.dst, resume=True)
+        eq_(open(self.dst, 'rb').read(), CONTENT)
+
+    def test_retry_after_broken_connection(self):
+        from requests.exceptions import ChunkedEncodingError
+        broken = make_response(CONTENT)
+
+        def iter_content(size):
+            yield CONTENT[:500]
+            raise ChunkedEncodingError('connection broken')
+        broken.iter_content = iter_content
+        mock_transport.get.side_effect = [broken, make_response(CONTENT[500:], 206)]
+        try:
+            self.access.download_file_by_id('uuid', self.dst, retries=1)
+        finally:
+            mock_transport.get.side_effect = None
+        eq_(open(self.dst, 'rb').read(), CONTENT)
+
+
+def _write_tmp(content):
+    fd, path = tempfile.mkstemp()
+    os.write(fd, content)
+    os.close(fd)
+    return path
+
+
+def test_upload_stream_file():
+    path = _write_tmp(CONTENT)
+    try:
+        for use_mmap in (False, True):
+            reports = []
+            with UploadStream.from_file(path, use_mmap=use_mmap, chunk_size=64,
+                                        progress=lambda s, t: reports.append((s, t)),
+                                        callback_interval=0) as stream:
+                eq_(len(stream), 1000)
+                eq_(''.join(stream), CONTENT)
+            eq_(stream.hexdigest(), hashlib.md5(CONTENT).hexdigest())
+            eq_(reports[-1], (1000, 1000))
+            eq_(len(reports), 16)
+    finally:
+        os.remove(path)
+
+
+def test_upload_stream_string():
+    throughput = []
+    stream = UploadStream.from_string(u'caf\xe9', hash_algorithm='sha1',
+                                      throughput=throughput.append)
+    eq_(stream.read(2), 'ca')
+    eq_(stream.read(), 'f\xc3\xa9')
+    eq_(stream.read(), '')
+    eq_(stream.hexdigest(), hashlib.sha1('caf\xc3\xa9').hexdigest())
+    ok_(throughput)
+
+
+def test_upload_stream_from_download():
+    content = 'x' * 1000
+    with UploadStream.from_download(DownloadStream(make_response(content, chunk_size=300))) \
+            as stream:
+        eq_(stream.size, 1000)
+        eq_(stream.read(), content)
+
+    # without Content-Length, the content is spooled to know its size
+    resp = make_response(content, chunk_size=300)
+    resp.headers = {}
+    download = DownloadStream(resp)
+    with UploadStream.from_download(download, spool_size=100) as stream:
+        ok_(download.closed)
+        eq_(stream.size, 1000)
+        eq_(stream.read(), content)
+
+
+def _gunzip(content):
+    return gzip.GzipFile(fileobj=StringIO(content)).read()
+
+
+def test_compressed_upload_stream():
+    text = 'line of text\n' * 1000
+    for spool_size in (1 << 20, 100):
+        with UploadStream.from_string(text, chunk_size=1000) as stream:
+            with CompressedUploadStream(stream, spool_size=spool_size) as body:
+                eq_(body.content_size, len(text))
+                compressed = body.read()
+        eq_(len(compressed), len(body))
+        ok_(len(compressed) < len(text) / 10)
+        eq_(_gunzip(compressed), text)
+        eq_(stream.hexdigest(), hashlib.md5(text).hexdigest())
+
+
+def test_is_compressible():
+    for content_type in ('text/plain', 'application/json', 'application/ld+json',
+                         'text/csv; charset=utf-8', 'image/svg+xml'):
+        ok_(is_compressible(content_type), content_type)
+    for content_type in (None, '', 'application/x-hdf5', 'image/png',
+                         'application/octet-stream'):
+        ok_(not is_compressible(content_type), content_type)
+
+
+@patch('bbp_client.document_service.access.transport', mock_transport)
+class TestUpload(object):
+    def setUp(self):
+        mock_transport.reset_mock()
+        self.access = access.DocAccess(HOST)
+        self.access._get_parent = Mock(return_value=make_entity('proj', 'p1', 'project'))
+        self.access._file.create_file = Mock(return_value=make_entity('f', 'f1', 'file', 'p1'))
+        self.sent = []
+
+        self.headers = []
+
+        def post(url, headers, data):
+            self.headers.append(headers)
+            self.sent.append(data.read() if hasattr(data, 'read') else data)
+            return Mock(status_code=201, text='{"_uuid": "f1", "_name": "f"}')
+        mock_transport.post.side_effect = post
+
+    def test_upload_file(self):
+        path = _write_tmp(CONTENT)
+        try:
+            eq_(self.access.upload_file(path, '/proj/f', 'application/octet-stream', None,
+                                        use_mmap=True), 'f1')
+        finally:
+            os.remove(path)
+        eq_(self.sent, [CONTENT])
+
+    def test_upload_empty_string(self):
+        eq_(self.access.upload_string('', '/proj/f', 'text/plain', None), 'f1')
+        eq_(self.sent, [''])
+
+    def test_compressed_upload(self):
+        text = 'a,b,c\n' * 1000
+        self.access.compress_uploads = True
+        eq_(self.access.upload_string(text, '/proj/f', 'text/csv', None), 'f1')
+        eq_(self.headers[0]['Content-Encoding'], 'gzip')
+        eq_(_gunzip(self.sent[0]), text)
+
+    def test_uncompressed_uploads(self):
+        self.access.compress_uploads = True
+        self.access.upload_string('a' * 2000, '/proj/f', 'application/x-hdf5', None)
+        self.access.upload_string('a,b', '/proj/f', 'text/csv', None)
+        ok_(not any('Content-Encoding' in h for h in self.headers))
+        eq_(self.sent, ['a' * 2000, 'a,b'])
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from nose.tools import ok_, eq_, raises
+from mock import Mock
+
+from bbp_client.document_service import access, sync
+from bbp_client.document_service.tests.data import HOST, FakeTree, make_entity
+
+MODIFIED_ON = '2015-03-10T13:58:10.465Z'
+TIMESTAMP = 1425995890
+
+REMOTE = ['/proj/',
+          '/proj/run/',
+          '/proj/run/same.txt',
+          '/proj/run/changed.txt',
+          '/proj/run/stale.txt',
+          '/proj/run/remote_only.txt',
+          '/proj/run/sub/',
+          '/proj/run/sub/r.txt',
+          '/proj/run/clash',
+          ]
+
+LOCAL = {'same.txt': TIMESTAMP,
+         'changed.txt': TIMESTAMP + 100,
+         'stale.txt': TIMESTAMP - 100,
+         'local_only.txt': TIMESTAMP,
+         'ldir/x.txt': TIMESTAMP,
+         'clash/y.txt': TIMESTAMP,
+         }
+
+
+def _kinds(plan, root):
+    '''dictionary relative local path -> kind of the actions of plan'''
+    return dict((os.path.relpath(a.local, root), a.kind) for a in plan.actions)
+
+
+class TestSync(object):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for relative, mtime in LOCAL.items():
+            path = os.path.join(self.tmp, *relative.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fd:
+                fd.write(relative)
+            os.utime(path, (mtime, mtime))
+
+        self.tree = FakeTree(REMOTE)
+        for e in self.tree.entities.values():
+            e._modifiedOn = MODIFIED_ON
+        self.access = self.tree.install(access.DocAccess(HOST))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _plan(self, **kwargs):
+        return sync.plan_sync(self.access, self.tmp, '/proj/run', **kwargs)
+
+    def test_plan_both(self):
+        plan = self._plan(upload=True)
+        eq_(_kinds(plan, self.tmp), {'changed.txt': sync.UPLOAD,
+                                     'stale.txt': sync.DOWNLOAD,
+                                     'local_only.txt': sync.UPLOAD,
+                                     'ldir': sync.MKDIR_REMOTE,
+                                     'ldir/x.txt': sync.UPLOAD,
+                                     'remote_only.txt': sync.DOWNLOAD,
+                                     'sub': sync.MKDIR_LOCAL,
+                                     'sub/r.txt': sync.DOWNLOAD,
+                                     })
+        eq_([(os.path.basename(l), r) for l, r, _ in plan.conflicts],
+            [('clash', '/proj/run/clash')])
+        action = [a for a in plan.actions if a.kind == sync.MKDIR_REMOTE][0]
+        eq_(action.remote, '/proj/run/ldir')
+
+    def test_plan_links(self):
+        linked = self.tree.entities['/proj/run/same.txt']
+        linked._contentUri = os.path.join(self.tmp, 'same.txt')
+        linked._modifiedOn = '2016-01-01T00:00:00Z'
+        self.tree.entities['/proj/run/changed.txt']._contentUri = '/elsewhere/changed.txt'
+        kinds = _kinds(self._plan(), self.tmp)
+        ok_('same.txt' not in kinds)
+        eq_(kinds['changed.txt'], sync.RELINK)
+        eq_(kinds['local_only.txt'], sync.LINK)
+        eq_(kinds['stale.txt'], sync.DOWNLOAD)
+
+    def test_plan_uploaded_files_without_upload(self):
+        # the entities holding content are never pointed at the local files
+        kinds = _kinds(self._plan(), self.tmp)
+        ok_('same.txt' not in kinds)
+        eq_(kinds['changed.txt'], sync.UPLOAD)
+        eq_(kinds['stale.txt'], sync.DOWNLOAD)
+        ok_(sync.RELINK not in kinds.values())
+
+    def test_push_keeps_newer_links(self):
+        for name in ('same.txt', 'changed.txt', 'stale.txt'):
+            self.tree.entities['/proj/run/' + name]._contentUri = '/elsewhere/' + name
+        kinds = _kinds(self._plan(direction=sync.PUSH), self.tmp)
+        ok_('same.txt' not in kinds)
+        ok_('stale.txt' not in kinds)
+        eq_(kinds['changed.txt'], sync.RELINK)
+
+    def test_push_delete(self):
+        kinds = _kinds(self._plan(direction=sync.PUSH, upload=True, delete=True), self.tmp)
+        eq_(kinds['remote_only.txt'], sync.DELETE_REMOTE)
+        eq_(kinds['sub'], sync.DELETE_REMOTE)
+        ok_('sub/r.txt' not in kinds)
+        eq_(kinds['stale.txt'], sync.UPLOAD)
+        eq_(kinds['changed.txt'], sync.UPLOAD)
+
+    def test_pull_delete(self):
+        kinds = _kinds(self._plan(direction=sync.PULL, delete=True), self.tmp)
+        eq_(kinds['local_only.txt'], sync.DELETE_LOCAL)
+        eq_(kinds['ldir'], sync.DELETE_LOCAL)
+        ok_('ldir/x.txt' not in kinds)
+        eq_(kinds['changed.txt'], sync.DOWNLOAD)
+        eq_(kinds['stale.txt'], sync.DOWNLOAD)
+
+    @raises(ValueError)
+    def test_two_way_delete(self):
+        self._plan(delete=True)
+
+    def test_hash_avoids_transfer(self):
+        stale = self.tree.entities['/proj/run/stale.txt']
+        changed = self.tree.entities['/proj/run/changed.txt']
+        metadata = {stale._uuid: {access.CONTENT_SIZE_KEY: str(len('stale.txt')),
+                                  access.CONTENT_DIGEST_KEY:
+                                  'md5:' + hashlib.md5('stale.txt').hexdigest()},
+                    changed._uuid: {access.CONTENT_SIZE_KEY: str(len('changed.txt')),
+                                    access.CONTENT_DIGEST_KEY: 'md5:' + '0' * 32}}
+        self.access.get_metadata_by_id = Mock(side_effect=lambda _id: metadata.get(_id, {}))
+        kinds = _kinds(self._plan(upload=True, hash_algorithm='md5', workers=2), self.tmp)
+        eq_(kinds['stale.txt'], sync.TOUCH)
+        eq_(kinds['changed.txt'], sync.UPLOAD)
+        eq_(self.access.get_metadata_by_id.call_count, 2)
+
+    def test_missing_remote(self):
+        plan = sync.plan_sync(self.access, self.tmp, '/proj/new', upload=True)
+        eq_(plan.actions[0], sync.SyncAction(sync.MKDIR_REMOTE, self.tmp, '/proj/new', None))
+        eq_(plan.counts()[sync.UPLOAD], 6)
+
+    def test_sync(self):
+        uploaded = make_entity('changed.txt', 'u1', 'file')
+        uploaded._modifiedOn = '2016-01-01T00:00:00Z'
+        self.access.upload_file_tracked = Mock(return_value='u1')
+        self.access.get_standard_attr_by_id = Mock(return_value=uploaded)
+        self.access.mkdir = Mock()
+
+        def download(_uuid, dst):
+            with open(dst, 'w') as fd:
+                fd.write(_uuid)
+        self.access.download_file_by_id = Mock(side_effect=download)
+
+        summary = sync.sync(self.access, self.tmp, '/proj/run', upload=True, workers=3)
+        eq_(summary.failed, [])
+        eq_(len(summary.done), 8)
+        eq_(len(summary.conflicts), 1)
+
+        self.access.mkdir.assert_called_once_with('/proj/run/ldir')
+        eq_(sorted(c[0][1] for c in self.access.upload_file_tracked.call_args_list),
+            ['/proj/run/changed.txt', '/proj/run/ldir/x.txt', '/proj/run/local_only.txt'])
+
+        # the transferred files get the modification time of their entity
+        stale = os.path.join(self.tmp, 'stale.txt')
+        eq_(open(stale).read(), self.tree.entities['/proj/run/stale.txt']._uuid)
+        eq_(int(os.path.getmtime(stale)), TIMESTAMP)
+        ok_(os.path.isfile(os.path.join(self.tmp, 'sub', 'r.txt')))
+        eq_(int(os.path.getmtime(os.path.join(self.tmp, 'changed.txt'))), 1451606400)
+
+    def test_failed_folder_blocks_content(self):
+        self.access.upload_file_tracked = Mock(return_value='u1')
+        self.access.get_standard_attr_by_id = Mock(return_value=None)
+        self.access.mkdir = Mock(side_effect=OSError('no'))
+        summary = sync.sync(self.access, self.tmp, '/proj/run', direction=sync.PUSH,
+                            upload=True)
+        eq_(sorted(a.remote for a, _ in summary.failed),
+            ['/proj/run/ldir', '/proj/run/ldir/x.txt'])
+        ok_('/proj/run/ldir/x.txt' not in
+            [c[0][1] for c in self.access.upload_file_tracked.call_args_list])
+
+    def test_failed_folder_blocks_subfolders(self):
+        os.makedirs(os.path.join(self.tmp, 'ldir', 'deep'))
+        open(os.path.join(self.tmp, 'ldir', 'deep', 'z.txt'), 'w').close()
+        self.access.upload_file_tracked = Mock(return_value='u1')
+        self.access.get_standard_attr_by_id = Mock(return_value=None)
+        self.access.mkdir = Mock(side_effect=OSError('no'))
+        summary = sync.sync(self.access, self.tmp, '/proj/run', direction=sync.PUSH,
+                            upload=True)
+        eq_(sorted(a.remote for a, _ in summary.failed),
+            ['/proj/run/ldir', '/proj/run/ldir/deep', '/proj/run/ldir/deep/z.txt',
+             '/proj/run/ldir/x.txt'])
+        # only the top folder was tried
+        self.access.mkdir.assert_called_once_with('/proj/run/ldir')
@@ -0,0 +1,49 @@
+from nose.tools import eq_
+
+from bbp_client.document_service import access
+from bbp_client.document_service.tests.data import HOST, FakeTree
+
+PATHS = ['/proj/', '/proj/a/', '/proj/a/a1/', '/proj/a/a1/f3', '/proj/a/f1', '/proj/b/',
+         '/proj/b/f2', '/proj/b/b1/', '/proj/f0']
+
+
+def _walk(**kwargs):
+    tree = FakeTree(PATHS)
+    doc = tree.install(access.DocAccess(HOST))
+    return tree, [(p, sorted(d), sorted(f)) for p, d, f in doc.walk('/proj', **kwargs)]
+
+
+def test_walk_serial():
+    tree, walked = _walk()
+    eq_(walked, [('/proj', ['a', 'b'], ['f0']),
+                 ('/proj/a', ['a1'], ['f1']),
+                 ('/proj/a/a1', [], ['f3']),
+                 ('/proj/b', ['b1'], ['f2']),
+                 ('/proj/b/b1', [], []),
+                 ])
+    # the sub-folders are not looked up again
+    eq_(tree.lookups, ['/proj'])
+
+
+def test_walk_concurrent():
+    _, serial = _walk()
+    tree, walked = _walk(workers=4)
+    eq_(sorted(walked), sorted(serial))
+    eq_(tree.lookups, ['/proj'])
+
+
+def test_walk_ordered():
+    _, walked = _walk(workers=4, ordered=True)
+    eq_([p for p, _, _ in walked], ['/proj', '/proj/a', '/proj/b', '/proj/a/a1', '/proj/b/b1'])
+
+
+def test_walk_prune():
+    for workers in (1, 4):
+        tree = FakeTree(PATHS)
+        doc = tree.install(access.DocAccess(HOST))
+        walked = []
+        for path, dirs, _ in doc.walk('/proj', workers=workers):
+            walked.append(path)
+            if 'a' in dirs:
+                dirs.remove('a')
+        eq_(sorted(walked), ['/proj', '/proj/b', '/proj/b/b1'])
@@ -5,19 +5,25 @@ import logging
 import mimetypes
 import os
 import sys
+import threading
+import time
 import yaml
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from os.path import join as joinp
 from urllib2 import HTTPError
 
 from bbp_services.client import get_services, get_environment_aliases
 
 from bbp_client.client import DEFAULT_LOG_FORMAT
+from bbp_client.concurrency import run_bounded
 from bbp_client.swagger_helpers import SwaggerException
 from bbp_client.oidc.client import BBPOIDCClient
 from bbp_client.document_service.client import Client as DSClient
 from bbp_client.document_service.client import DocException
+from bbp_client.document_service.access import DEFAULT_NEGATIVE_TTL
+from bbp_client.document_service import sync as doc_sync
+from bbp_client.document_service.utils.import_journal import ImportJournal, DEFAULT_JOURNAL
 
 L = logging.getLogger(__name__)
 VERBOSITY_LEVELS = (logging.WARNING, logging.INFO, logging.DEBUG)
@@ -25,6 +31,9 @@ VERBOSITY_LEVELS = (logging.WARNING, logging.INFO, logging.DEBUG)
 
 ImportReturn = namedtuple('ImportReturn', 'src dst content_type uuid new')
 
+# the standard attributes which can be set when creating links with the bulk endpoint
+BULK_ATTRIBUTES = frozenset(('_contentType', '_description'))
+
 EXAMPLE_YAML = '''\
 path: /gpfs/bbp.cscs.ch/project/proj30/post_sim_wf/Ca1p5_1/BlueConfig
 portal_path: /workflow_test/simulations/Ca1p5_1/BlueConfig
@@ -34,6 +43,98 @@ description: |
 '''
 
 
+class FolderCreator(object):
+    '''creates each destination folder at most once, parents before children
+
+    Safe to share between threads: a thread asking for a folder that is being
+    created by another thread waits for it to be done, and gets the error raised
+    if it could not be created.
+    '''
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self._folders = {}  # path -> threading.Event, set once the folder exists
+        self._uuids = {}  # path -> uuid if created by this instance, None if it existed
+        self._errors = {}  # path -> exception raised while creating it
+
+    def _ensure(self, path):
+        '''create path, and its parents, if not done yet'''
+        if path in ('', '/'):
+            return
+        with self._lock:
+            done = self._folders.get(path)
+            owner = done is None
+            if owner:
+                done = self._folders[path] = threading.Event()
+
+        if not owner:
+            done.wait()
+            if path in self._errors:
+                raise self._errors[path]
+            return
+
+        try:
+            self._ensure(os.path.dirname(path))
+            self._uuids[path] = self._client.mkdir(path, ignore_error=True)
+        except Exception as e:
+            self._errors[path] = e
+            raise
+        finally:
+            done.set()
+
+    def makedirs(self, path):
+        '''make sure path and its parents exist'''
+        self._ensure(os.path.normpath(path))
+
+    def mkdir(self, path):
+        '''make sure path exists
+
+        Returns:
+            the uuid of the folder, if it was created by this instance
+
+        Raises:
+            OSError if the folder existed before
+        '''
+        path = os.path.normpath(path)
+        self._ensure(path)
+        uuid = self._uuids.get(path)
+        if uuid is None:
+            raise OSError('directory already exists')
+        return uuid
+
+
+class ImportProgress(object):
+    '''periodically reports the number of imported items and the import rate'''
+    def __init__(self, out=sys.stderr, interval=2.):
+        self.out = out
+        self.interval = interval
+        self.count = 0
+        self.failed = 0
+        self._start = time.time()
+        self._last = 0
+
+    def __call__(self, ret):
+        '''account for a processed item, ret is None if the import failed'''
+        if ret is not None:
+            self.count += 1
+        else:
+            self.failed += 1
+
+        if time.time() - self._last >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        '''write the current counts and rate'''
+        self._last = now = time.time()
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed else 0.
+        self.out.write('\rimported %d items, %d failed (%.1f items/s)' %
+                       (self.count, self.failed, rate))
+        if final:
+            self.out.write('\n')
+        self.out.flush()
+
+
 class ImportInfo(object):
     '''Encapsulates the information regarding an import of a folder or file
     to the document service.'''
@@ -55,7 +156,7 @@ class ImportInfo(object):
         self.metadata = metadata or {}
         self.upload = upload
 
-    def do_import(self, client):
+    def do_import(self, client, folders=None):
         '''Perform the import
 
         This may mean creating a remote folder, uploading a file's contents
@@ -64,13 +165,16 @@ class ImportInfo(object):
 
         Args:
             client - the DS client to perform the operations on
+            folders - FolderCreator shared between the imports, so that the
+                intermediate folders are only created once
 
         Returns:
             uuid of the newly imported item
         '''
+        folders = folders or FolderCreator(client)
 
         intermediates = os.path.dirname(self.dst)
-        client.makedirs(intermediates)
+        folders.makedirs(intermediates)
 
         if self.entity_type == ImportInfo.FILE:
             if self.upload:
@@ -85,7 +189,7 @@ class ImportInfo(object):
                                                    self.standard_attr)
         else:
             assert self.entity_type == ImportInfo.FOLDER
-            uuid = client.mkdir(self.dst)
+            uuid = folders.mkdir(self.dst)
 
         if self.metadata:
             client.set_metadata_by_id(uuid, self.metadata)
@@ -234,6 +338,12 @@ def get_parser():
     path_mode.add_argument('--upload', default=False, action='store_true',
                            help='Upload file contents instead of registering them as '
                                 'external links')
+    path_mode.add_argument('--workers', type=int, default=1,
+                           help='Number of items imported concurrently')
+    path_mode.add_argument('--batch-size', type=int, default=0,
+                           help='Number of external links created per bulk request, '
+                                'all the items are collected first then. 0, the '
+                                'default, imports them one by one as they are collected')
 
     yaml_mode = modes.add_parser('yaml')
     yaml_mode.add_argument('src', nargs='*',
@@ -241,6 +351,32 @@ def get_parser():
 
     yaml_mode.add_argument('--ex-yaml', default=False, action='store_true',
                            help='Print example yaml and quit')
+    yaml_mode.add_argument('--workers', type=int, default=1,
+                           help='Number of items imported concurrently')
+    yaml_mode.add_argument('--batch-size', type=int, default=0,
+                           help='Number of external links created per bulk request, '
+                                'all the items are collected first then. 0, the '
+                                'default, imports them one by one as they are collected')
+
+    sync_mode = modes.add_parser('sync')
+    sync_mode.add_argument('src', help='local directory to sync')
+    sync_mode.add_argument('dst', help='path in the document service (/project/folder)')
+    sync_mode.add_argument('--direction', default=doc_sync.BOTH, choices=doc_sync.DIRECTIONS,
+                           help='push: make dst match src, pull: make src match dst, '
+                                'both: copy the newer files in both directions')
+    sync_mode.add_argument('--upload', default=False, action='store_true',
+                           help='Upload file contents instead of registering them as '
+                                'external links')
+    sync_mode.add_argument('--delete', default=False, action='store_true',
+                           help='With push or pull, delete what does not exist on the '
+                                'source side')
+    sync_mode.add_argument('--hash', default=None, metavar='ALGORITHM',
+                           help='Compare the digests of the files whose modification times '
+                                'differ, to transfer only the changed contents (ex: md5)')
+    sync_mode.add_argument('--workers', type=int, default=4,
+                           help='Number of concurrent requests')
+    sync_mode.add_argument('--dry-run', default=False, action='store_true',
+                           help='Only print what would be done')
 
     parser.add_argument('-v', '--verbose', action='count', dest='verbose',
                         default=0, help='-v for INFO, -vv for DEBUG')
@@ -262,6 +398,15 @@ def get_parser():
                         help='Server where the document service runs. Overrides the env for the ds.'
                              ' Example: http://localhost:8888')
 
+    parser.add_argument('--journal', nargs='?', const=DEFAULT_JOURNAL, default=None,
+                        help='Record the imports in a local journal (default: %s), and skip '
+                             'the items it contains when the import is run again' %
+                             DEFAULT_JOURNAL)
+
+    parser.add_argument('--verify', default=False, action='store_true',
+                        help='Check that the items found in the journal still exist, and '
+                             'import them again if they do not')
+
     parser.add_argument('--fail-hard', dest='fail_hard', default=False, action='store_true',
                         help='If an import failed, stop the process (by default log it and carry '
                              'on with the rest)')
@@ -298,11 +443,11 @@ def _handle_import_error(info, e, fail_hard):
         L.error(msg)
 
 
-def do_single_import(ds_client, info, fail_hard=False):
+def do_single_import(ds_client, info, fail_hard=False, folders=None):
     '''does a single document import'''
     content_type = info.standard_attr.get('_contentType', None)
     try:
-        uuid = info.do_import(ds_client)
+        uuid = info.do_import(ds_client, folders)
         L.info('Imported %s -> %s', info.src, info.dst)
         return ImportReturn(info.src, info.dst, content_type, uuid, True)
 
@@ -330,27 +475,285 @@ def do_single_import(ds_client, info, fail_hard=False):
     return None
 
 
-def do_import(ds_client, all_info, fail_hard=False):
+class ImportPlan(object):
+    '''what an import has to do, computed before doing it
+
+    folders: the destination folders of the external links, parents before children
+    links: destination folder -> ImportInfo of the external links that can be
+        created with the bulk endpoint
+    singles: the ImportInfo which have to be imported one by one
+    '''
+    def __init__(self):
+        self.folders = []
+        self.links = OrderedDict()
+        self.singles = []
+        self._known_folders = set(['/', ''])
+        self._dsts = set()
+
+    def _add_folder(self, path):
+        '''add path to the folders to create, after its parents'''
+        if path not in self._known_folders:
+            self._add_folder(os.path.dirname(path))
+            self._known_folders.add(path)
+            self.folders.append(path)
+
+    @staticmethod
+    def is_bulk(info):
+        '''can info be created with the bulk endpoint'''
+        return (info.entity_type == ImportInfo.FILE and
+                not info.upload and
+                info.standard_attr.get('_contentType') and
+                set(info.standard_attr) <= BULK_ATTRIBUTES)
+
+    @classmethod
+    def compile(cls, all_info):
+        '''build the plan of the ImportInfo in all_info'''
+        plan = cls()
+        for info in all_info:
+            dst = os.path.normpath(info.dst)
+            if cls.is_bulk(info) and dst not in plan._dsts:
+                folder = os.path.dirname(dst)
+                plan._add_folder(folder)
+                plan.links.setdefault(folder, []).append(info)
+                plan._dsts.add(dst)
+            else:
+                plan.singles.append(info)
+        return plan
+
+    def batches(self, batch_size):
+        '''generator of (folder, [ImportInfo]), with at most batch_size infos'''
+        for folder, infos in self.links.items():
+            for i in range(0, len(infos), batch_size):
+                yield folder, infos[i:i + batch_size]
+
+
+def _bulk_uuids(ret):
+    '''normalize the reply of the bulk endpoint to a dictionary of name -> uuid'''
+    if isinstance(ret, dict):
+        return ret
+    return dict((e['_name'], e['_uuid']) for e in ret or [] if isinstance(e, dict))
+
+
+def _bulk_import(ds_client, folder, infos, fail_hard):
+    '''create a batch of external links in folder with a single request
+
+    Returns:
+        list of (info, ImportReturn or None, fallback), where fallback is True for the
+        infos which were not created and have to be imported one by one
+    '''
+    files = dict((os.path.basename(os.path.normpath(i.dst)),
+                  {'content_type': i.standard_attr['_contentType'],
+                   'external_path': i.src,
+                   'description': i.standard_attr.get('_description', ''),
+                   }) for i in infos)
+    try:
+        uuids = _bulk_uuids(ds_client.bulk_create_external_links(files, folder))
+    except (OSError, HTTPError, SwaggerException, DocException) as e:
+        L.debug('Bulk creation of %d links in %s failed (%s)', len(infos), folder, e)
+        uuids = {}
+
+    results = []
+    for info in infos:
+        uuid = uuids.get(os.path.basename(os.path.normpath(info.dst)))
+        if uuid is None:
+            results.append((info, None, True))
+            continue
+
+        ret = ImportReturn(info.src, info.dst, info.standard_attr['_contentType'], uuid, True)
+        if info.metadata:
+            try:
+                ds_client.set_metadata_by_id(uuid, info.metadata)
+            except (HTTPError, SwaggerException, DocException) as e:
+                _handle_import_error(info, e, fail_hard)
+                ret = None
+        L.info('Imported %s -> %s', info.src, info.dst)
+        results.append((info, ret, False))
+    return results
+
+
+def _import_plan(ds_client, plan, fail_hard, workers, batch_size):
+    '''generator of the ImportReturn (or None for failures) of the items of plan'''
+    folders = FolderCreator(ds_client)
+
+    # FolderCreator makes sure the parents are created before their children
+    for path, _, error in run_bounded(folders.makedirs, plan.folders, workers):
+        if error is not None:
+            if fail_hard:
+                raise error
+            L.error('Failed to create folder %s: %s', path, error)
+
+    fallback = []
+    batches = run_bounded(lambda batch: _bulk_import(ds_client, batch[0], batch[1], fail_hard),
+                          plan.batches(batch_size), workers)
+    for _, results, error in batches:
+        if error is not None:
+            raise error
+        for info, ret, failed in results:
+            if failed:
+                fallback.append(info)
+            else:
+                yield ret
+
+    L.debug('%d links imported one by one', len(fallback))
+    for ret in _import_all(ds_client, fallback + plan.singles, fail_hard, workers, folders):
+        yield ret
+
+
+def _import_all(ds_client, all_info, fail_hard, workers, folders=None):
+    '''generator of the ImportReturn (or None for failures) of all the items'''
+    folders = folders or FolderCreator(ds_client)
+    if workers <= 1:
+        for info in all_info:
+            yield do_single_import(ds_client, info, fail_hard, folders)
+        return
+
+    # the items are collected lazily, at most a few of them are waiting for a worker
+    imports = run_bounded(lambda info: do_single_import(ds_client, info, fail_hard, folders),
+                          all_info, workers)
+    for _, ret, error in imports:
+        if error is not None:
+            raise error
+        yield ret
+
+
+def _skip_journaled(all_info, journal, journaled):
+    '''generator of the items of all_info which are not in the journal
+
+    The (info, uuid) of the others are appended to journaled
+    '''
+    for info in all_info:
+        uuid = journal.lookup(info.src, info.dst, info.standard_attr.get('_contentType'))
+        if uuid is None:
+            yield info
+        else:
+            journaled.append((info, uuid))
+
+
+def _verify_journaled(ds_client, journaled, workers):
+    '''check that the journaled items still exist, with one listing per destination folder
+
+    Returns:
+        the list of (info, uuid) which exist, and the list of infos which do not
+    '''
+    by_folder = OrderedDict()
+    for info, uuid in journaled:
+        folder = os.path.dirname(os.path.normpath(info.dst))
+        by_folder.setdefault(folder, []).append((info, uuid))
+
+    def listing(folder):
+        '''names in folder, empty if it does not exist'''
+        try:
+            return set(ds_client.listdir(folder))
+        except (DocException, HTTPError, SwaggerException) as e:
+            L.debug('Could not list %s: %s', folder, e)
+            return set()
+
+    confirmed, stale = [], []
+    for folder, names, error in run_bounded(listing, by_folder, workers):
+        if error is not None:
+            raise error
+        for info, uuid in by_folder[folder]:
+            if os.path.basename(os.path.normpath(info.dst)) in names:
+                confirmed.append((info, uuid))
+            else:
+                stale.append(info)
+    return confirmed, stale
+
+
+def do_import(ds_client, all_info, fail_hard=False, workers=1, progress=None, batch_size=0,
+              journal=None, verify=False):
     '''do import all collected items and return a list of successful imports
 
+    Args:
+        ds_client: the document service client
+        all_info: iterable of ImportInfo
+        fail_hard(bool): stop at the first failure
+        workers(int): number of items imported concurrently
+        progress: called with the ImportReturn (None on failure) of every item
+        batch_size(int): if not 0, an ImportPlan is built first, and the external
+            links are created with bulk requests of batch_size links per folder.
+            The links which could not be created that way are imported one by one
+        journal: ImportJournal where the successful imports are recorded. The items found
+            in it are not imported again, and are returned as existing imports
+        verify(bool): check that the items found in the journal still exist, and import
+            the ones which do not again
+
     Returns two lists of ImpotReturn objects. The first contains new imports, the second
     of files that have already been imported with matching standard attributes
     '''
     new_imports = []
     existing_imports = []
 
-    for info in all_info:
-        i = do_single_import(ds_client, info, fail_hard)
+    def account(i):
+        '''report and collect the ImportReturn i, None for a failure'''
+        if progress:
+            progress(i)
 
         if i:
+            if journal is not None:
+                journal.record(i.src, i.dst, i.content_type, i.uuid)
             if i.new:
                 new_imports.append(i)
             else:
                 existing_imports.append(i)
 
+    journaled = []
+    if journal is not None:
+        all_info = _skip_journaled(all_info, journal, journaled)
+
+    if batch_size:
+        imports = _import_plan(ds_client, ImportPlan.compile(all_info), fail_hard, workers,
+                               batch_size)
+    else:
+        imports = _import_all(ds_client, all_info, fail_hard, workers)
+
+    for i in imports:
+        account(i)
+
+    if journaled:
+        L.debug('%d items already imported according to the journal', len(journaled))
+        confirmed = journaled
+        if verify:
+            confirmed, stale = _verify_journaled(ds_client, journaled, workers)
+            if stale:
+                L.warning('%d journaled items do not exist anymore, importing them again',
+                          len(stale))
+            for info in stale:
+                journal.forget(info.src, info.dst, info.standard_attr.get('_contentType'))
+            for i in _import_all(ds_client, stale, fail_hard, workers):
+                account(i)
+
+        for info, uuid in confirmed:
+            account(ImportReturn(info.src, info.dst, info.standard_attr.get('_contentType'),
+                                 uuid, False))
+
     return new_imports, existing_imports
 
 
+def do_sync(ds_client, args):
+    '''run the sync subcommand, return the SyncPlan with dry_run, the SyncSummary otherwise'''
+    plan = ds_client.plan_sync(args.src, args.dst, args.direction, args.upload, args.delete,
+                               args.hash, args.workers)
+    for local, remote, reason in plan.conflicts:
+        L.warning('Not syncing %s and %s: %s', local, remote, reason)
+
+    if args.dry_run:
+        if not args.return_imports:
+            for action in plan.actions:
+                print '%-14s %s <-> %s' % (action.kind, action.local, action.remote)
+            print len(plan), 'actions'
+        return plan
+
+    summary = ds_client.sync(args.src, args.dst, args.direction, args.upload, args.delete,
+                             args.hash, args.workers, plan)
+    if summary.failed and args.fail_hard:
+        raise SystemExit('%d sync actions failed' % len(summary.failed))
+    if not args.return_imports:
+        print 'synced', len(summary.done), 'items,', len(summary.failed), 'failed,', \
+            len(summary.conflicts), 'conflicts'
+    return summary
+
+
 def main(args=None):
     '''Main function'''
     args = args or sys.argv[1:]
@@ -374,6 +777,9 @@ def main(args=None):
         else:
             all_info = collect_from_local_fs(args.src, args.dst, args.upload)
 
+    elif args.subcommand == 'sync':
+        all_info = None
+
     else:
         assert args.subcommand == 'yaml'
         if not args.src:
@@ -383,12 +789,27 @@ def main(args=None):
     oidc_client = BBPOIDCClient.implicit_auth(user=args.user, password=args.password,
                                               oauth_url=args.env)
     ds_server = args.server or args.env
-    ds_client = DSClient(ds_server, oidc_client)
+    # the import looks up the folders before creating them itself, and no other client
+    # is expected to create them meanwhile
+    ds_client = DSClient(ds_server, oidc_client, negative_ttl=DEFAULT_NEGATIVE_TTL)
+
+    if args.subcommand == 'sync':
+        summary = do_sync(ds_client, args)
+        return summary if args.return_imports else None
 
     services = get_services()
     hbp_portal_url = services['hbp_portal'][args.env]['url']
 
-    new_imports, _ = do_import(ds_client, all_info, args.fail_hard)
+    progress = None if args.return_imports else ImportProgress()
+    journal = ImportJournal(args.journal) if args.journal else None
+    try:
+        new_imports, _ = do_import(ds_client, all_info, args.fail_hard, args.workers, progress,
+                                   args.batch_size, journal, args.verify)
+    finally:
+        if journal is not None:
+            journal.close()
+    if progress:
+        progress.report(final=True)
 
     if not args.return_imports:
         for i in new_imports:
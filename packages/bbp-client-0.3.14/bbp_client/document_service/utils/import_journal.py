@@ -0,0 +1,127 @@
+'''local journal of the items imported by doc_import
+
+Every successful import is recorded in a SQLite database, keyed by the source,
+the destination, the content type and the size and modification time of the
+source. When an import is rerun, the items found in the journal are known to
+be done and are skipped without asking the document service.
+'''
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+import logging
+L = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL = os.path.join('~', '.bbp_client', 'doc_import.sqlite')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS imports (
+    src TEXT NOT NULL,
+    dst TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    uuid TEXT NOT NULL,
+    imported_on REAL NOT NULL,
+    PRIMARY KEY (src, dst, content_type, size, mtime)
+)
+'''
+
+
+def source_stat(src):
+    '''return (size, mtime) of the file src
+
+    (-1, -1) is returned for directories, whose modification time changes with
+    their content, and for sources which are not accessible from here
+    '''
+    try:
+        st = os.stat(src)
+    except OSError:
+        return -1, -1.
+    if stat.S_ISDIR(st.st_mode):
+        return -1, -1.
+    return st.st_size, st.st_mtime
+
+
+class ImportJournal(object):
+    '''SQLite journal of the completed imports
+
+    Records are written in transactions of commit_every items, and when the
+    journal is closed, so that an interrupted import loses at most a few records.
+
+    Example:
+        >>> with ImportJournal('~/.bbp_client/doc_import.sqlite') as journal:
+        ...     do_import(ds_client, all_info, journal=journal)
+    '''
+    def __init__(self, path=DEFAULT_JOURNAL, commit_every=100):
+        '''
+        Args:
+            path: the SQLite database, created if it does not exist
+            commit_every(int): number of records per transaction
+        '''
+        self.path = os.path.expanduser(path)
+        parent = os.path.dirname(self.path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        self.commit_every = commit_every
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    @staticmethod
+    def key(src, dst, content_type):
+        '''the journal key of an import'''
+        size, mtime = source_stat(src)
+        return (src, os.path.normpath(dst), content_type or '', size, mtime)
+
+    def lookup(self, src, dst, content_type):
+        '''return the uuid of the recorded import, None if it is not in the journal'''
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT uuid FROM imports WHERE src=? AND dst=? AND content_type=? '
+                'AND size=? AND mtime=?', self.key(src, dst, content_type)).fetchone()
+        return row[0] if row else None
+
+    def record(self, src, dst, content_type, uuid):
+        '''record a completed import'''
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO imports VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               self.key(src, dst, content_type) + (uuid, time.time()))
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._commit()
+
+    def forget(self, src, dst, content_type):
+        '''remove an import from the journal'''
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM imports WHERE src=? AND dst=? AND content_type=? '
+                'AND size=? AND mtime=?', self.key(src, dst, content_type))
+            self._pending += 1
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM imports').fetchone()[0]
+
+    def _commit(self):
+        '''commit the pending records, the lock must be held'''
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self):
+        '''commit the pending records and close the database'''
+        with self._lock:
+            if self._conn is not None:
+                self._commit()
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
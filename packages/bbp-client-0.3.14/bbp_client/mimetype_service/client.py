@@ -4,7 +4,8 @@ from datetime import datetime, timedelta
 from urlparse import urljoin
 from collections import namedtuple
 
-import requests
+from bbp_client import transport
+from bbp_client.concurrency import SingleFlight
 
 import bbp_client.mimetype_service.models as models
 
@@ -79,6 +80,8 @@ class Client(object):
             self.cache = MimetypeLookupCache()
         else:
             self.cache = None
+        # concurrent identical lookups share one request
+        self.inflight = SingleFlight()
 
     def __repr__(self):
         return 'mimetype.service.client.Client("%s")' % self.host
@@ -116,7 +119,7 @@ class Client(object):
 
         ret = []
         while url:
-            r = requests.get(url)
+            r = transport.get(url)
             r.raise_for_status()
             response = r.json()
             ret.extend(models.JSONModel.deserialize(json_obj=d) for d in response['results'])
@@ -127,7 +130,7 @@ class Client(object):
     @staticmethod
     def _get_model_by_url(url):
         '''get and deserialize a mimetype/viewer/key based on a url'''
-        r = requests.get(url)
+        r = transport.get(url)
         r.raise_for_status()
         return models.JSONModel.deserialize(json_obj=r.json())
 
@@ -206,7 +209,8 @@ class Client(object):
         query = (mimetype, description)
         res = self._get_from_cache(query)
         if not res:
-            res = self._get_models_by_url(self.url_mimetype, search_terms)
+            res = self.inflight.do(query, self._get_models_by_url, self.url_mimetype,
+                                   search_terms)
             self._add_to_cache(query, res)
         return res
 
@@ -223,7 +227,7 @@ class Client(object):
         '''
 
         url = self.url_mimetype
-        r = requests.post(url, data=mimetype.serialize(skip_fields=set(['keys'])),
+        r = transport.post(url, data=mimetype.serialize(skip_fields=set(['keys'])),
                           headers=self.headers)
         r.raise_for_status()
         ret = models.JSONModel.deserialize(json_obj=r.json())
@@ -249,7 +253,7 @@ class Client(object):
 
         '''
         url = urljoin(self.url_mimetype, '%d/' % int(mimetype.id))
-        r = requests.put(url, data=mimetype.serialize(skip_fields=set(['keys'])),
+        r = transport.put(url, data=mimetype.serialize(skip_fields=set(['keys'])),
                          headers=self.headers)
         r.raise_for_status()
         ret = models.JSONModel.deserialize(json_obj=r.json())
@@ -270,7 +274,7 @@ class Client(object):
             >>> ms.delete_mimetype(mt)
         '''
         url = urljoin(self.url_mimetype, '%d/' % int(mimetype.id))
-        r = requests.delete(url, headers=self.headers)
+        r = transport.delete(url, headers=self.headers)
         r.raise_for_status()
 
         self._reset_cache()
@@ -326,7 +330,7 @@ class Client(object):
             >>> v = ms.register_viewer(new_viewer)
             >>> print v
         '''
-        r = requests.post(self.url_viewer, data=viewer_model.serialize(), headers=self.headers)
+        r = transport.post(self.url_viewer, data=viewer_model.serialize(), headers=self.headers)
         r.raise_for_status()
         return models.JSONModel.deserialize(json_obj=r.json())
 
@@ -347,7 +351,7 @@ class Client(object):
         Which will only update the description of the viewer, since no other fields were changed
         '''
         url = urljoin(self.url_viewer, '%d/' % int(viewer.id))
-        r = requests.put(url, data=viewer.serialize(), headers=self.headers)
+        r = transport.put(url, data=viewer.serialize(), headers=self.headers)
         r.raise_for_status()
         return models.JSONModel.deserialize(json_obj=r.json())
 
@@ -362,26 +366,26 @@ class Client(object):
             >>> ms.delete_viewer(v)
         '''
         url = urljoin(self.url_viewer, '%d/' % int(viewer.id))
-        r = requests.delete(url, headers=self.headers)
+        r = transport.delete(url, headers=self.headers)
         r.raise_for_status()
         return r
 
     def register_key(self, key):
         '''register a key'''
-        r = requests.post(self.url_key, data=key.serialize(), headers=self.headers)
+        r = transport.post(self.url_key, data=key.serialize(), headers=self.headers)
         r.raise_for_status()
         return models.JSONModel.deserialize(json_obj=r.json())
 
     def update_key(self, key):
         '''update a key'''
         url = urljoin(self.url_key, '%d/' % int(key.id))
-        r = requests.put(url, data=key.serialize(), headers=self.headers)
+        r = transport.put(url, data=key.serialize(), headers=self.headers)
         r.raise_for_status()
         return models.JSONModel.deserialize(json_obj=r.json())
 
     def delete_key(self, key):
         '''delete a key'''
         url = urljoin(self.url_key, '%d/' % int(key.id))
-        r = requests.delete(url, headers=self.headers)
+        r = transport.delete(url, headers=self.headers)
         r.raise_for_status()
         return r
@@ -75,7 +75,7 @@ def test__check_mimetype():
                                                         'previous': None,
                                                         'results': [],
                                                         }
-    with patch('bbp_client.mimetype_service.client.requests', mock_requests):
+    with patch('bbp_client.mimetype_service.client.transport', mock_requests):
         c = client.Client('http://localhost:8000')
         #import ipdb; ipdb.set_trace()  # XXX BREAKPOINT
         bundle._check_mimetype(c, 'does not exist')
@@ -7,7 +7,7 @@ from bbp_client.mimetype_service import models
 from bbp_client.mimetype_service.tests.data import *
 
 mock_requests = Mock()
-@patch('bbp_client.mimetype_service.client.requests', mock_requests)
+@patch('bbp_client.mimetype_service.client.transport', mock_requests)
 class TestClientMimeType(object):
     SIMPLE_MODEL = MIMETYPE_DICT
     def setUp(self):
@@ -122,7 +122,7 @@ class TestClientMimeType(object):
         mt = models.MimeTypeFactory(**self.SIMPLE_MODEL)
         self.c.delete_mimetype(mt)
 
-@patch('bbp_client.mimetype_service.client.requests', mock_requests)
+@patch('bbp_client.mimetype_service.client.transport', mock_requests)
 class TestClientViwer(object):
     SIMPLE_MODEL = {
         'model_name': 'Viewer',
@@ -182,7 +182,7 @@ class TestClientViwer(object):
         v = models.ViewerFactory(**self.SIMPLE_MODEL)
         self.c.delete_viewer(v)
 
-@patch('bbp_client.mimetype_service.client.requests', mock_requests)
+@patch('bbp_client.mimetype_service.client.transport', mock_requests)
 class TestClientKey(object):
     def setUp(self):
         mock_requests.reset()
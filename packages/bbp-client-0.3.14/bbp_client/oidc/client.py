@@ -18,6 +18,9 @@ import os
 import pickle
 import stat
 import json
+import threading
+import time
+from datetime import datetime, timedelta
 
 from urlparse import urlparse, urljoin
 from os.path import join as joinp
@@ -34,6 +37,11 @@ DEFAULT_OIDC_CONFIG = {
     'scope': '',
 }
 
+# seconds before the expiry of a token when it is refreshed
+DEFAULT_REFRESH_MARGIN = 60
+# minimum seconds between two refresh attempts
+DEFAULT_REFRESH_INTERVAL = 10
+
 L = logging.getLogger(__name__)
 
 
@@ -465,3 +473,63 @@ def _verify_request(uri, status, content):
         L.error('Failed to retrieve data: %s', content)
         error_msg = 'Invalid response %s.' % status
         raise HTTPError(uri, status, error_msg, None, None)
+
+
+class TokenRefresher(object):
+    '''keeps the bearer token of an oauth client fresh, for the service clients
+
+    The token is refreshed when it is about to expire, and on demand when a server
+    rejects it. Refreshing is not possible with every kind of authentication (see
+    BBPOIDCClient.refresh), failures are logged and the current token keeps being used.
+    '''
+    def __init__(self, oauth_client, margin=DEFAULT_REFRESH_MARGIN,
+                 min_interval=DEFAULT_REFRESH_INTERVAL):
+        '''
+        Args:
+            oauth_client(BBPOIDCClient): the client holding the credentials
+            margin(float): seconds before the expiry of the token when it is refreshed
+            min_interval(float): minimum seconds between two refresh attempts, so
+                that concurrent calls rejected together refresh the token only once
+        '''
+        self.oauth_client = oauth_client
+        self.margin = timedelta(seconds=margin)
+        self.min_interval = min_interval
+        self.refreshes = 0
+        self._last_attempt = None
+        self._last_ok = False
+        self._lock = threading.Lock()
+
+    def expires_soon(self):
+        '''does the token expire within the margin'''
+        expiry = getattr(self.oauth_client.credentials, 'token_expiry', None)
+        # the expiry is in UTC, see OAuth2Credentials.access_token_expired
+        return isinstance(expiry, datetime) and datetime.utcnow() + self.margin >= expiry
+
+    def header(self):
+        '''the Authorization header value, refreshing the token if it expires soon'''
+        if self.expires_soon():
+            self.refresh()
+        return self.oauth_client.get_auth_header()
+
+    def refresh(self):
+        '''refresh the token
+
+        Returns:
+            True if the token was refreshed, by this call or by a concurrent one
+            within min_interval, False if it could not be
+        '''
+        with self._lock:
+            now = time.time()
+            if self._last_attempt is not None and now - self._last_attempt < self.min_interval:
+                return self._last_ok
+            self._last_attempt = now
+            try:
+                self.oauth_client.refresh()
+            except Exception as e:  # pylint: disable=W0703
+                L.warning('Could not refresh the token: %s', e)
+                self._last_ok = False
+            else:
+                L.debug('Refreshed the token')
+                self.refreshes += 1
+                self._last_ok = True
+            return self._last_ok
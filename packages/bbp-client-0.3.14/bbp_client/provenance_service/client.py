@@ -1,12 +1,12 @@
 '''python client for the provenance services'''
 import collections
 import logging
-import requests
+from bbp_client import transport
 from os.path import join as joinp
 
 from bbp_services.client import get_services
 import bbp_client.swagger_helpers as sh
-from bbp_client.oidc.client import BBPOIDCClient
+from bbp_client.oidc.client import BBPOIDCClient, TokenRefresher
 from bbp_client.provenance_service.swagger import swagger
 from bbp_client.provenance_service.swagger import ActivityApi, AgentApi, EntityApi
 from bbp_client.provenance_service.exceptions import ProvException
@@ -40,14 +40,15 @@ class Client(object):
         #mangle server and port
         self.host = host
         self.oauth_client = oauth_client
+        self._token = TokenRefresher(oauth_client) if oauth_client else None
         self.headers = headers or {}
 
-        if self.oauth_client:
-            self.headers['Authorization'] = self.oauth_client.get_auth_header()
+        if self._token:
+            self.headers['Authorization'] = self._token.header()
         self.headers['User-Agent'] = 'py_provenance_service_client'
 
         self._api = swagger.ApiClient('api_key', host)
-        sh.patch_swagger_callapi(self._api, self._get_headers)
+        sh.patch_swagger_callapi(self._api, self._get_headers, self._token)
 
         self._activity = ActivityApi.ActivityApi(self._api)
         self._agent = AgentApi.AgentApi(self._api)
@@ -66,9 +67,9 @@ class Client(object):
         return cls(prov_url, oauth_client)
 
     def _get_headers(self):
-        '''return the headers required for the http call'''
-        #TODO, when to do client refresh?
-        #self.client.refresh()
+        '''return the headers required for the http call, with a fresh token'''
+        if self._token:
+            self.headers['Authorization'] = self._token.header()
         return self.headers
 
     @staticmethod
@@ -528,7 +529,7 @@ class Client(object):
     def post_prov_dm(self, prov_dm_json):
         '''post Prov-DM to operation REST endpoint'''
         url = joinp(self.host, 'operation')
-        resp = requests.post(url, json=prov_dm_json, headers=self._get_headers())
+        resp = transport.post(url, json=prov_dm_json, headers=self._get_headers())
         L.debug('Provenance service POST /operation call took: %s', resp.elapsed)
         if resp.status_code != 200:
             raise ProvException('Failed to send prov_dm %s\n%s' % (resp.status_code, resp.text))
@@ -0,0 +1,202 @@
+'''compiled (de)serialization of the generated swagger models
+
+The generated swagger.ApiClient.deserialize looks up, with eval and regular
+expressions, the type of every attribute of every object it decodes. Here the
+swaggerTypes of each model class are compiled once into a plan of
+(attribute, converter) pairs, which is then reused for every object of that class.
+
+patch_swagger_callapi installs a SwaggerCodec on every ApiClient, the results are
+the same as the ones of the generated code.
+'''
+import datetime
+import re
+import sys
+import threading
+
+LIST_TYPE = re.compile(r'list\[(.*)\]')
+
+# swagger type name -> python type, for the types converted by calling the type
+PRIMITIVES = {'str': str,
+              'unicode': unicode,
+              'int': int,
+              'long': long,
+              'float': float,
+              'bool': bool,
+              'dict': dict,
+              'list': list,
+              'object': dict,
+              }
+
+# types which are serialized as they are
+SCALARS = frozenset((str, unicode, int, long, float, bool))
+
+# the server sends UTC timestamps with a trailing +0000, which is ignored
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def parse_datetime(value):
+    '''parse a timestamp sent by the server'''
+    return datetime.datetime.strptime(value[:-5], DATETIME_FORMAT)
+
+
+def _primitive(type_):
+    '''converter of an attribute of a primitive type'''
+    def convert(value):
+        '''same conversion as swagger.ApiClient.deserialize for attributes'''
+        try:
+            return type_(value)
+        except UnicodeEncodeError:
+            return unicode(value)
+        except TypeError:
+            return value
+    return convert
+
+
+class SwaggerCodec(object):
+    '''decoder of the models of one generated swagger client, with compiled field plans
+
+    Args:
+        namespace: the generated swagger module, where the models are looked up
+    '''
+    def __init__(self, namespace):
+        self._namespace = namespace
+        self._lock = threading.Lock()
+        self._converters = {}  # swagger type name -> converter
+        self._classes = {}  # model name -> model class
+        self._plans = {}  # model class -> tuple of (attribute, converter)
+
+    def model_class(self, name):
+        '''return the model class called name, looked up like the generated code does'''
+        cls = self._classes.get(name)
+        if cls is None:
+            try:
+                cls = getattr(getattr(self._namespace, name), name)
+            except AttributeError:
+                raise NameError("name '%s' is not defined" % name)
+            self._classes[name] = cls
+        return cls
+
+    def converter(self, type_name):
+        '''return the function converting an attribute value of swagger type type_name'''
+        convert = self._converters.get(type_name)
+        if convert is None:
+            with self._lock:
+                convert = self._converters[type_name] = self._compile_converter(type_name)
+        return convert
+
+    def _compile_converter(self, type_name):
+        '''create the converter of type_name'''
+        match = LIST_TYPE.match(type_name)
+        if match:
+            sub_type = match.group(1)
+
+            def convert_list(value):
+                '''convert the items, None and empty lists become []'''
+                if not value:
+                    return []
+                convert = self.converter(sub_type)
+                return [convert(v) for v in value]
+            return convert_list
+
+        if type_name in PRIMITIVES:
+            return _primitive(PRIMITIVES[type_name])
+
+        if type_name == 'datetime':
+            return parse_datetime
+
+        # the model class is only resolved when an attribute of this type is decoded
+        return lambda value: self.decode_model(self.model_class(type_name), value)
+
+    def plan(self, cls, instance=None):
+        '''return the tuple of (attribute, converter) of the model class cls'''
+        plan = self._plans.get(cls)
+        if plan is None:
+            instance = instance if instance is not None else cls()
+            plan = tuple((attr, self.converter(attr_type))
+                         for attr, attr_type in instance.swaggerTypes.iteritems())
+            self._plans[cls] = plan
+        return plan
+
+    def decode_model(self, cls, obj):
+        '''create an instance of the model class cls from the decoded JSON obj'''
+        instance = cls()
+        if type(obj) is dict:
+            values = instance.__dict__
+            for attr, convert in self.plan(cls, instance):
+                if attr in obj:
+                    values[attr] = convert(obj[attr])
+        return instance
+
+    def deserialize(self, obj, objClass):
+        '''replacement of swagger.ApiClient.deserialize
+
+        Args:
+            obj: the decoded JSON
+            objClass: a class, or the swagger type name of obj
+        '''
+        # pylint: disable=C0103
+        if isinstance(objClass, basestring):
+            match = LIST_TYPE.match(objClass)
+            if match:
+                sub_type = match.group(1)
+                return [self.deserialize(o, sub_type) for o in obj]
+            if objClass in PRIMITIVES:
+                return PRIMITIVES[objClass](obj)
+            if objClass == 'datetime':
+                return parse_datetime(obj)
+            objClass = self.model_class(objClass)
+        elif objClass in SCALARS or objClass in (dict, list):
+            return objClass(obj)
+
+        return self.decode_model(objClass, obj)
+
+
+def sanitize(obj):
+    '''replacement of swagger.ApiClient.sanitizeForSerialization'''
+    type_ = type(obj)
+    if obj is None or type_ in SCALARS:
+        return obj
+    elif type_ is list:
+        return [sanitize(o) for o in obj]
+    elif type_ is datetime.datetime:
+        return obj.isoformat()
+
+    if type_ is dict:
+        values = obj
+    elif hasattr(obj, '__dict__'):
+        values = obj.__dict__
+    else:  # slotted records
+        values = dict((k, getattr(obj, k)) for k in type_.__slots__ if hasattr(obj, k))
+    return dict((k, sanitize(v)) for k, v in values.iteritems() if k != 'swaggerTypes')
+
+
+def to_dict(obj):
+    '''recursively change swagger objects into dictionaries'''
+    if obj is None or type(obj) in SCALARS:
+        return obj
+    swagger_types = getattr(obj, 'swaggerTypes', None)
+    if swagger_types is None:
+        return obj
+    return dict((attr, to_dict(getattr(obj, attr))) for attr in swagger_types)
+
+
+_CODECS = {}
+_CODECS_LOCK = threading.Lock()
+
+
+def get_codec(api):
+    '''return the SwaggerCodec shared by all the ApiClients of the module of api'''
+    module_name = api.__class__.__module__
+    codec = _CODECS.get(module_name)
+    if codec is None:
+        with _CODECS_LOCK:
+            codec = _CODECS.get(module_name)
+            if codec is None:
+                codec = _CODECS[module_name] = SwaggerCodec(sys.modules[module_name])
+    return codec
+
+
+def install(api):
+    '''make api use the compiled (de)serialization'''
+    api.deserialize = get_codec(api).deserialize
+    api.sanitizeForSerialization = sanitize
@@ -4,45 +4,136 @@ import json
 import logging
 
 from functools import wraps
+from StringIO import StringIO
 from urllib2 import HTTPError
 import re
 
+from bbp_client import swagger_codec
+from bbp_client import transport
+
 L = logging.getLogger(__name__)
 
+SWAGGER_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
 
 class SwaggerException(Exception):
     '''exceptions to wrap swagger'''
     pass
 
 
-def patch_swagger_callapi(api, header_callback):
+def transport_callapi(api, resourcePath, method, queryParams, postData, headerParams):
+    '''replacement for swagger.ApiClient.callAPI that goes through the shared transport
+
+    Behaves like the generated callAPI: the decoded JSON body is returned (None if
+    there is none), and urllib2.HTTPError is raised for HTTP error codes
+    '''
+    # pylint: disable=C0103
+    url = api.apiServer + resourcePath
+    headers = dict(headerParams or {})
+    headers['api_key'] = api.apiKey
+    if api.cookie:
+        headers['Cookie'] = api.cookie
+
+    params = None
+    if queryParams:
+        # None values should not be sent
+        params = dict((k, v) for k, v in queryParams.items() if v is not None)
+
+    if method not in SWAGGER_METHODS:
+        raise Exception('Method ' + method + ' is not recognized.')
+
+    data = None
+    if method != 'GET' and postData:
+        headers['Content-type'] = 'application/json'
+        data = json.dumps(api.sanitizeForSerialization(postData))
+
+    resp = transport.request(method, url, params=params, data=data, headers=headers)
+    if resp.status_code >= 400:
+        raise HTTPError(resp.url, resp.status_code, resp.reason, resp.headers,
+                        StringIO(resp.content))
+
+    if 'Set-Cookie' in resp.headers:
+        api.cookie = resp.headers['Set-Cookie']
+
+    try:
+        return json.loads(resp.content)
+    except ValueError:  # PUT requests don't return anything
+        return None
+
+
+def patch_swagger_callapi(api, header_callback, token=None):
     '''need to patch the callAPI function so we can add our custom headers
 
+    The calls are sent through the shared bbp_client.transport, so the
+    connections are reused between calls (and between the different clients)
+
+    The (de)serialization of the models is also replaced by the compiled one of
+    bbp_client.swagger_codec
+
     Args:
         api: The swagger API
         header_callback: Additional headers to be added to the callback
+        token(TokenRefresher): if given, a call rejected with 401 is sent again once
+            after the token was refreshed
 
-    Note: This doesn't currently attempt to do a client token refresh, might
-          want to do that in your header_callback if you have an
-          BBPOIDCClient instance
+    Note: the header_callback is called for every call, it should refresh the
+          token when it is about to expire (see TokenRefresher.header)
     '''
-    # save the old function
-    old = api.callAPI_old = api.callAPI
+    def send(resourcePath, method, queryParams, postData, headerParams):
+        '''the swagger call, sent through the shared transport'''
+        return transport_callapi(api, resourcePath, method, queryParams, postData,
+                                 headerParams)
 
     def patch(resourcePath, method, queryParams, postData, headerParams):
         '''function we subsitute for the real swagger.callAPI function
             allows us to add additional headers, if necessary (like for oauth)
         '''
-        if not headerParams:
-            headerParams = {}
-
-        headerParams.update(header_callback())
+        headers = dict(headerParams or {})
+        headers.update(header_callback())
 
-        return old(resourcePath, method, queryParams, postData, headerParams)
+        try:
+            return send(resourcePath, method, queryParams, postData, headers)
+        except HTTPError as e:
+            if e.code != 401 or token is None or not token.refresh():
+                raise
+            L.debug('%s %s was rejected, retrying with a refreshed token', method,
+                    resourcePath)
+            headers.update(header_callback())
+            return send(resourcePath, method, queryParams, postData, headers)
 
     L.debug('patching the swagger callapi')
 
     api.callAPI = patch
+    swagger_codec.install(api)
+
+
+# swagger type -> factory of the default value used by swagger_create_type
+DEFAULT_FACTORIES = {'str': str,
+                     'int': int,
+                     'long': long,
+                     'float': float,
+                     'bool': bool,
+                     #'integer': int,
+                     #'boolean': bool,
+                     'object': dict,
+                     }
+
+# model class -> tuple of (attribute, swagger type, default factory or None)
+_CREATE_PLANS = {}
+
+
+def _create_plan(obj_type, obj):
+    '''return the cached attributes and default factories of obj_type'''
+    plan = _CREATE_PLANS.get(obj_type)
+    if plan is None:
+        plan = []
+        for attr, attr_type in obj.swaggerTypes.iteritems():
+            factory = DEFAULT_FACTORIES.get(attr_type)
+            if factory is None and re.match(r'list\[.+]', attr_type):  # list[str]
+                factory = list
+            plan.append((attr, attr_type, factory))
+        plan = _CREATE_PLANS[obj_type] = tuple(plan)
+    return plan
 
 
 def swagger_create_type(obj_type, values):
@@ -50,19 +141,11 @@ def swagger_create_type(obj_type, values):
        object model (obj_type), and a dict of values, and creates the type
     '''
     obj = obj_type()
-    for attr, attr_type in obj.swaggerTypes.iteritems():
+    for attr, attr_type, factory in _create_plan(obj_type, obj):
         if attr in values:
             attr_val = values[attr]
-        elif attr_type in ('str', 'int', 'long', 'float', 'bool'):
-            attr_val = eval(attr_type + '()')
-        #elif 'integer' == attr_type:
-        #    attr_val = int()
-        #elif 'boolean' == attr_type:
-        #    attr_val = bool()
-        elif 'object' == attr_type:
-            attr_val = dict()
-        elif re.match(r'list\[.+]', attr_type):  # list[str]
-            attr_val = list()
+        elif factory is not None:
+            attr_val = factory()
         else:
             raise SwaggerException('Unrecognised type %s (obj: %s)' % (attr_type, obj_type))
 
@@ -72,14 +155,7 @@ def swagger_create_type(obj_type, values):
 
 def swagger_type_to_dict(obj):
     '''recursively change swagger objects into dictionaries'''
-    if hasattr(obj, 'swaggerTypes'):
-        ret = {}
-        for attr in obj.swaggerTypes.keys():
-            ret[attr] = swagger_type_to_dict(getattr(obj, attr))
-    else:
-        ret = obj
-
-    return ret
+    return swagger_codec.to_dict(obj)
 
 
 def swagger_error(func):
@@ -94,19 +170,30 @@ def swagger_error(func):
         try:
             return func(*args, **kwargs)
         except HTTPError as e:
-            body = e.fp.read()
-            try:
-                body = json.loads(body)
-            except ValueError:
-                pass
-
-            #python2.6 has a different HTTPError exception :-(
-            if hasattr(e, 'reason'):
-                reason = '%s (%s)' % (e.reason, e.msg)
-            else:
-                reason = str(e)
-
-            exc_str = ('Swagger failed (URL: %s Code %d): %s (%s)'
-                       % (e.url, int(e.code), reason, body))
-            raise SwaggerException(exc_str)
+            raise to_swagger_exception(e)
     return wrapper
+
+
+def to_swagger_exception(e):
+    '''return the SwaggerException describing the HTTPError e
+
+    Other exceptions are returned unchanged
+    '''
+    if not isinstance(e, HTTPError):
+        return e
+
+    body = e.fp.read()
+    try:
+        body = json.loads(body)
+    except ValueError:
+        pass
+
+    #python2.6 has a different HTTPError exception :-(
+    if hasattr(e, 'reason'):
+        reason = '%s (%s)' % (e.reason, e.msg)
+    else:
+        reason = str(e)
+
+    exc_str = ('Swagger failed (URL: %s Code %d): %s (%s)'
+               % (e.url, int(e.code), reason, body))
+    return SwaggerException(exc_str)
@@ -4,6 +4,8 @@ import time
 import dateutil.parser
 
 import bbp_client.swagger_helpers as sh
+from bbp_client.concurrency import SingleFlight
+from bbp_client.oidc.client import TokenRefresher
 from bbp_client.task_service.task_inspection import get_properties
 from bbp_client.task_service.swagger import swagger
 from bbp_client.task_service.swagger import TaskApi, JobApi
@@ -48,22 +50,26 @@ class Client(object):
         #mangle server and port
         self.host = host
         self.oauth_client = oauth_client
+        self._token = TokenRefresher(oauth_client) if oauth_client else None
         self.headers = headers or {}
 
-        if self.oauth_client:
-            self.headers['Authorization'] = self.oauth_client.get_auth_header()
+        if self._token:
+            self.headers['Authorization'] = self._token.header()
         self.headers['User-Agent'] = 'py_task_service_client'
 
         self._api = swagger.ApiClient('api_key', host)
-        sh.patch_swagger_callapi(self._api, self._get_headers)
+        sh.patch_swagger_callapi(self._api, self._get_headers, self._token)
 
         self._task_api = TaskApi.TaskApi(self._api)
         self._job_api = JobApi.JobApi(self._api)
 
+        # concurrent requests of the same task share one call
+        self.inflight = SingleFlight()
+
     def _get_headers(self):
-        '''return the headers required for the http call'''
-        #TODO, when to do client refresh?
-        #self.client.refresh()
+        '''return the headers required for the http call, with a fresh token'''
+        if self._token:
+            self.headers['Authorization'] = self._token.header()
         return self.headers
 
     @sh.swagger_error
@@ -105,7 +111,7 @@ class Client(object):
         Returns:
             A dictionary with the information about the task
         '''
-        task = self._task_api.GetTaskArg(task_id)
+        task = self.inflight.do(task_id, self._task_api.GetTaskArg, task_id)
         return sh.swagger_type_to_dict(task)
 
     # pylint: disable=R0913
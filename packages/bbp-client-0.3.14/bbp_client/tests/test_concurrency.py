@@ -0,0 +1,102 @@
+import threading
+
+from nose.tools import ok_, eq_
+
+from bbp_client.concurrency import run_bounded, SingleFlight
+
+
+def test_run_bounded():
+    def square(x):
+        if x == 3:
+            raise ValueError('three')
+        return x * x
+
+    results = dict((item, (result, error)) for item, result, error in
+                   run_bounded(square, range(10), workers=3))
+    eq_(sorted(results), range(10))
+    eq_(results[4], (16, None))
+    ok_(isinstance(results[3][1], ValueError))
+
+
+def test_run_bounded_lazy():
+    consumed = []
+    lock = threading.Lock()
+
+    def items():
+        for i in range(100):
+            with lock:
+                consumed.append(i)
+            yield i
+
+    results = run_bounded(lambda x: x, items(), workers=2, max_pending=4)
+    next(results)
+    ok_(len(consumed) <= 5)
+    results.close()
+
+
+def _concurrently(func, count):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(func())) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_single_flight():
+    inflight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def lookup(path):
+        calls.append(path)
+        release.wait()
+        return {'path': path}
+
+    threads, results = _concurrently(lambda: inflight.do('/proj', lookup, '/proj'), 5)
+    while inflight.stats()['coalesced'] < 4:
+        release.wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    eq_(calls, ['/proj'])
+    eq_(len(results), 5)
+    ok_(all(r is results[0] for r in results))
+    eq_(inflight.stats(), {'calls': 1, 'coalesced': 4})
+
+    # nothing is kept once the call is done
+    inflight.do('/proj', lookup, '/proj')
+    eq_(len(calls), 2)
+
+
+def test_single_flight_keys():
+    inflight = SingleFlight()
+    eq_(inflight.do('a', lambda: 1), 1)
+    eq_(inflight.do('b', lambda: 2), 2)
+    eq_(inflight.stats(), {'calls': 2, 'coalesced': 0})
+
+
+def test_single_flight_error():
+    inflight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait()
+        raise ValueError('no such task')
+
+    errors = []
+
+    def call():
+        try:
+            inflight.do('task', fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads, _ = _concurrently(call, 3)
+    while inflight.stats()['coalesced'] < 2:
+        release.wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    eq_(len(errors), 3)
+    ok_(all(e is errors[0] for e in errors))
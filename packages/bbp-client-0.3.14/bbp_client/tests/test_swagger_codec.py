@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from nose.tools import ok_, eq_, assert_raises
+
+from bbp_client import swagger_codec
+from bbp_client import swagger_helpers as sh
+from bbp_client.document_service.swagger import swagger as doc_swagger
+from bbp_client.document_service.swagger.models import EntityReturn, FolderPostJson
+from bbp_client.task_service.swagger import swagger as task_swagger
+
+
+def entity(i):
+    return {'_name': u'f%d' % i, '_uuid': u'uuid%d' % i, '_entityType': u'file',
+            '_parent': None, '_contentType': u'text/plain', '_createdOn': u'2015',
+            'unknown': u'ignored'}
+
+
+def job(i):
+    return {'job_id': u'job%d' % i, 'state': u'FINISHED', 'user': u'\xe9l\xe8ve'}
+
+
+def generated_and_compiled(swagger_module):
+    generated = swagger_module.ApiClient('api_key', 'http://localhost:8888')
+    compiled = swagger_module.ApiClient('api_key', 'http://localhost:8888')
+    sh.patch_swagger_callapi(compiled, dict)
+    return generated, compiled
+
+
+def as_dict(obj):
+    if isinstance(obj, list):
+        return [as_dict(o) for o in obj]
+    obj = sh.swagger_type_to_dict(obj)
+    if isinstance(obj, dict):
+        return dict((k, as_dict(v)) for k, v in obj.items())
+    return obj
+
+
+def check_same(generated, compiled, obj, obj_class):
+    expected = as_dict(generated.deserialize(obj, obj_class))
+    ret = compiled.deserialize(obj, obj_class)
+    eq_(as_dict(ret), expected)
+    return ret
+
+
+def test_entity_list():
+    generated, compiled = generated_and_compiled(doc_swagger)
+    obj = {'result': [entity(i) for i in range(10)], 'hasMore': True}
+    ret = check_same(generated, compiled, obj, 'EntityListReturn')
+    ok_(isinstance(ret.result[0], EntityReturn.EntityReturn))
+    eq_(ret.result[3]._parent, 'None')
+    check_same(generated, compiled, {'result': [], 'hasMore': False}, 'EntityListReturn')
+    check_same(generated, compiled, entity(1), EntityReturn.EntityReturn)
+
+
+def test_task_lists():
+    generated, compiled = generated_and_compiled(task_swagger)
+    check_same(generated, compiled, {'jobs': [job(i) for i in range(10)]}, 'ReturnJobListSchema')
+    task = {'task_id': u'task', 'properties': {'a': 1},
+            'requirements': {'env_vars': {'A': u'b'}, 'customizations': {'x': u'y'}}}
+    ret = check_same(generated, compiled, task, 'ReturnTaskSchema')
+    eq_(ret.requirements.env_vars, {'A': u'b'})
+    check_same(generated, compiled, [task, task], 'list[ReturnTaskSchema]')
+
+
+def test_unknown_model():
+    _, compiled = generated_and_compiled(doc_swagger)
+    assert_raises(NameError, compiled.deserialize, {}, 'NoSuchModel')
+
+
+def test_primitives():
+    _, compiled = generated_and_compiled(doc_swagger)
+    eq_(compiled.deserialize(u'3', 'int'), 3)
+    eq_(compiled.deserialize([u'a'], 'list[str]'), ['a'])
+    eq_(compiled.deserialize(u'2015-01-02T03:04:05.000006+0000', 'datetime'),
+        datetime.datetime(2015, 1, 2, 3, 4, 5, 6))
+
+
+def test_sanitize():
+    generated = doc_swagger.ApiClient('api_key', 'http://localhost:8888')
+    body = sh.swagger_create_type(FolderPostJson.FolderPostJson, {'_name': 'f'})
+    obj = [body, {'when': datetime.datetime(2015, 1, 2), 'n': [1, None, u'x']}]
+    eq_(swagger_codec.sanitize(obj), generated.sanitizeForSerialization(obj))
+
+
+def test_codec_shared():
+    api0 = doc_swagger.ApiClient('api_key', 'http://localhost:8888')
+    api1 = doc_swagger.ApiClient('api_key', 'http://localhost:8888')
+    task_api = task_swagger.ApiClient('api_key', 'http://localhost:8888')
+    ok_(swagger_codec.get_codec(api0) is swagger_codec.get_codec(api1))
+    ok_(swagger_codec.get_codec(api0) is not swagger_codec.get_codec(task_api))
@@ -0,0 +1,85 @@
+from urllib2 import HTTPError
+
+from nose.tools import eq_, raises
+from mock import Mock, patch
+
+from bbp_client import swagger_helpers as sh
+from bbp_client.document_service.swagger import swagger
+
+
+mock_transport = Mock()
+@patch('bbp_client.swagger_helpers.transport', mock_transport)
+class TestTransportCallAPI(object):
+    def setUp(self):
+        mock_transport.reset_mock()
+        self.api = swagger.ApiClient('api_key', 'http://localhost:8888')
+        sh.patch_swagger_callapi(self.api, lambda: {'Authorization': 'Bearer token'})
+        resp = mock_transport.request.return_value
+        resp.status_code = 200
+        resp.headers = {}
+        resp.content = '{"_name": "proj"}'
+
+    def test_get(self):
+        ret = self.api.callAPI('/entity/', 'GET', {'path': '/proj', 'from': None}, None, {})
+        eq_(ret, {'_name': 'proj'})
+        mock_transport.request.assert_called_once_with(
+            'GET', 'http://localhost:8888/entity/', params={'path': '/proj'}, data=None,
+            headers={'Authorization': 'Bearer token', 'api_key': 'api_key'})
+
+    def test_post(self):
+        self.api.callAPI('/folder/', 'POST', {}, {'_name': 'folder'}, {})
+        _, kwargs = mock_transport.request.call_args
+        eq_(kwargs['data'], '{"_name": "folder"}')
+        eq_(kwargs['headers']['Content-type'], 'application/json')
+
+    def test_empty_response(self):
+        mock_transport.request.return_value.content = ''
+        eq_(self.api.callAPI('/folder/1/', 'PUT', {}, None, {}), None)
+
+    @raises(sh.SwaggerException)
+    def test_error(self):
+        resp = mock_transport.request.return_value
+        resp.status_code = 404
+        resp.reason = 'Not Found'
+        resp.url = 'http://localhost:8888/entity/'
+        resp.content = '{"reason": "missing"}'
+        sh.swagger_error(self.api.callAPI)('/entity/', 'GET', {}, None, {})
+
+
+@patch('bbp_client.swagger_helpers.transport', mock_transport)
+def test_refresh_token_on_401():
+    mock_transport.reset_mock()
+    api = swagger.ApiClient('api_key', 'http://localhost:8888')
+    token = Mock()
+    headers = {'Authorization': 'Bearer old'}
+
+    def refresh():
+        headers['Authorization'] = 'Bearer new'
+        return True
+    token.refresh.side_effect = refresh
+    sh.patch_swagger_callapi(api, lambda: headers, token)
+    mock_transport.request.side_effect = [
+        Mock(status_code=401, url='', reason='', headers={}, content=''),
+        Mock(status_code=200, headers={}, content='{}')]
+    try:
+        eq_(api.callAPI('/entity/', 'GET', {}, None, {}), {})
+    finally:
+        mock_transport.request.side_effect = None
+    eq_([c[1]['headers']['Authorization'] for c in mock_transport.request.call_args_list],
+        ['Bearer old', 'Bearer new'])
+
+
+@raises(HTTPError)
+@patch('bbp_client.swagger_helpers.transport', mock_transport)
+def test_401_without_refresh():
+    mock_transport.reset_mock()
+    api = swagger.ApiClient('api_key', 'http://localhost:8888')
+    token = Mock()
+    token.refresh.return_value = False
+    sh.patch_swagger_callapi(api, lambda: {}, token)
+    mock_transport.request.return_value = Mock(status_code=401, url='', reason='', headers={},
+                                               content='')
+    try:
+        api.callAPI('/entity/', 'GET', {}, None, {})
+    finally:
+        eq_(mock_transport.request.call_count, 1)
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from nose.tools import ok_, eq_
+from mock import Mock
+
+from bbp_client.oidc.client import TokenRefresher
+
+
+def _oauth_client(expires_in):
+    client = Mock()
+    client.credentials.token_expiry = datetime.utcnow() + timedelta(seconds=expires_in)
+    client.get_auth_header.return_value = 'Bearer token'
+    return client
+
+
+def test_refresh_before_expiry():
+    client = _oauth_client(30)
+    token = TokenRefresher(client, margin=60)
+    eq_(token.header(), 'Bearer token')
+    eq_(client.refresh.call_count, 1)
+    eq_(token.refreshes, 1)
+
+    client = _oauth_client(3600)
+    TokenRefresher(client, margin=60).header()
+    ok_(not client.refresh.called)
+
+
+def test_no_expiry():
+    client = _oauth_client(0)
+    client.credentials.token_expiry = None
+    ok_(not TokenRefresher(client).expires_soon())
+
+
+def test_refresh_throttled():
+    client = _oauth_client(3600)
+    token = TokenRefresher(client, min_interval=60)
+    ok_(token.refresh())
+    ok_(token.refresh())
+    eq_(client.refresh.call_count, 1)
+
+
+def test_refresh_failure():
+    client = _oauth_client(0)
+    client.refresh.side_effect = Exception('no refresh token')
+    token = TokenRefresher(client, min_interval=0)
+    ok_(not token.refresh())
+    # the current token keeps being used
+    eq_(token.header(), 'Bearer token')
+    eq_(token.refreshes, 0)
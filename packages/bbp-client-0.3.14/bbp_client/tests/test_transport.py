@@ -0,0 +1,156 @@
+from nose.tools import ok_, eq_, raises
+from mock import Mock, patch
+from requests.exceptions import ConnectionError
+
+from bbp_client import transport
+
+
+def _response(content, wire_size):
+    resp = Mock()
+    resp.content = content
+    resp.raw.tell.return_value = wire_size
+    return resp
+
+
+def test_accept_encoding():
+    eq_(transport.Transport().session.headers['Accept-Encoding'], 'gzip, deflate')
+    eq_(transport.Transport(compression=False).session.headers['Accept-Encoding'], 'identity')
+
+
+def test_stats():
+    t = transport.Transport()
+    t.session.request = Mock(return_value=_response('x' * 1000, 100))
+    t.get('http://localhost/listing')
+    t.post('http://localhost/folder/', data='{"_name": "f"}')
+    eq_(t.stats.as_dict(), {'requests': 2,
+                            'sent_bytes': 14,
+                            'sent_wire_bytes': 14,
+                            'received_bytes': 2000,
+                            'received_wire_bytes': 200,
+                            })
+    t.stats.reset()
+    eq_(t.stats.as_dict()['requests'], 0)
+
+
+def test_stats_compressed_body():
+    t = transport.Transport()
+    t.session.request = Mock(return_value=_response('', 0))
+    body = Mock(content_size=5000)
+    body.__len__ = Mock(return_value=500)
+    t.post('http://localhost/upload', data=body)
+    stats = t.stats.as_dict()
+    eq_((stats['sent_bytes'], stats['sent_wire_bytes']), (5000, 500))
+
+
+def test_stats_streamed():
+    t = transport.Transport()
+    resp = _response('not read', 8)
+    t.session.request = Mock(return_value=resp)
+    ok_(t.get('http://localhost/content', stream=True) is resp)
+    eq_(t.stats.as_dict()['received_bytes'], 0)
+
+
+def _status(status_code, headers=None):
+    resp = _response('', 0)
+    resp.status_code = status_code
+    resp.headers = headers or {}
+    return resp
+
+
+@patch('bbp_client.transport.time.sleep')
+def test_retry_transient_errors(sleep):
+    t = transport.Transport()
+    t.session.request = Mock(side_effect=[ConnectionError('reset'), _status(503),
+                                          _status(429, {'Retry-After': '2'}), _status(200)])
+    eq_(t.get('http://localhost/listing').status_code, 200)
+    eq_(t.session.request.call_count, 4)
+    eq_(t.retried, 3)
+    ok_(sleep.call_args_list[2][0][0] >= 2)
+    eq_(t.breakers.states(), {'http://localhost': 'closed'})
+
+
+@patch('bbp_client.transport.time.sleep')
+def test_retries_exhausted(sleep):
+    t = transport.Transport(retry_policy=transport.RetryPolicy(retries=2))
+    t.session.request = Mock(return_value=_status(502))
+    eq_(t.get('http://localhost/listing').status_code, 502)
+    eq_(t.session.request.call_count, 3)
+    eq_(sleep.call_count, 2)
+
+
+@patch('bbp_client.transport.time.sleep')
+def test_no_retry_of_post(sleep):
+    t = transport.Transport()
+    t.session.request = Mock(return_value=_status(503))
+    eq_(t.post('http://localhost/folder/', data='{}').status_code, 503)
+    eq_(t.session.request.call_count, 1)
+    ok_(not sleep.called)
+
+
+def test_can_retry():
+    policy = transport.RetryPolicy()
+    ok_(policy.can_retry('get', {}))
+    ok_(policy.can_retry('PUT', {'data': '{}'}))
+    ok_(not policy.can_retry('PUT', {'data': Mock()}))
+    ok_(not policy.can_retry('PUT', {'files': {'f': 'content'}}))
+    ok_(not transport.RetryPolicy(retries=0).can_retry('GET', {}))
+
+
+def test_delay():
+    policy = transport.RetryPolicy(backoff=1, max_backoff=10)
+    for attempt in range(10):
+        ok_(0 <= policy.delay(attempt) <= min(10, 2 ** attempt))
+    eq_(policy.delay(0, '60'), 10)
+    ok_(policy.delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT') <= 1)
+
+
+@raises(transport.CircuitOpenError)
+def test_circuit_opens():
+    t = transport.Transport(retry_policy=transport.RetryPolicy(retries=0),
+                            breakers=transport.CircuitBreakers(failure_threshold=2))
+    t.session.request = Mock(side_effect=ConnectionError('refused'))
+    for _ in range(2):
+        try:
+            t.get('http://localhost/listing')
+        except transport.CircuitOpenError:
+            raise AssertionError('opened too early')
+        except ConnectionError:
+            pass
+    eq_(t.breakers.states(), {'http://localhost': 'open'})
+    try:
+        t.get('http://localhost/listing')
+    finally:
+        eq_(t.session.request.call_count, 2)
+
+
+@patch('bbp_client.transport.time.time')
+def test_circuit_half_open(time_):
+    time_.return_value = 1000.
+    breaker = transport.CircuitBreaker('http://localhost', failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    eq_(breaker.state, 'open')
+
+    time_.return_value = 1031.
+    breaker.before()
+    eq_(breaker.state, 'half-open')
+    # a single request probes the host
+    try:
+        breaker.before()
+        raise AssertionError('a second probe was let through')
+    except transport.CircuitOpenError:
+        pass
+    breaker.failure()
+    eq_(breaker.state, 'open')
+
+    time_.return_value = 1062.
+    breaker.before()
+    breaker.success()
+    eq_((breaker.state, breaker.failures), ('closed', 0))
+    breaker.before()
+
+
+def test_circuit_never_opens():
+    breaker = transport.CircuitBreaker('http://localhost', failure_threshold=0)
+    for _ in range(100):
+        breaker.failure()
+    breaker.before()
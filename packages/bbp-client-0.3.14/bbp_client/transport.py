@@ -0,0 +1,412 @@
+'''shared HTTP transport used by all the service clients
+
+All the HTTP calls of the clients go through a single requests.Session, so the
+TCP connections (and their TLS sessions) are kept alive and reused between
+calls instead of being re-established for every request.
+
+The responses are requested gzip or deflate compressed, and the transport counts
+the bytes sent and received, before and after compression.
+
+The idempotent requests which fail with a connection error or a transient server
+error are retried with jittered exponential backoff, and a circuit breaker per host
+fails the requests immediately while the host is down, instead of letting every
+call wait for its own timeouts.
+
+Example:
+    >>> from bbp_client import transport
+    >>> transport.set_transport(transport.Transport(pool_maxsize=32))
+    >>> transport.get_transport().set_host_pool_size('https://services.humanbrainproject.eu', 64)
+    >>> transport.get_transport().stats.as_dict()
+'''
+import random
+import threading
+import time
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import logging
+L = logging.getLogger(__name__)
+
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# the requests which can be sent again without changing their outcome
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+# the statuses of transient failures, worth retrying
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# the statuses telling that the server is failing, counted by the circuit breakers
+FAILURE_STATUSES = frozenset((500, 502, 503, 504))
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.
+
+# consecutive failures which open a circuit, and seconds before it is tried again
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    '''raised instead of sending a request to a host whose circuit is open'''
+    pass
+
+
+class RetryPolicy(object):
+    '''which failed requests are retried, and how long to wait before each retry
+
+    Only the requests with an idempotent method and a body which can be sent again
+    are retried. The delays follow a "full jitter" exponential backoff: a random
+    delay between 0 and backoff * 2 ** attempt, capped at max_backoff, so that many
+    clients failing together do not retry together. A Retry-After header sent by
+    the server is respected, within max_backoff.
+    '''
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF, statuses=RETRY_STATUSES,
+                 methods=IDEMPOTENT_METHODS):
+        '''
+        Args:
+            retries(int): maximum number of retries of a request, 0 never retries
+            backoff(float): seconds of the first delay, doubled at every retry
+            max_backoff(float): maximum seconds between two attempts
+            statuses: the HTTP statuses which are retried
+            methods: the HTTP methods which are retried
+        '''
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(m.upper() for m in methods)
+
+    def can_retry(self, method, kwargs):
+        '''can the request of method with the requests kwargs be retried'''
+        if self.retries <= 0 or method.upper() not in self.methods or kwargs.get('files'):
+            return False
+        data = kwargs.get('data')
+        return data is None or isinstance(data, (basestring, dict, list, tuple))
+
+    def delay(self, attempt, retry_after=None):
+        '''seconds to wait before the retry following attempt (0 for the first one)'''
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        try:
+            return max(delay, min(float(retry_after), self.max_backoff))
+        except (TypeError, ValueError):
+            return delay
+
+
+class CircuitBreaker(object):
+    '''stops the requests to a host after failure_threshold consecutive failures
+
+    While the circuit is open, requests fail immediately with CircuitOpenError. After
+    reset_timeout seconds a single request is let through: the circuit closes if it
+    succeeds, and opens again if it fails. The concurrent requests do not wait for
+    the outcome of this probe, they keep failing with CircuitOpenError.
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        '''
+        Args:
+            name: the host, for the messages
+            failure_threshold(int): consecutive failures which open the circuit,
+                0 never opens it
+            reset_timeout(float): seconds before a request is tried on an open circuit
+        '''
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self._opened = 0.
+        self._lock = threading.Lock()
+
+    def before(self):
+        '''check that a request can be sent, raise CircuitOpenError otherwise'''
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            if time.time() - self._opened < self.reset_timeout:
+                raise CircuitOpenError('%s is unavailable, %d consecutive failures' %
+                                       (self.name, self.failures))
+            # let one request probe the host, the others fail at once until it succeeds,
+            # or until reset_timeout passes again without an outcome
+            self.state = CircuitBreaker.HALF_OPEN
+            self._opened = time.time()
+
+    def success(self):
+        '''the host answered'''
+        with self._lock:
+            if self.state != CircuitBreaker.CLOSED:
+                L.info('%s is available again', self.name)
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        '''the host failed to answer'''
+        with self._lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or (
+                    self.failure_threshold and self.failures >= self.failure_threshold):
+                if self.state == CircuitBreaker.CLOSED:
+                    L.warning('%s failed %d times, pausing its requests for %.0fs',
+                              self.name, self.failures, self.reset_timeout)
+                self.state = CircuitBreaker.OPEN
+                self._opened = time.time()
+
+
+class CircuitBreakers(object):
+    '''the circuit breakers of the hosts, created on first use'''
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        '''see CircuitBreaker'''
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, url):
+        '''the breaker of the host of url'''
+        parsed = urlparse.urlsplit(url)
+        host = '%s://%s' % (parsed.scheme, parsed.netloc)
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, self.failure_threshold,
+                                                                self.reset_timeout)
+            return breaker
+
+    def states(self):
+        '''dictionary host -> state of its circuit'''
+        with self._lock:
+            return dict((host, b.state) for host, b in self._breakers.items())
+
+
+class TransferStats(object):
+    '''byte counters of the transfers, to measure the savings of the compression
+
+    sent_bytes and received_bytes are the sizes of the content, sent_wire_bytes and
+    received_wire_bytes the sizes of the (possibly compressed) bodies on the wire.
+    The bodies of streamed responses are not counted.
+    '''
+    FIELDS = ('requests', 'sent_bytes', 'sent_wire_bytes', 'received_bytes',
+              'received_wire_bytes')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(TransferStats.FIELDS, 0)
+
+    def add(self, **counts):
+        '''add counts to the counters'''
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] += value
+
+    def as_dict(self):
+        '''return the counters'''
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        '''set all the counters to 0'''
+        with self._lock:
+            self._counts = dict.fromkeys(TransferStats.FIELDS, 0)
+
+
+def _body_size(data):
+    '''number of bytes of a request body, 0 if it is unknown'''
+    if data is None:
+        return 0
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+def _wire_size(resp):
+    '''number of bytes of the body of resp as it was received'''
+    try:
+        return resp.raw.tell()
+    except AttributeError:
+        length = resp.headers.get('Content-Length')
+        return int(length) if length is not None else len(resp.content)
+
+
+class Transport(object):
+    '''pooled, persistent HTTP connections shared by the service clients'''
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, host_pool_maxsize=None, pool_block=False,
+                 compression=True, retry_policy=None, breakers=None):
+        '''
+        Args:
+            pool_connections(int): number of hosts for which a connection pool is kept
+            pool_maxsize(int): maximum number of connections kept alive per host
+            host_pool_maxsize(dict): url prefix -> pool_maxsize, for hosts which need
+                a different number of connections
+            pool_block(bool): wait for a free connection instead of opening a
+                throw-away one when a pool is exhausted
+            compression(bool): ask for compressed responses
+            retry_policy(RetryPolicy): how the failed requests are retried, RetryPolicy()
+                if None; RetryPolicy(retries=0) does not retry
+            breakers(CircuitBreakers): the circuit breakers of the hosts, CircuitBreakers()
+                if None; CircuitBreakers(failure_threshold=0) never opens a circuit
+        '''
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.stats = TransferStats()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = breakers or CircuitBreakers()
+        self.retried = 0
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING if compression else 'identity'
+        self.session.mount('http://', self._make_adapter(pool_connections, pool_maxsize))
+        self.session.mount('https://', self._make_adapter(pool_connections, pool_maxsize))
+        for prefix, maxsize in (host_pool_maxsize or {}).items():
+            self.set_host_pool_size(prefix, maxsize)
+
+    def _make_adapter(self, pool_connections, pool_maxsize):
+        '''create an adapter keeping pool_maxsize connections alive per host'''
+        return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                           pool_block=self.pool_block)
+
+    def set_host_pool_size(self, prefix, pool_maxsize):
+        '''use a pool of pool_maxsize connections for the urls starting with prefix'''
+        L.debug('using %d connections for %s', pool_maxsize, prefix)
+        self.session.mount(prefix, self._make_adapter(1, pool_maxsize))
+
+    def request(self, method, url, **kwargs):
+        '''same as requests.request, but on the pooled connections
+
+        Transient failures of idempotent requests are retried, see RetryPolicy, and
+        CircuitOpenError is raised while the circuit of the host is open
+        '''
+        policy = self.retry_policy
+        breaker = self.breakers.get(url)
+        retry = policy.can_retry(method, kwargs)
+        attempt = 0
+        while True:
+            breaker.before()
+            try:
+                resp = self._send(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.failure()
+                if not retry or attempt >= policy.retries:
+                    raise
+                delay = policy.delay(attempt)
+                L.debug('%s %s failed (%s), retrying in %.1fs', method, url, e, delay)
+            else:
+                if resp.status_code in FAILURE_STATUSES:
+                    breaker.failure()
+                else:
+                    breaker.success()
+                if (resp.status_code not in policy.statuses or not retry or
+                        attempt >= policy.retries):
+                    return resp
+                delay = policy.delay(attempt, resp.headers.get('Retry-After'))
+                L.debug('%s %s returned %s, retrying in %.1fs', method, url,
+                        resp.status_code, delay)
+                resp.close()
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            time.sleep(delay)
+
+    def _send(self, method, url, **kwargs):
+        '''send a single request, and count its bytes'''
+        resp = self.session.request(method, url, **kwargs)
+
+        data = kwargs.get('data')
+        wire = _body_size(data)
+        counts = {'requests': 1,
+                  'sent_wire_bytes': wire,
+                  # compressed bodies know the size of their content
+                  'sent_bytes': getattr(data, 'content_size', wire),
+                  }
+        if not kwargs.get('stream'):
+            counts['received_bytes'] = len(resp.content)
+            counts['received_wire_bytes'] = _wire_size(resp)
+        self.stats.add(**counts)
+        return resp
+
+    def get(self, url, **kwargs):
+        '''same as requests.get, but on the pooled connections'''
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):  # pylint: disable=W0621
+        '''same as requests.post, but on the pooled connections'''
+        return self.request('POST', url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        '''same as requests.put, but on the pooled connections'''
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        '''same as requests.delete, but on the pooled connections'''
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        '''close all the pooled connections'''
+        self.session.close()
+
+
+_TRANSPORT = None
+_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_transport():
+    '''return the transport shared by all the clients, creating it if necessary'''
+    global _TRANSPORT  # pylint: disable=W0603
+    if _TRANSPORT is None:
+        with _TRANSPORT_LOCK:
+            if _TRANSPORT is None:
+                _TRANSPORT = Transport()
+    return _TRANSPORT
+
+
+def set_transport(transport):
+    '''replace the transport shared by all the clients
+
+    Args:
+        transport: a Transport, or any object providing the same request method
+    '''
+    global _TRANSPORT  # pylint: disable=W0603
+    with _TRANSPORT_LOCK:
+        old, _TRANSPORT = _TRANSPORT, transport
+    if old is not None and old is not transport and hasattr(old, 'close'):
+        old.close()
+
+
+def request(method, url, **kwargs):
+    '''issue a request through the shared transport'''
+    return get_transport().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    '''issue a GET through the shared transport'''
+    kwargs.setdefault('allow_redirects', True)
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):  # pylint: disable=W0621
+    '''issue a POST through the shared transport'''
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    '''issue a PUT through the shared transport'''
+    return request('PUT', url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    '''issue a DELETE through the shared transport'''
+    return request('DELETE', url, **kwargs)
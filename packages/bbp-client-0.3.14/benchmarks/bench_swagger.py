@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+'''micro-benchmark of the swagger model decoding
+
+Compares the generated swagger.ApiClient.deserialize with the compiled one of
+bbp_client.swagger_codec, on document service listings and task service job lists.
+
+Usage:
+    python benchmarks/bench_swagger.py [--objects 1000] [--repeat 5]
+'''
+import argparse
+import json
+import time
+
+from bbp_client import swagger_codec
+from bbp_client import swagger_helpers as sh
+from bbp_client.document_service.swagger import swagger as doc_swagger
+from bbp_client.task_service.swagger import swagger as task_swagger
+
+
+def entity_listing(count):
+    '''decoded JSON of a folder listing of count files'''
+    return {'hasMore': False,
+            'result': [{'_name': u'file_%d.h5' % i,
+                        '_uuid': u'5f8bd9bc-5b8a-4d6c-9d3b-%012d' % i,
+                        '_entityType': u'file',
+                        '_parent': u'0d1d7c8a-6a3b-4b64-9a5a-1c5c3c8f6a1e',
+                        '_contentType': u'application/x-hdf5',
+                        '_contentUri': u'/gpfs/bbp.cscs.ch/project/file_%d.h5' % i,
+                        '_description': u'',
+                        '_createdBy': u'123456',
+                        '_createdOn': u'2015-06-01T12:00:00.000000+0000',
+                        '_modifiedOn': u'2015-06-01T12:00:00.000000+0000',
+                        } for i in range(count)]}
+
+
+def job_list(count):
+    '''decoded JSON of a job list of count jobs'''
+    return {'jobs': [{'job_id': u'job-%d' % i,
+                      'job_name': u'simulation %d' % i,
+                      'task_id': u'task-%d' % (i % 10),
+                      'state': u'FINISHED',
+                      'finish_reason': u'SUCCESS',
+                      'user': u'someone',
+                      'last_contact': u'2015-06-01T12:00:00',
+                      'start_time': u'2015-06-01T11:00:00',
+                      'queue_job_id': u'%d' % i,
+                      'queue_name': u'prod',
+                      } for i in range(count)]}
+
+
+def measure(func, count, repeat):
+    '''return the best objects/second of repeat runs of func, which decodes count objects'''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best if best else float('inf')
+
+
+def run(objects, repeat):
+    '''return a list of (case, implementation, objects/second)'''
+    cases = (('EntityListReturn', doc_swagger, entity_listing(objects)),
+             ('ReturnJobListSchema', task_swagger, job_list(objects)),
+             )
+    results = []
+    for model, module, data in cases:
+        generated = module.ApiClient('api_key', 'http://localhost')
+        codec = swagger_codec.get_codec(generated)
+        results.append((model, 'generated',
+                        measure(lambda: generated.deserialize(data, model), objects, repeat)))
+        results.append((model, 'compiled',
+                        measure(lambda: codec.deserialize(data, model), objects, repeat)))
+
+    decoded = swagger_codec.get_codec(doc_swagger.ApiClient('key', 'host')).deserialize(
+        entity_listing(objects), 'EntityListReturn')
+    generated = doc_swagger.ApiClient('api_key', 'http://localhost')
+    results.append(('EntityReturn encode', 'generated',
+                     measure(lambda: json.dumps(generated.sanitizeForSerialization(
+                         decoded.result)), objects, repeat)))
+    results.append(('EntityReturn encode', 'compiled',
+                     measure(lambda: json.dumps(swagger_codec.sanitize(decoded.result)),
+                             objects, repeat)))
+    results.append(('EntityReturn to dict', 'compiled',
+                     measure(lambda: [sh.swagger_type_to_dict(e) for e in decoded.result],
+                             objects, repeat)))
+    return results
+
+
+def main():
+    '''Main function'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=1000,
+                        help='Number of objects per decoded listing')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs, the best one is reported')
+    args = parser.parse_args()
+
+    print '%-24s %-10s %14s' % ('case', 'impl', 'objects/s')
+    for case, impl, rate in run(args.objects, args.repeat):
+        print '%-24s %-10s %14.0f' % (case, impl, rate)
+
+
+if __name__ == '__main__':
+    main()
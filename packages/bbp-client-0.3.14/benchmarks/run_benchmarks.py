@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+'''offline benchmarks of the bbp_client clients
+
+The clients talk to the in-process stand-ins of benchmarks/standins.py, so the
+benchmarks need no network, account or token. For every scenario the number of
+operations per second, the number of HTTP requests per operation and the memory
+use are recorded, and written as JSON so that the results of two releases can be
+compared.
+
+The scenarios run one after the other in the same process, whose peak RSS never
+decreases: cumulative_peak_rss_kb is the peak of the process once the scenario has
+run, which includes the scenarios before it, and peak_rss_growth_kb is how much the
+scenario raised it (0 when it stayed below an earlier peak). Run a single scenario
+with --only to get its own peak.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--latency 0.002] [--page-size 50]
+        [--repeat 3] [--only walk,listdir] [--output results.json]
+        [--compare previous.json]
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from bbp_client.version import VERSION
+from bbp_client.client import Client
+from bbp_client.collab_service.client import Client as CollabClient
+from bbp_client.document_service.client import Client as DocumentClient
+from bbp_client.document_service.utils import doc_import
+from bbp_client.mimetype_service import bundle
+from bbp_client.mimetype_service.client import Client as MimetypeClient
+from bbp_client.provenance_service.client import Client as ProvenanceClient
+from bbp_client.task_service.client import Client as TaskClient
+
+import standins
+
+BUNDLE_SPEC = {'type': 'bundleTypeSpec',
+               'bundleType': 'application/vnd.bbp.bundle.bench',
+               'content': {'/': {'type': 'image/png', 'count': [0, 2]},
+                           '/data_*': {'type': 'application/json', 'count': '+'},
+                           '/gul/': {'type': 'application/json', 'count': 10},
+                           '/gul/baz': 'application/json',
+                           },
+               }
+
+BUNDLE = {'type': 'bundle',
+          'bundleType': 'application/vnd.bbp.bundle.bench',
+          'content': {'/': ['root.png'],
+                      '/data_0': 'data_0.json',
+                      '/data_1': 'data_1.json',
+                      '/gul/': range(10),
+                      '/gul/baz': 'gul_baz.json',
+                      },
+          }
+
+
+class _Token(object):
+    '''stand-in of an OIDC client'''
+    @staticmethod
+    def get_auth_header():
+        '''the Authorization header'''
+        return 'Bearer benchmark'
+
+
+class _FirstMimetype(object):
+    '''mimetype client whose find_mimetype returns the first match, as bundle expects'''
+    def __init__(self, client):
+        self._client = client
+
+    def find_mimetype(self, mimetype=None, description=None):
+        '''the first MimeType matching the query, None if there is none'''
+        found = self._client.find_mimetype(mimetype, description)
+        return found[0] if found else None
+
+
+class Services(object):
+    '''the stand-ins of all the services, filled with the benchmark data'''
+    def __init__(self, args):
+        latency, page_size = args.latency, args.page_size
+        self.document = standins.DocumentServiceStandIn(latency, page_size)
+        self.task = standins.TaskServiceStandIn(latency, page_size, polls=args.polls)
+        self.provenance = standins.ProvenanceServiceStandIn(latency, page_size)
+        self.mimetype = standins.MimetypeServiceStandIn(latency, page_size)
+        self.collab = standins.CollabServiceStandIn(latency, page_size)
+        self.all = (self.document, self.task, self.provenance, self.mimetype, self.collab)
+
+        self.document.add_tree('/walk', args.folders, args.files, depth=args.depth)
+        self.document.add_tree('/big', 0, args.listing)
+        self.document.create('import', 'project')
+
+        task_id = self.task.add_task([{'name': 'count', 'type': 'int'},
+                                      {'name': 'name', 'type': 'str'}])
+        self.job_ids = [self.task.add_job(task_id) for _ in range(args.jobs)]
+        for job_id in self.job_ids:
+            self.provenance.returns[job_id] = {'count': 1, 'name': job_id}
+
+        for name in ('image/png', 'application/json'):
+            self.mimetype.add_mimetype(name)
+        self.mimetype.add_mimetype(BUNDLE_SPEC['bundleType'],
+                                   {'bundleTypeSpec': json.dumps(BUNDLE_SPEC)})
+
+        self.collab.add_collabs(args.collabs)
+
+    @property
+    def requests(self):
+        '''number of requests received by all the stand-ins'''
+        return sum(s.requests for s in self.all)
+
+
+def _scenarios(services, args, tmp_dir):
+    '''return the list of (name, setup) of the scenarios, setup returns the operation'''
+    doc, task = services.document, services.task
+
+    def walk():
+        '''walk a tree of folders'''
+        client = DocumentClient(doc.url)
+        return lambda: sum(1 for _ in client.walk('/walk', workers=args.workers))
+
+    def listdir():
+        '''list a large folder'''
+        client = DocumentClient(doc.url)
+        return lambda: client.listdir('/big')
+
+    def import_files():
+        '''import a local tree as external links'''
+        src = os.path.join(tmp_dir, 'src')
+        for i in range(args.folders):
+            folder = os.path.join(src, 'folder_%d' % i)
+            os.makedirs(folder)
+            for j in range(args.files):
+                with open(os.path.join(folder, 'file_%d.txt' % j), 'w') as fd:
+                    fd.write('benchmark')
+        runs = iter(xrange(sys.maxint))
+
+        def do_import():
+            '''import the tree to a new folder'''
+            client = DocumentClient(doc.url)
+            dst = '/import/run_%d' % next(runs)
+            infos = list(doc_import.collect_from_local_fs(src, dst))
+            doc_import.do_import(client, infos, workers=args.workers,
+                                 batch_size=args.batch_size)
+        return do_import
+
+    def wait_jobs():
+        '''wait for jobs which are closed after a few polls'''
+        client = TaskClient(task.url)
+
+        def wait():
+            '''wait for all the jobs'''
+            task.reset()
+            client.wait_jobs(services.job_ids, check_every=0)
+        return wait
+
+    def get_sorted_job_returns():
+        '''get the returns of a job, from the task and provenance services'''
+        client = Client(TaskClient(task.url), ProvenanceClient(services.provenance.url),
+                        DocumentClient(doc.url), MimetypeClient(services.mimetype.url))
+        return lambda: client.get_sorted_job_returns(services.job_ids[0])
+
+    def find_mimetype():
+        '''look up a mimetype'''
+        client = MimetypeClient(services.mimetype.url)
+        return lambda: client.find_mimetype('image/png')
+
+    def validate_bundle():
+        '''validate a bundle against the spec of the mimetype service'''
+        client = _FirstMimetype(MimetypeClient(services.mimetype.url))
+        return lambda: bundle.validate_bundle(BUNDLE, client)
+
+    def collabs():
+        '''list the readable collabs'''
+        client = CollabClient(services.collab.url, _Token(), 0)
+        return client.collabs
+
+    return [('walk', walk),
+            ('listdir', listdir),
+            ('doc_import', import_files),
+            ('wait_jobs', wait_jobs),
+            ('get_sorted_job_returns', get_sorted_job_returns),
+            ('find_mimetype', find_mimetype),
+            ('validate_bundle', validate_bundle),
+            ('collabs', collabs),
+            ]
+
+
+def peak_rss_kb():
+    '''peak resident set size of the process since it started, in kilobytes'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure(services, operation, repeat):
+    '''run operation repeat times, return its measures'''
+    requests = services.requests
+    peak_before = peak_rss_kb()
+    start = time.time()
+    for _ in range(repeat):
+        operation()
+    elapsed = time.time() - start
+    peak = peak_rss_kb()
+    return {'ops': repeat,
+            'seconds': elapsed,
+            'ops_per_second': repeat / elapsed if elapsed else None,
+            'requests_per_op': float(services.requests - requests) / repeat,
+            'cumulative_peak_rss_kb': peak,
+            'peak_rss_growth_kb': peak - peak_before,
+            }
+
+
+def run(args):
+    '''run the selected scenarios, return the results document'''
+    services = Services(args)
+    tmp_dir = tempfile.mkdtemp(prefix='bbp_client_bench_')
+    results = []
+    try:
+        with standins.serve(services.document), standins.serve(services.task), \
+                standins.serve(services.provenance), standins.serve(services.mimetype), \
+                standins.serve(services.collab):
+            for name, setup in _scenarios(services, args, tmp_dir):
+                if args.only and name not in args.only:
+                    continue
+                result = measure(services, setup(), args.repeat)
+                result['name'] = name
+                results.append(result)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    config = dict((k, v) for k, v in vars(args).items()
+                  if k not in ('output', 'compare', 'only'))
+    return {'version': VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': config,
+            'results': results,
+            }
+
+
+def compare(results, previous):
+    '''print the ratios of results to the previous ones, on stderr'''
+    before = dict((r['name'], r) for r in previous['results'])
+    sys.stderr.write('%-24s %12s %12s %12s\n' % ('scenario', 'ops/s', 'requests/op',
+                                                 'peak RSS*'))
+    for r in results['results']:
+        old = before.get(r['name'])
+        if old is None:
+            continue
+        ratios = [float(r[k]) / old[k] if old.get(k) else float('nan')
+                  for k in ('ops_per_second', 'requests_per_op', 'cumulative_peak_rss_kb')]
+        sys.stderr.write('%-24s %11.2fx %11.2fx %11.2fx\n' % tuple([r['name']] + ratios))
+    sys.stderr.write('* cumulative over the scenarios run before, see the module docstring\n')
+
+
+def get_parser():
+    '''return the argument parser'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Seconds waited by the stand-ins before answering each request')
+    parser.add_argument('--page-size', type=int, default=50,
+                        help='Number of items per page of the paginated endpoints')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of operations per scenario')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Workers of walk and doc_import')
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help='Batch size of doc_import, 0 to import the files one by one')
+    parser.add_argument('--folders', type=int, default=5,
+                        help='Number of folders per level of the walked and imported trees')
+    parser.add_argument('--files', type=int, default=10,
+                        help='Number of files per folder of the walked and imported trees')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='Depth of the walked tree')
+    parser.add_argument('--listing', type=int, default=500,
+                        help='Number of files of the listed folder')
+    parser.add_argument('--jobs', type=int, default=20,
+                        help='Number of jobs waited for')
+    parser.add_argument('--polls', type=int, default=2,
+                        help='Number of lookups after which a job is closed')
+    parser.add_argument('--collabs', type=int, default=200,
+                        help='Number of listed collabs')
+    parser.add_argument('--only', type=lambda s: s.split(','), default=None,
+                        help='Comma separated names of the scenarios to run')
+    parser.add_argument('--output', default=None,
+                        help='File where the JSON results are written, default is stdout')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of a previous run to compare with')
+    return parser
+
+
+def main():
+    '''Main function'''
+    args = get_parser().parse_args()
+    # doc_import warns about every imported file
+    logging.basicConfig(level=logging.ERROR)
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as fd:
+            compare(results, json.load(fd))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+'''in-process stand-ins of the BBP services, for offline benchmarks
+
+Each stand-in is a WSGI application serving, from memory, the endpoints the
+bbp_client clients call. It is served on a local port by a threaded wsgiref
+server, waits `latency` seconds before answering each request, and counts
+the requests it receives.
+
+Example:
+    >>> doc = DocumentServiceStandIn(page_size=100, latency=0.005)
+    >>> doc.add_tree('/proj', folders=10, files_per_folder=100)
+    >>> with serve(doc) as url:
+    ...     Client(url).listdir('/proj')
+'''
+import json
+import threading
+import time
+import urlparse
+import uuid
+
+from contextlib import contextmanager
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+STATUS = {200: '200 OK', 201: '201 CREATED', 400: '400 BAD REQUEST', 404: '404 NOT FOUND',
+          405: '405 METHOD NOT ALLOWED', 409: '409 CONFLICT'}
+
+
+class StandIn(object):
+    '''base of the stand-ins: counting, latency and JSON plumbing'''
+    def __init__(self, latency=0., page_size=50):
+        '''
+        Args:
+            latency(float): seconds waited before answering each request
+            page_size(int): number of items per page of the paginated endpoints
+        '''
+        self.latency = latency
+        self.page_size = page_size
+        self.url = None
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handle(self, method, path, query, body):
+        '''return (status, JSON serializable response) of a request'''
+        raise NotImplementedError
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        method = environ['REQUEST_METHOD']
+        query = dict(urlparse.parse_qsl(environ.get('QUERY_STRING', '')))
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else ''
+        try:
+            body = json.loads(body) if body else None
+        except ValueError:
+            pass
+
+        status, response = self.handle(method, environ['PATH_INFO'], query, body)
+        content = json.dumps(response) if response is not None else ''
+        start_response(STATUS[status], [('Content-Type', 'application/json'),
+                                         ('Content-Length', str(len(content)))])
+        return [content]
+
+    def page(self, items, start=0):
+        '''return the page of items starting at start, and whether there are more'''
+        end = start + self.page_size
+        return items[start:end], end < len(items)
+
+
+class DocumentServiceStandIn(StandIn):
+    '''projects, folders and files, with paged listings and metadata'''
+    def __init__(self, latency=0., page_size=50):
+        super(DocumentServiceStandIn, self).__init__(latency, page_size)
+        self.entities = {}  # uuid -> entity dict
+        self.paths = {}  # path -> uuid
+        self.children = {None: []}  # parent uuid -> list of children uuids
+        self.metadata = {}  # uuid -> dict
+
+    def _path_of(self, entity):
+        '''the path of entity'''
+        if entity['_parent'] == 'None':
+            return '/' + entity['_name']
+        return self._path_of(self.entities[entity['_parent']]) + '/' + entity['_name']
+
+    def create(self, name, entity_type, parent=None, **attrs):
+        '''create an entity, return its dict, None if the name is already taken'''
+        parent_path = self._path_of(self.entities[parent]) if parent else ''
+        path = parent_path + '/' + name
+        if path in self.paths:
+            return None
+        entity = {'_name': name, '_uuid': str(uuid.uuid4()), '_entityType': entity_type,
+                  '_parent': parent or 'None', '_createdBy': '1', '_description': '',
+                  '_createdOn': '2015-06-01T12:00:00.000000+0000',
+                  '_modifiedOn': '2015-06-01T12:00:00.000000+0000',
+                  '_contentType': None, '_contentUri': None}
+        entity.update(attrs)
+        self.entities[entity['_uuid']] = entity
+        self.paths[path] = entity['_uuid']
+        self.children[parent].append(entity['_uuid'])
+        if entity_type != 'file':
+            self.children[entity['_uuid']] = []
+        return entity
+
+    def add_tree(self, project, folders, files_per_folder, depth=1):
+        '''add a project with folders nested depth levels, each level holding
+        files_per_folder files'''
+        proj = self.create(project.strip('/'), 'project')
+
+        def fill(parent, level):
+            '''add the files, and the folders below parent'''
+            for i in range(files_per_folder):
+                self.create('file_%d.txt' % i, 'file', parent['_uuid'],
+                            _contentType='text/plain', _contentUri='/gpfs/file_%d.txt' % i)
+            if level < depth:
+                for i in range(folders):
+                    fill(self.create('folder_%d' % i, 'folder', parent['_uuid']), level + 1)
+        fill(proj, 0)
+        return proj
+
+    def _listing(self, parent, query):
+        '''paged listing of the children of parent, the page starts at query['from']'''
+        uuids = self.children[parent]
+        start = uuids.index(query['from']) if 'from' in query else 0
+        limit = int(query.get('limit', self.page_size))
+        page = uuids[start:start + limit]
+        return 200, {'result': [self.entities[u] for u in page],
+                     'hasMore': start + limit < len(uuids)}
+
+    def handle(self, method, path, query, body):  # pylint: disable=R0911,R0912
+        parts = [p for p in path.split('/') if p]
+        if parts == ['entity'] and method == 'GET':
+            _uuid = self.paths.get(query.get('path'))
+            return (200, self.entities[_uuid]) if _uuid else (404, None)
+
+        if parts and parts[0] in ('project', 'folder', 'file', 'entity'):
+            if len(parts) == 1 and parts[0] == 'project' and method == 'GET':
+                return self._listing(None, query)
+            if len(parts) == 1 and method == 'POST':
+                entity_type = parts[0]
+                entity = self.create(body['_name'], entity_type,
+                                     body.get('_parent') if entity_type != 'project' else None,
+                                     **dict((k, v) for k, v in body.items()
+                                            if k in ('_contentType', '_contentUri',
+                                                     '_description')))
+                return (201, entity) if entity else (409, {'error': 'exists'})
+            if len(parts) >= 2 and parts[1] in self.entities:
+                _uuid = parts[1]
+                if len(parts) == 2 and method == 'GET':
+                    return 200, self.entities[_uuid]
+                if parts[2:] == ['children']:
+                    return self._listing(_uuid, query)
+                if parts[2:] == ['metadata']:
+                    if method in ('PUT', 'POST'):
+                        self.metadata.setdefault(_uuid, {}).update(body or {})
+                    return 200, self.metadata.get(_uuid, {})
+            return 404, None
+
+        if parts == ['bulkfile'] and method == 'POST':
+            created = [self.create(f['_name'], 'file', f['_parent'],
+                                   _contentType=f['_contentType'],
+                                   _contentUri=f['_contentUri']) for f in body]
+            return 201, dict((e['_name'], e['_uuid']) for e in created if e)
+
+        return 404, None
+
+
+class TaskServiceStandIn(StandIn):
+    '''tasks and jobs; a job is closed after `polls` lookups'''
+    def __init__(self, latency=0., page_size=50, polls=2):
+        super(TaskServiceStandIn, self).__init__(latency, page_size)
+        self.polls = polls
+        self.tasks = {}
+        self.jobs = {}
+        self._lookups = {}
+
+    def add_task(self, returns):
+        '''add a task with the returns definitions, return its id'''
+        task_id = str(uuid.uuid4())
+        self.tasks[task_id] = {'task_id': task_id, 'task_filepath': 'task.py',
+                               'git_commit': 'abc', 'git_repo': 'repo',
+                               'add_date': '2015-06-01T12:00:00',
+                               'properties': {'returns': returns, 'version': '1'},
+                               'requirements': {'env_vars': {}, 'file_filters': {},
+                                                'customizations': {}}}
+        return task_id
+
+    def add_job(self, task_id):
+        '''add a running job of task_id, return its id'''
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = {'job_id': job_id, 'job_name': 'job', 'task_id': task_id,
+                             'state': 'RUNNING', 'finish_reason': 'None', 'user': 'someone',
+                             'last_contact': '', 'start_time': '', 'queue_job_id': '1',
+                             'queue_name': 'prod'}
+        return job_id
+
+    def handle(self, method, path, query, body):
+        parts = [p for p in path.split('/') if p]
+        if len(parts) == 2 and parts[0] == 'job' and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            with self._lock:
+                self._lookups[parts[1]] = lookups = self._lookups.get(parts[1], 0) + 1
+            if lookups >= self.polls:
+                job = dict(job, state='closed', finish_reason='return')
+            return 200, job
+        if len(parts) == 2 and parts[0] == 'task' and parts[1] in self.tasks:
+            return 200, self.tasks[parts[1]]
+        return 404, None
+
+    def reset(self):
+        '''make all the jobs running again'''
+        self._lookups.clear()
+
+
+class ProvenanceServiceStandIn(StandIn):
+    '''activities of jobs, with their generated values'''
+    def __init__(self, latency=0., page_size=50):
+        super(ProvenanceServiceStandIn, self).__init__(latency, page_size)
+        self.returns = {}  # job id -> {role: value}
+
+    def handle(self, method, path, query, body):
+        if path.strip('/') != 'activity':
+            return 404, None
+        job_id = query.get('predicate', '').rsplit('=', 1)[-1].strip('"')
+        values = self.returns.get(job_id, {})
+        return 200, {'entity': dict(('e%d' % i, {'prov:value': v})
+                                    for i, v in enumerate(values.values())),
+                     'wasGeneratedBy': dict(('g%d' % i, {'prov:role': role,
+                                                         'prov:entity': 'e%d' % i})
+                                            for i, role in enumerate(values))}
+
+
+class MimetypeServiceStandIn(StandIn):
+    '''mimetypes, with their keys, paginated with next links'''
+    def __init__(self, latency=0., page_size=50):
+        super(MimetypeServiceStandIn, self).__init__(latency, page_size)
+        self.mimetypes = []
+
+    def add_mimetype(self, mimetype, keys=None):
+        '''add a mimetype with a dictionary of keys'''
+        _id = len(self.mimetypes) + 1
+        self.mimetypes.append({'model_name': 'MimeType', 'id': _id, 'mimetype': mimetype,
+                               'description': mimetype, 'viewers': [],
+                               'keys': [{'model_name': 'Key', 'id': _id * 100 + i,
+                                         'key': k, 'value': v, 'mimetype': _id}
+                                        for i, (k, v) in enumerate((keys or {}).items())]})
+
+    def handle(self, method, path, query, body):
+        if path.strip('/') != 'mimetype':
+            return 404, None
+        found = [m for m in self.mimetypes
+                 if 'mimetype' not in query or m['mimetype'].lower() == query['mimetype'].lower()]
+        start = int(query.get('offset', 0))
+        results, more = self.page(found, start)
+        next_url = None
+        if more:
+            next_url = '%s/mimetype/?%s' % (self.url, '&'.join(
+                '%s=%s' % (k, v) for k, v in dict(query, offset=start + self.page_size).items()))
+        return 200, {'results': results, 'next': next_url}
+
+
+class CollabServiceStandIn(StandIn):
+    '''readable collabs, paginated with next links, and their navigation trees'''
+    def __init__(self, latency=0., page_size=50):
+        super(CollabServiceStandIn, self).__init__(latency, page_size)
+        self.collabs = []
+
+    def add_collabs(self, count):
+        '''add count collabs'''
+        start = len(self.collabs)
+        self.collabs.extend({'id': i, 'title': 'collab %d' % i}
+                            for i in range(start, start + count))
+
+    def handle(self, method, path, query, body):
+        if path.strip('/') != 'collab':
+            return 404, None
+        page_size = int(query.get('page_size', self.page_size))
+        start = int(query.get('offset', 0))
+        results = self.collabs[start:start + page_size]
+        next_url = None
+        if start + page_size < len(self.collabs):
+            next_url = '%s/collab/?page_size=%d&offset=%d' % (self.url, page_size,
+                                                              start + page_size)
+        return 200, {'results': results, 'next': next_url}
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    '''WSGI server handling each request on its own thread'''
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    '''request handler which does not log every request'''
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+
+@contextmanager
+def serve(app):
+    '''serve app on a local port while in the context, yields its url'''
+    server = make_server('127.0.0.1', 0, app, server_class=_ThreadingWSGIServer,
+                         handler_class=_QuietHandler)
+    app.url = 'http://127.0.0.1:%d' % server.server_port
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield app.url
+    finally:
+        server.shutdown()
+        server.server_close()